@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Generates synthetic speed study data and benchmarks each stage of a report on it.
+
+Usage:
+    benchmark.py [--debug] generate OUTPUT_DIRECTORY [--files=N] [--vehicles=N] [--seed=SEED]
+                 [--invalid-rate=RATE]
+    benchmark.py [--debug] run INPUT_DIRECTORY [--interval=INTERVAL] [--jobs=N] [--label=LABEL]
+                 [--results=FILE]
+    benchmark.py compare [--results=FILE]
+    benchmark.py (-h | --help)
+
+Options:
+    -h --help            Show this screen
+    --debug              Log in debug level
+    --files=N            Number of files to generate [default: 10]
+    --vehicles=N         Total number of vehicle entries to generate [default: 1000]
+    --seed=SEED          Random seed, the same seed always generates the same data [default: 0]
+    --invalid-rate=RATE  Share of vehicle entries that are invalid [default: 0.01]
+    --interval=INTERVAL  Sampling interval in minutes [default: 15]
+    --jobs=N             Number of processes used to read the input files [default: 1]
+    --label=LABEL        A label to record with the results, e.g. a branch name [default: ]
+    --results=FILE       File the results are appended to [default: reports/benchmarks.jsonl]
+
+The generate command writes files in the spreadsheet export layout that
+speeders.py reads, with 10k files and 10M vehicles being a production scale
+study.
+
+The run command times each stage of the default report (parse, bucket,
+compute, group, filter and output) and records the wall time, CPU time and
+memory use of each as a line of JSON in the results FILE.
+
+The compare command prints how the latest run differs from the one before it.
+"""
+import datetime
+import json
+import logging
+import os
+import time
+from docopt import docopt
+from toofast.analyse_data import bucket_data, compute_statistics, group_statistics, filter_statistics
+from toofast.metrics import StageMetrics
+from toofast.output_statistics import output_csv
+from toofast.parse_input import read_data_table
+from toofast.synthetic import generate_study
+
+
+def run_benchmark(input_dir, delta, jobs):
+    '''Runs each stage of the default report under measurement and returns the metrics'''
+    metrics = StageMetrics()
+    with metrics.stage("parse"):
+        data = read_data_table(input_dir, jobs=jobs, counters=metrics.counters)
+    with metrics.stage("bucket"):
+        buckets = bucket_data(data, delta)
+    with metrics.stage("compute"):
+        stats = compute_statistics(buckets)
+    with metrics.stage("group"):
+        grouped_stats = group_statistics(stats)
+    with metrics.stage("filter"):
+        final_stats = filter_statistics(grouped_stats, min_count=0)
+    with metrics.stage("output"):
+        with open(os.devnull, 'wb') as devnull:
+            output_csv(devnull, final_stats)
+    result = metrics.as_dict()
+    result.update({"files": len(data.sessions), "vehicles": len(data), "buckets": len(buckets)})
+    return result
+
+
+def read_results(filename):
+    '''Returns all the results recorded in a results file'''
+    with open(filename) as results:
+        return [json.loads(line) for line in results if line.strip()]
+
+
+def print_run(result):
+    '''Prints one run's stage results as a table'''
+    print "{label} {when} {vehicles} vehicles in {files} files".format(**result)
+    print "{:<10}{:>10}{:>10}{:>14}".format("stage", "wall s", "cpu s", "peak MB +")
+    for stage in result["stages"]:
+        print "{:<10}{:>10.3f}{:>10.3f}{:>14.1f}".format(
+            stage["name"], stage["wall"], stage["cpu"], stage["peak_rss_growth"] / 1048576.0)
+
+
+def print_comparison(before, after):
+    '''Prints how each stage's wall time changed between two runs'''
+    print "{:<10}{:>10}{:>10}{:>10}".format("stage", "before s", "after s", "change")
+    before_stages = {stage["name"]: stage for stage in before["stages"]}
+    for stage in after["stages"]:
+        old = before_stages.get(stage["name"])
+        if not old:
+            continue
+        change = (stage["wall"] - old["wall"]) / old["wall"] * 100 if old["wall"] else 0.0
+        print "{:<10}{:>10.3f}{:>10.3f}{:>+9.1f}%".format(stage["name"], old["wall"], stage["wall"], change)
+
+
+def main():
+    '''Generates data, runs benchmarks or compares benchmark results'''
+    args = docopt(__doc__)
+    logging.basicConfig(level=logging.DEBUG if args["--debug"] else logging.WARNING)
+
+    if args["generate"]:
+        valid = generate_study(args["OUTPUT_DIRECTORY"], files=int(args["--files"]),
+                               vehicles=int(args["--vehicles"]), seed=int(args["--seed"]),
+                               invalid_rate=float(args["--invalid-rate"]))
+        print "Wrote {} valid vehicles to {}".format(valid, args["OUTPUT_DIRECTORY"])
+    elif args["run"]:
+        delta = datetime.timedelta(minutes=int(args["--interval"])).seconds
+        result = run_benchmark(args["INPUT_DIRECTORY"], delta, int(args["--jobs"]))
+        result.update({
+            "label": args["--label"],
+            "when": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "input": args["INPUT_DIRECTORY"],
+            "interval": int(args["--interval"]),
+            "jobs": int(args["--jobs"])})
+        results_dir = os.path.dirname(args["--results"])
+        if results_dir and not os.path.isdir(results_dir):
+            os.makedirs(results_dir)
+        with open(args["--results"], 'a') as results:
+            results.write(json.dumps(result, sort_keys=True) + "\n")
+        print_run(result)
+    else:
+        results = read_results(args["--results"])
+        if len(results) < 2:
+            print "Need at least two runs in {} to compare".format(args["--results"])
+            return
+        print_run(results[-2])
+        print_run(results[-1])
+        print_comparison(results[-2], results[-1])
+
+
+if __name__ == "__main__":
+    main()
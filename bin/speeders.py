@@ -3,33 +3,201 @@
 Imports speed study data and outputs a report based on that data.
 
 Usage:
-    speeders.py [--debug] INPUT_DIRECTORY [--interval=INTERVAL] [--detail] [--min-count=MIN]
+    speeders.py [--debug] compile INPUT_DIRECTORY DATASET [--jobs=N] [--rejects=FILE] [--log-limit=N]
+               [--meta=HEADERS]
+    speeders.py [--debug] INPUT_DIRECTORY [--interval=INTERVAL] [--detail] [--min-count=MIN] [--jobs=N]
+               [--stream | --engine=ENGINE] [--state=FILE] [--output=FILE] [--format=FORMAT] [--group-by=KEYS]
+               [--metrics=FILE [--profile]] [--rejects=FILE] [--log-limit=N] [--watch [--poll=SECONDS]]
+               [--meta=HEADERS] [--from=DATE] [--to=DATE] [--location=LOCATION] [--direction=DIRECTION]
+               [--slide=MINUTES] [--columns=COLUMNS]
+    speeders.py [--debug] merge STATE... [--detail] [--min-count=MIN] [--state=FILE] [--output=FILE]
+               [--format=FORMAT] [--metrics=FILE [--profile]] [--columns=COLUMNS]
+    speeders.py [--debug] compare BEFORE_DIR AFTER_DIR [--interval=INTERVAL] [--min-count=MIN] [--jobs=N]
+               [--stream | --engine=ENGINE] [--output=FILE] [--format=FORMAT] [--group-by=KEYS]
+               [--columns=COLUMNS] [--metrics=FILE [--profile]] [--rejects=FILE] [--log-limit=N]
+               [--meta=HEADERS]
+    speeders.py [--debug] run PLAN [--jobs=N] [--engine=ENGINE] [--metrics=FILE [--profile]] [--rejects=FILE]
+               [--log-limit=N] [--meta=HEADERS]
+    speeders.py [--debug] serve INPUT_DIRECTORY [--port=PORT] [--jobs=N] [--cache-size=MB] [--meta=HEADERS]
     speeders.py (-h | --help)
 
 Options:
     -h --help            Show this screen
     --debug              Log in debug level
-    --interval=INTERVAL  Sampling interval in minutes [default: 15]
+    --interval=INTERVAL  Sampling interval in minutes, or a comma separated list of them [default: 15]
+    --slide=MINUTES      Start an interval long window every MINUTES minutes rather than back to back
     --min-count=MIN      Minumum number of data points to require before we compute statistics [default: 0]
     --detail             Request speed detail report instead of aggregate statistics
+    --columns=COLUMNS    Only compute and report these comma separated statistics, e.g. count,85%,%legal
+    --jobs=N             Number of processes used to read the input files and compute partitions [default: 1]
+    --stream             Stream vehicles straight into per bucket histograms to bound memory use
+    --engine=ENGINE      Statistics engine to use, python or numpy [default: python]
+    --state=FILE         Also write the partial aggregate state of the report to FILE
+    --output=FILE        Write the report to FILE rather than the standard output
+    --format=FORMAT      Report format, csv, jsonl or columnar [default: csv]
+    --group-by=KEYS      Report on each combination of these comma separated file headers separately
+    --metrics=FILE       Write the time, memory use and counts of each stage to FILE as JSON
+    --profile            Also profile each stage, writing the profiles next to the metrics FILE
+    --rejects=FILE       Write every rejected vehicle entry to FILE, as JSON lines if it ends in .jsonl
+    --log-limit=N        Number of rejected vehicle entries to log individually [default: 10]
+    --meta=HEADERS       File headers for counter exports without a sidecar, e.g. speed_limit=25
+    --from=DATE          Only report on data from this date on, e.g. 8/10/2016
+    --to=DATE            Only report on data up to and including this date
+    --location=LOCATION  Only report on data files with this location
+    --direction=DIRECTION  Only report on data files with this direction
+    --watch              Keep watching INPUT_DIRECTORY and rewrite the --output FILE whenever it changes
+    --poll=SECONDS       How often to check a watched directory for changes [default: 5]
+    --port=PORT          Port the report server listens on [default: 8015]
+    --cache-size=MB      Megabytes of reports the report server caches [default: 64]
 
 The default statistics report is broken down into interval spaced time periods
 and data from all days in the input data is combined inteligently to produce
 the report.
 
+Streaming produces the same report as the default, but never holds all
+of the vehicles in memory at once. Use it for very large inputs.
+
+The numpy engine produces the same report as the default python engine but
+computes the statistics for every interval at once. It requires numpy.
+
+The compile command parses a directory once into a binary DATASET file. The
+DATASET can then be given in place of the INPUT_DIRECTORY to produce reports
+without parsing any CSV. Compiling again into an existing DATASET only parses
+the files that have changed since it was last compiled.
+
+A state FILE holds the speed histogram for each time of day rather than any raw
+data. The merge command combines any number of STATE files made with the same
+interval and produces the report for all of their data together, and can write
+the merged state again so that merges can be done in stages.
+
+Several intervals such as --interval 5,15,30,60 produce one report for each
+interval from a single pass over the data. The data is bucketed once at the
+finest resolution and the longer intervals are rolled up from those buckets.
+Each report is written to its own --output FILE, and every {interval} in the
+FILE is replaced by that report's interval in minutes. The same applies to
+the --state FILE.
+
+Sliding windows, for example --interval 15 --slide 1, report on a 15 minute
+window starting every minute so that peaks are not split across interval
+boundaries. Each window is labelled with its start time. Only windows wholly
+covered by the observations are reported, so none starts before a session's
+first vehicles or ends after its last, and a session shorter than the interval
+has none. The data is bucketed by
+the slide and each window is updated as it slides by adding the minutes coming
+into it and taking out the minutes leaving it. The slide must divide every
+interval.
+
+Grouping by file headers, for example --group-by location,direction, reports
+each street and direction of a study separately from one read of the input.
+Each partition is bucketed and computed on its own, in parallel given --jobs,
+and every report row starts with the values of the KEYS it belongs to. Any of
+name, date, location, direction, weather and speed_limit can be used. Grouping
+can't be combined with --state or --watch.
+
+The metrics FILE records the wall time, CPU time and peak memory of each stage
+of the run along with counts of the files, bytes and rows read, the vehicles
+accepted and rejected by reason, and the buckets computed and filtered out.
+Profiling writes a cProfile dump of each stage to FILE.STAGE.prof.
+
+Vehicle entries that can't be used, e.g. mistyped speeds, are rejected. Each
+file with rejected entries gets a summary log line of its counts by reason and
+only the first few entries are logged individually. A rejects FILE lists every
+rejected entry with its file, line number, cells and reason, as CSV unless
+FILE ends in .jsonl.
+
+The --from, --to, --location and --direction filters restrict the report to
+the data files whose file headers match, without copying them anywhere. Only
+the header block of each file is read to decide, so the vehicles of files that
+don't match are never parsed. Counter exports have no date of their own, so
+they are read whenever their other headers match and the vehicles outside the
+dates are dropped. A compiled DATASET is filtered by the file headers it holds.
+Filters can't be combined with --watch.
+
+Watching reads the INPUT_DIRECTORY and writes the report, then keeps checking
+the directory for new, modified or deleted files. Only the files that changed
+are read again, the vehicles of modified or deleted files are taken back out of
+the statistics, and the --output FILE is replaced with the new report. Watching
+runs until it is interrupted.
+
+The run command produces every report listed in a JSON PLAN file from a single
+read of the plan's input, for example
+
+    {"input": "sample_data", "reports": [
+        {"interval": 15, "output": "output_15.csv"},
+        {"interval": 60, "min_count": 10, "detail": true, "output": "detail_60.csv"},
+        {"interval": 30, "filters": {"direction": "North"}, "output": "north_30.jsonl", "format": "jsonl"}]}
+
+Each report can set interval, min_count, detail, format, group_by and columns
+like the options above, and filters that only keep the vehicles whose file
+headers have the given values. Reports with the same filters and grouping share
+a single bucketing of the data.
+
+Besides the hand entered sheets, the input can hold flat exports from
+automated counters, with a timestamp,speed[,lane] header row and one vehicle
+per row. These have no file headers of their own, so each takes its location,
+direction, speed limit and so on from a JSON sidecar named like the export plus
+.meta.json, e.g. {"location": "Main St", "direction": "North", "speed_limit": 25},
+or else from the --meta HEADERS.
+
+The compare command evaluates a change such as traffic calming by comparing the
+data in AFTER_DIR with the data in BEFORE_DIR, either of which can be a
+compiled DATASET. For each time of day it reports each statistic before, after
+and the change from before to after, e.g. 85%_before, 85%_after and 85%_change,
+then two tests of whether the speeds after differ from the speeds before. These
+are the Mann-Whitney U test as mann_whitney_z, negative when speeds went down,
+and mann_whitney_p, and the Kolmogorov-Smirnov test as ks_d and ks_p. Grouping
+compares each partition with the same partition before.
+
+The serve command reads the INPUT_DIRECTORY, or a compiled DATASET, once and
+answers report requests from this machine over HTTP, for example
+
+    curl 'http://localhost:8015/report?interval=30&min_count=5&detail=0'
+
+returns the report as JSON. Reports are cached, and the input is read again
+whenever its files change.
+
+The statistics report has the columns %legal, 50%, 85%, 99%, count,
+count_legal, diff, limit, max, mean and min. Asking for just some of them
+with --columns only computes those, so e.g. --columns count never sorts any
+speeds. Statistics are computed for the final report rows only, every earlier
+stage just keeps the speed histogram, count, legal count and speed limit of
+each bucket.
+
 If you request a detailed report a breakdown of speeds recorded for each time period
 is produced instead of the default statistics report report.
 
-Output is in the form of a CSV file sent to the standard output.
+Output is in the form of a CSV file sent to the standard output unless
+an --output FILE is given. The jsonl format writes one JSON object per time
+period instead, and the columnar format is a compact binary file of float64
+columns that toofast.output_statistics.read_columnar_report reads.
 """
 import logging
 import datetime
+import os
 import sys
+from collections import OrderedDict
 from docopt import docopt
-from toofast.parse_input import read_data_directory
-from toofast.output_statistics import output_csv
+from toofast.aggregate_state import (
+    statistics_state, state_statistics, merge_states, read_state, write_state)
+from toofast.dataset import compile_dataset, is_dataset, load_dataset, stale_files
+from toofast.metrics import StageMetrics
+from toofast.rejects import RejectSink
+from toofast.report_server import ReportServer, make_server
+from toofast.watch import watch_statistics
+from toofast.partition import parse_group_by, partition_table, partition_statistics
+from toofast.plan import read_filters, read_plan, plan_statistics
+from toofast.compare import align_reports, compare_partitions, comparison_columns
+from toofast.file_filter import FileFilter
+from toofast.parse_input import read_data_table, iter_data_directory
+from toofast.flat_input import parse_metadata
+from toofast.output_files import atomic_output
+from toofast.output_statistics import output_partitions, report_statistics, report_writer
 from toofast.analyse_data import (
-    bucket_data, compute_statistics, group_statistics, filter_statistics, count_speeds)
+    bucket_data, compute_statistics, stream_statistics, stream_partition_statistics,
+    group_statistics,
+    finest_interval, parse_columns, rollup_intervals, sliding_intervals,
+    STATISTICS_COLUMNS)
+from toofast.numpy_statistics import vectorized_statistics
 
 
 def init_logging(level):
@@ -42,31 +210,318 @@ def init_logging(level):
     logging.getLogger('').addHandler(handler)
 
 
+def read_input(input_path, jobs, metrics, rejects, metadata=None, file_filter=None):
+    '''Reads a directory of CSV files or a compiled dataset into a VehicleTable, filtered by any FileFilter'''
+    if is_dataset(input_path):
+        metadata, table = load_dataset(input_path)
+        stale = stale_files(metadata, input_path)
+        if stale:
+            logging.warning("%s is out of date, %d source files changed since it was compiled",
+                            input_path, len(stale))
+        metrics.counters.update({"files_read": 1, "bytes_read": os.path.getsize(input_path),
+                                 "vehicles_accepted": len(table)})
+        return file_filter.filter_table(table) if file_filter else table
+    return read_data_table(input_path, jobs=jobs, counters=metrics.counters, rejects=rejects,
+                           metadata=metadata, file_filter=file_filter)
+
+
+def input_metadata(args):
+    '''Returns the file headers given with --meta for files without their own, or None'''
+    return parse_metadata(args["--meta"]) if args["--meta"] else None
+
+
+def input_filter(args):
+    '''Returns the FileFilter of --from, --to, --location and --direction, or None if none are given'''
+    headers = read_filters({key: args["--" + key] for key in ["location", "direction"] if args["--" + key]})
+    file_filter = FileFilter(args["--from"], args["--to"], headers)
+    return file_filter if file_filter else None
+
+
+def read_intervals(args):
+    '''Returns the requested intervals in seconds, checking that each has somewhere to go'''
+    intervals = [datetime.timedelta(minutes=int(interval)).seconds
+                 for interval in (args["--interval"] or "15").split(",")]
+    if len(intervals) > 1:
+        if "{interval}" not in (args["--output"] or ""):
+            sys.exit("Several intervals need an --output FILE containing {interval}")
+        if args["--state"] and "{interval}" not in args["--state"]:
+            sys.exit("Several intervals need a --state FILE containing {interval}")
+    return intervals
+
+
+def read_slide(args, intervals):
+    '''Returns how far apart in seconds sliding windows start, or None if intervals are back to back'''
+    if not args["--slide"]:
+        return None
+    slide = datetime.timedelta(minutes=int(args["--slide"])).seconds
+    if not slide or any(interval % slide for interval in intervals):
+        sys.exit("--slide must be a whole number of minutes that divides every interval")
+    return slide
+
+
+def read_statistics(args, delta, metrics, rejects):
+    '''Reads the input and computes the statistics for delta second long intervals'''
+    jobs = int(args["--jobs"] or 1)
+    if args["--stream"] and not is_dataset(args["INPUT_DIRECTORY"]):
+        logging.debug("streaming data into statistics")
+        with metrics.stage("stream"):
+            vehicles = iter_data_directory(
+                args["INPUT_DIRECTORY"], jobs=jobs, counters=metrics.counters, rejects=rejects,
+                metadata=input_metadata(args), file_filter=input_filter(args))
+            return stream_statistics(vehicles, delta, columns=())
+    elif args["--stream"]:
+        logging.debug("streaming dataset into statistics")
+        with metrics.stage("stream"):
+            data = read_input(args["INPUT_DIRECTORY"], jobs, metrics, rejects, file_filter=input_filter(args))
+            return stream_statistics(iter(data), delta, columns=())
+
+    logging.debug("reading in data")
+    with metrics.stage("parse"):
+        data = read_input(args["INPUT_DIRECTORY"], jobs, metrics, rejects, input_metadata(args),
+                          input_filter(args))
+    if args["--engine"] == "numpy":
+        logging.debug("computing vectorized statistics")
+        with metrics.stage("compute"):
+            return vectorized_statistics(data, delta, columns=())
+
+    logging.debug("bucketing data")
+    with metrics.stage("bucket"):
+        buckets = bucket_data(data, delta)
+    logging.debug("computing statistics")
+    with metrics.stage("compute"):
+        return compute_statistics(buckets, columns=())
+
+
+def read_partitioned_statistics(args, keys, delta, metrics, rejects):
+    '''
+    Reads the input and computes the statistics for delta second long intervals of
+    each partition by the file header keys, returning them in an OrderedDict
+    '''
+    jobs = int(args["--jobs"] or 1)
+    if args["--stream"]:
+        logging.debug("streaming data into partitioned statistics")
+        with metrics.stage("stream"):
+            if is_dataset(args["INPUT_DIRECTORY"]):
+                vehicles = iter(read_input(args["INPUT_DIRECTORY"], jobs, metrics, rejects,
+                                           file_filter=input_filter(args)))
+            else:
+                vehicles = iter_data_directory(
+                    args["INPUT_DIRECTORY"], jobs=jobs, counters=metrics.counters, rejects=rejects,
+                    metadata=input_metadata(args), file_filter=input_filter(args))
+            partitioned_stats = stream_partition_statistics(vehicles, delta, keys, columns=())
+            partitioned_stats = OrderedDict(sorted(partitioned_stats.iteritems()))
+    else:
+        logging.debug("reading in data")
+        with metrics.stage("parse"):
+            data = read_input(args["INPUT_DIRECTORY"], jobs, metrics, rejects, input_metadata(args),
+                              input_filter(args))
+        logging.debug("partitioning data")
+        with metrics.stage("partition"):
+            partitions = partition_table(data, keys)
+        logging.debug("computing partitioned statistics")
+        with metrics.stage("compute"):
+            partitioned_stats = partition_statistics(partitions, delta, args["--engine"] or "python", jobs,
+                                                     columns=())
+    metrics.counters["partitions"] += len(partitioned_stats)
+    return partitioned_stats
+
+
+def read_grouped_statistics(args, metrics, rejects):
+    '''
+    Yields the interval, an OrderedDict of the statistics grouped by time of day for
+    each partition and the partitions' partial aggregate states for each report requested
+
+    Unless the report is grouped by some file headers there is one partition, ().
+    '''
+    if args["merge"]:
+        logging.debug("merging states")
+        with metrics.stage("merge"):
+            state = merge_states([read_state(filename) for filename in args["STATE"]])
+            grouped_stats = state_statistics(state)
+        metrics.counters.update({"files_read": len(args["STATE"]),
+                                 "bytes_read": sum(os.path.getsize(name) for name in args["STATE"])})
+        yield state["interval"], {(): grouped_stats}, {(): state}
+        return
+
+    intervals = read_intervals(args)
+    slide = read_slide(args, intervals)
+    step = slide or finest_interval(intervals)
+    if args["--watch"]:
+        watching = watch_statistics(args["INPUT_DIRECTORY"], step, rejects,
+                                    poll_interval=float(args["--poll"] or 5), metadata=input_metadata(args))
+        for stats in watching:
+            for report in group_reports({(): stats}, intervals, metrics, slide):
+                yield report
+        return
+
+    if args["--group-by"]:
+        partitioned_stats = read_partitioned_statistics(
+            args, parse_group_by(args["--group-by"]), step, metrics, rejects)
+    else:
+        partitioned_stats = {(): read_statistics(args, step, metrics, rejects)}
+    for report in group_reports(partitioned_stats, intervals, metrics, slide):
+        yield report
+
+
+def group_reports(partitioned_stats, intervals, metrics, slide=None):
+    '''
+    Yields the interval, the statistics grouped by time of day and their partial
+    aggregate states for each of the intervals given an OrderedDict of statistics
+    for the finest of them for each partition
+
+    Given a slide, the statistics must be for slide long buckets and the intervals
+    are windows starting every slide seconds instead.
+    '''
+    def rollup(stats):
+        '''Returns the statistics of one partition for each interval'''
+        if not stats:
+            return {delta: {} for delta in intervals}
+        if slide:
+            return sliding_intervals(stats, intervals, slide, columns=())
+        return rollup_intervals(stats, intervals, columns=())
+
+    metrics.counters["buckets"] += sum(len(stats) for stats in partitioned_stats.itervalues())
+    logging.debug("rolling up statistics")
+    with metrics.stage("rollup"):
+        interval_stats = OrderedDict((keys, rollup(stats)) for keys, stats in partitioned_stats.iteritems())
+    for delta in intervals:
+        logging.debug("grouping statistics")
+        with metrics.stage("group"):
+            grouped_stats = OrderedDict((keys, group_statistics(stats[delta], ()))
+                                        for keys, stats in interval_stats.iteritems())
+            states = OrderedDict((keys, statistics_state(stats, delta))
+                                 for keys, stats in grouped_stats.iteritems())
+        yield delta, grouped_stats, states
+
+
+def write_report(output_file, grouped_stats, metrics, min_count=0, detail=False, report_format="csv",
+                 key_columns=(), columns=None):
+    '''
+    Filters the grouped statistics of each partition and writes the requested report
+    as report_statistics computes it
+    '''
+    logging.debug("computing report rows")
+    final_stats, columns = report_statistics(grouped_stats, metrics, min_count=min_count, detail=detail,
+                                             columns=columns)
+
+    logging.debug("outputing statistics")
+    with metrics.stage("output"):
+        output_partitions(report_writer(report_format, output_file, columns, key_columns), final_stats)
+
+
+def write_reports(args, metrics, rejects):
+    '''Writes the report and aggregate state for each interval requested on the command line'''
+    report = {"min_count": int(args["--min-count"] or 0), "detail": args["--detail"],
+              "report_format": args["--format"] or "csv",
+              "key_columns": parse_group_by(args["--group-by"]) if args["--group-by"] else [],
+              "columns": parse_columns(args["--columns"]) if args["--columns"] else None}
+    for delta, grouped_stats, states in read_grouped_statistics(args, metrics, rejects):
+        minutes = str(delta // 60)
+        if args["--state"]:
+            logging.debug("writing state")
+            with metrics.stage("state"):
+                write_state(args["--state"].replace("{interval}", minutes), states[()])
+        if args["--output"]:
+            with atomic_output(args["--output"].replace("{interval}", minutes)) as output_file:
+                write_report(output_file, grouped_stats, metrics, **report)
+        else:
+            write_report(sys.stdout, grouped_stats, metrics, **report)
+
+
+def read_compared_reports(args, input_path, keys, intervals, metrics, rejects):
+    '''Returns the (interval, grouped statistics, states) reports of one side of a comparison'''
+    input_args = dict(args, INPUT_DIRECTORY=input_path)
+    block_duration = finest_interval(intervals)
+    if keys:
+        partitioned_stats = read_partitioned_statistics(input_args, keys, block_duration, metrics, rejects)
+    else:
+        partitioned_stats = {(): read_statistics(input_args, block_duration, metrics, rejects)}
+    return list(group_reports(partitioned_stats, intervals, metrics))
+
+
+def compare_reports(args, metrics, rejects):
+    '''Writes the comparison of AFTER_DIR with BEFORE_DIR for each interval requested on the command line'''
+    intervals = read_intervals(args)
+    keys = parse_group_by(args["--group-by"]) if args["--group-by"] else []
+    columns = parse_columns(args["--columns"]) if args["--columns"] else STATISTICS_COLUMNS
+    before, after = [read_compared_reports(args, input_path, keys, intervals, metrics, rejects)
+                     for input_path in [args["BEFORE_DIR"], args["AFTER_DIR"]]]
+    for delta, before_stats, after_stats in align_reports(before, after):
+        logging.debug("comparing statistics")
+        with metrics.stage("compare"):
+            compared = compare_partitions(before_stats, after_stats, columns, int(args["--min-count"] or 0))
+        logging.debug("outputing comparison")
+        with metrics.stage("output"):
+            if args["--output"]:
+                with atomic_output(args["--output"].replace("{interval}", str(delta // 60))) as output_file:
+                    output_partitions(report_writer(args["--format"] or "csv", output_file,
+                                                    comparison_columns(columns), keys), compared)
+            else:
+                output_partitions(report_writer(args["--format"] or "csv", sys.stdout,
+                                                comparison_columns(columns), keys), compared)
+
+
+def run_plan(args, metrics, rejects):
+    '''Reads the input of a plan once and writes every report in it'''
+    input_path, reports = read_plan(args["PLAN"])
+    logging.debug("reading in data")
+    with metrics.stage("parse"):
+        data = read_input(input_path, int(args["--jobs"] or 1), metrics, rejects, input_metadata(args))
+    logging.debug("computing statistics for %d reports", len(reports))
+    with metrics.stage("compute"):
+        report_stats = plan_statistics(data, reports, args["--engine"] or "python", int(args["--jobs"] or 1))
+    for report, grouped_stats in zip(reports, report_stats):
+        with atomic_output(report["output"]) as output_file:
+            write_report(output_file, grouped_stats, metrics, min_count=report["min_count"],
+                         detail=report["detail"], report_format=report["format"], key_columns=report["keys"],
+                         columns=report["columns"])
+
+
 def main():
     '''Reads a directory of speed data and outputs relevant statistics'''
     args = docopt(__doc__)
     init_logging(logging.DEBUG if args["--debug"] else logging.INFO)
 
-    logging.debug("reading in data")
-    data = read_data_directory(args["INPUT_DIRECTORY"])
+    if args["serve"]:
+        reports = ReportServer(args["INPUT_DIRECTORY"], jobs=int(args["--jobs"] or 1),
+                               cache_bytes=int(args["--cache-size"] or 64) << 20,
+                               metadata=input_metadata(args))
+        server = make_server(reports, port=int(args["--port"] or 8015))
+        logging.info("Serving reports on http://localhost:%d/report", server.server_port)
+        server.serve_forever()
+        return
 
-    logging.debug("bucketing data")
-    delta = datetime.timedelta(minutes=int(args["--interval"] or 15)).seconds
-    buckets = bucket_data(data, delta)
+    if args["--watch"] and not args["--output"]:
+        sys.exit("Watching needs an --output FILE to rewrite")
+    if args["--group-by"] and (args["--state"] or args["--watch"]):
+        sys.exit("--group-by can't be combined with --state or --watch")
+    if args["--columns"] and args["--detail"]:
+        sys.exit("--columns can't be combined with --detail")
+    if args["--watch"] and input_filter(args):
+        sys.exit("--from, --to, --location and --direction can't be combined with --watch")
 
-    logging.debug("computing statistics")
-    stats = compute_statistics(buckets)
-    logging.debug("grouping statistics")
-    grouped_stats = group_statistics(stats)
-    logging.debug("filtering statistics")
-    final_stats = filter_statistics(grouped_stats, min_count=int(args.get("--min-count") or 0))
+    rejects = RejectSink(args["--rejects"], log_limit=int(args["--log-limit"] or 10))
+    if args["compile"]:
+        logging.debug("compiling data")
+        with rejects:
+            compile_dataset(args["INPUT_DIRECTORY"], args["DATASET"], jobs=int(args["--jobs"] or 1),
+                            rejects=rejects, metadata=input_metadata(args))
+        logging.debug("done")
+        return
 
-    if args["--detail"]:
-        final_stats = {key: count_speeds(stats["_speeds"])
-                       for key, stats in final_stats.iteritems()}
+    metrics = StageMetrics(profile=args["--profile"])
+    with rejects:
+        if args["run"]:
+            run_plan(args, metrics, rejects)
+        elif args["compare"]:
+            compare_reports(args, metrics, rejects)
+        else:
+            write_reports(args, metrics, rejects)
 
-    logging.debug("outputing statistics")
-    output_csv(sys.stdout, final_stats)
+    if args["--metrics"]:
+        logging.debug("writing metrics")
+        metrics.write(args["--metrics"])
+        metrics.write_profiles(args["--metrics"])
     logging.debug("done")
 
 
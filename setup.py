@@ -58,6 +58,7 @@ setup(name='toofast',
     ],
     package_data={ "toofast": [] },
     install_requires=get_requirements(),
+    extras_require={"numpy": ["numpy>=1.9"]},
     test_suite = 'nose.collector',
     entry_points="""
         [paste.app_factory]
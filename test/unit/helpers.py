@@ -0,0 +1,50 @@
+"""Speed study sheets and vehicle tables shared by the unit tests"""
+from toofast.parse_time import to_epoch
+from toofast.vehicle_table import VehicleTable
+
+SHEET = """,,,,
+,Name[s],Tester,,
+,Date,{date},,
+,Location,{location},,
+,Direction,{direction},,
+,Weather,Sunny,,
+,Speed Limit,{speed_limit},,
+,,,,
+,Vehicle,Time,Speed,
+{rows}
+"""
+
+
+def sheet_text(rows, date="8/10/2015", location="Rogers Ave & Midwood St", direction="North", speed_limit=25):
+    """Returns a sheet of (vehicle, time, speed) rows with the given file headers"""
+    return SHEET.format(date=date, location=location, direction=direction, speed_limit=speed_limit,
+                        rows="\n".join(",{},{},{},".format(*row) for row in rows))
+
+
+def write_sheet(filename, rows, **headers):
+    """Writes a sheet of (vehicle, time, speed) rows, taking its file headers as sheet_text does"""
+    with open(filename, "w") as sheet:
+        sheet.write(sheet_text(rows, **headers))
+
+
+def make_table(sessions, minutes_apart=7, date="1/1/2016"):
+    """
+    Returns a VehicleTable of (direction, speed limit, speeds) sessions on Main St
+
+    Each session's vehicles pass minutes_apart minutes apart from 5:00 on the date,
+    wrapping around within the hour.
+    """
+    table = VehicleTable()
+    for direction, speed_limit, speeds in sessions:
+        session = table.add_session(
+            {"location": "Main St", "direction": direction, "speed limit": speed_limit, "date": date})
+        for idx, speed in enumerate(speeds):
+            minute = idx * minutes_apart % 60
+            table.add(session, speed, to_epoch(date, "5:%02d" % minute), 300 + minute)
+    return table
+
+
+def without_histograms(stats):
+    """Returns statistics without their histograms, so they can be compared by value"""
+    return {key: {name: value for name, value in stat.iteritems() if name != "_histogram"}
+            for key, stat in stats.iteritems()}
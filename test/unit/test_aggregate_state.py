@@ -0,0 +1,61 @@
+"""Tests of partial aggregate state files"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from toofast.aggregate_state import (
+    statistics_state, state_statistics, merge_states, read_state, write_state)
+from toofast.analyse_data import compute_statistics, group_statistics
+from toofast.parse_time import to_epoch
+
+
+def mock_vehicle(speed, date, when):
+    return {"speed limit": "25", "speed": str(speed), "datetime": to_epoch(date, when)}
+
+
+def make_state(vehicles):
+    return statistics_state(group_statistics(compute_statistics(
+        {to_epoch(date, when): [mock_vehicle(speed, date, when)] for speed, date, when in vehicles})), 900)
+
+
+def strip_private(stats):
+    return {when: {key: value for key, value in stat.iteritems() if key[0] != "_"}
+            for when, stat in stats.iteritems()}
+
+
+class AggregateStateTests(TestCase):
+    """Tests of partial aggregate state files"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.vehicles = [(20, "1/1/2016", "5:00"), (30, "1/2/2016", "5:00"),
+                         (25, "1/3/2016", "5:00"), (40, "1/3/2016", "6:00")]
+
+    def test_state_round_trips_statistics(self):
+        state = make_state(self.vehicles)
+        self.assertEqual(state_statistics(state)["05:00:00"]["count"], 3)
+        self.assertEqual(state_statistics(state)["05:00:00"]["85%"], 25.0)
+        self.assertEqual(state_statistics(state)["06:00:00"]["count_legal"], 0)
+
+    def test_merge_matches_combined_data(self):
+        expected = strip_private(state_statistics(make_state(self.vehicles)))
+        parts = [make_state([vehicle]) for vehicle in self.vehicles]
+        merged = merge_states(parts)
+        self.assertEqual(strip_private(state_statistics(merged)), expected)
+        nested = merge_states([merge_states(parts[:2]), merge_states(parts[2:])])
+        self.assertEqual(nested, merged)
+
+    def test_merge_different_intervals(self):
+        state = make_state(self.vehicles)
+        other = dict(state, interval=1800)
+        self.assertRaises(Exception, merge_states, [state, other])
+
+    def test_write_and_read_state(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tempdir, "state.json")
+            state = make_state(self.vehicles)
+            write_state(filename, state)
+            self.assertEqual(read_state(filename), state)
+        finally:
+            shutil.rmtree(tempdir)
@@ -1,9 +1,14 @@
 """Tests analysis of data"""
 from unittest import TestCase
 from mock import MagicMock, patch
-import timestring
+from toofast.parse_time import to_epoch
+from toofast.vehicle_table import VehicleTable
+from toofast.histogram import SpeedHistogram
 from toofast.analyse_data import (
-    bucket_data, compute_statistics, group_statistics, filter_statistics, count_speeds)
+    bucket_data, combine_stats, compute_statistics, count_speeds, evaluate_statistics, filter_statistics,
+    finest_interval, get_bucket_name, group_statistics, interval_statistics, parse_columns,
+    register_statistic, sliding_intervals, sliding_statistics, speed_statistics, statistics_columns,
+    stream_partition_statistics, stream_statistics, time_of_day_label, STATISTICS)
 
 
 def mock_vehicle(speed, datetime=None):
@@ -13,22 +18,60 @@ def mock_vehicle(speed, datetime=None):
 class AnalyseDataTests(TestCase):
     """Tests analysis of data"""
 
+    def test_bucket_data_no_data(self):
+        self.assertEqual(bucket_data([], 15 * 60), {})
+        self.assertEqual(bucket_data(VehicleTable(), 15 * 60), {})
+
     def test_bucket_data(self):
         data = [
-            mock_vehicle(20, timestring.Date("1/1/2016 05:00:00")),
-            mock_vehicle(20, timestring.Date("1/1/2016 05:01:00")),
-            mock_vehicle(20, timestring.Date("1/1/2016 05:02:00")),
-            mock_vehicle(20, timestring.Date("1/1/2016 05:14:59")),
-            mock_vehicle(30, timestring.Date("1/1/2016 05:15:00")),
-            mock_vehicle(30, timestring.Date("1/1/2016 05:16:00")),
-            mock_vehicle(30, timestring.Date("1/1/2016 05:17:00")),
-            mock_vehicle(30, timestring.Date("1/1/2016 05:29:59"))]
+            mock_vehicle(20, to_epoch("1/1/2016", "05:00")),
+            mock_vehicle(20, to_epoch("1/1/2016", "05:01")),
+            mock_vehicle(20, to_epoch("1/1/2016", "05:02")),
+            mock_vehicle(20, to_epoch("1/1/2016", "05:14") + 59),
+            mock_vehicle(30, to_epoch("1/1/2016", "05:15")),
+            mock_vehicle(30, to_epoch("1/1/2016", "05:16")),
+            mock_vehicle(30, to_epoch("1/1/2016", "05:17")),
+            mock_vehicle(30, to_epoch("1/1/2016", "05:29") + 59)]
         buckets = bucket_data(data, 15 * 60)
         self.assertEqual(len(buckets), 2)
-        bucket_a = [b for k, b in buckets.iteritems() if k.tm_hour == 5 and k.tm_min == 0][0]
+        bucket_a = buckets[to_epoch("1/1/2016", "05:00")]
         self.assertEqual(len(bucket_a), 4)
         self.assertEqual([val["speed"] for val in bucket_a], ["20", "20", "20", "20"])
 
+    def test_get_bucket_name(self):
+        min_datetime = to_epoch("1/1/2016", "05:00")
+        self.assertEqual(get_bucket_name(to_epoch("1/1/2016", "05:29") + 59, min_datetime, 15 * 60),
+                         to_epoch("1/1/2016", "05:15"))
+        self.assertEqual(time_of_day_label(to_epoch("1/2/2016", "17:45") + 30), "17:45:00")
+
+    def test_bucket_data_vehicle_table(self):
+        table = VehicleTable()
+        session = table.add_session({"speed limit": "25"})
+        for speed, when in [(20, "05:00"), (21, "05:14"), (30, "05:15"), (31, "05:29")]:
+            table.append(session, {"speed": speed, "datetime": to_epoch("1/1/2016", when), "timeofday": 0})
+        buckets = bucket_data(table, 15 * 60)
+        self.assertEqual(len(buckets), 2)
+        bucket_a = buckets[to_epoch("1/1/2016", "05:00")]
+        self.assertTrue(isinstance(bucket_a, VehicleTable))
+        self.assertEqual(list(bucket_a.speeds), [20, 21])
+        stats = compute_statistics(buckets)
+        self.assertAlmostEqual(stats[to_epoch("1/1/2016", "05:15")]["mean"], 30.5)
+        self.assertEqual(count_speeds(bucket_a), {"20-25": 2})
+
+    def test_bucket_table_with_and_without_numpy_agree(self):
+        table = VehicleTable()
+        session = table.add_session({"speed limit": "25"})
+        for idx in xrange(200):
+            when = to_epoch("1/%d/2016" % (1 + idx % 3), "5:%02d" % (idx * 7 % 60))
+            table.append(session, {"speed": 20 + idx % 17, "datetime": when, "timeofday": 0})
+        buckets = bucket_data(table, 15 * 60)
+        with patch("toofast.analyse_data.numpy", None):
+            expected = bucket_data(table, 15 * 60)
+        self.assertEqual(sorted(buckets), sorted(expected))
+        for name, bucket in buckets.iteritems():
+            self.assertEqual(bucket.speeds, expected[name].speeds)
+            self.assertEqual(bucket.datetimes, expected[name].datetimes)
+
     def test_compute_statistics(self):
         buckets = {
             "1": [mock_vehicle(30), mock_vehicle(20)],
@@ -61,12 +104,119 @@ class AnalyseDataTests(TestCase):
         self.assertAlmostEqual(stats["4"]["limit"], 25.0)
         self.assertIsNone(stats.get("5"))
 
+    def test_stream_statistics_matches_compute_statistics(self):
+        data = [
+            mock_vehicle(20, to_epoch("1/1/2016", "05:00")),
+            mock_vehicle(31, to_epoch("1/1/2016", "05:08")),
+            mock_vehicle(27, to_epoch("1/1/2016", "05:14")),
+            mock_vehicle(30, to_epoch("1/1/2016", "05:15")),
+            mock_vehicle(22, to_epoch("1/2/2016", "06:50")),
+            mock_vehicle(24, to_epoch("1/2/2016", "06:51"))]
+        for interval in [15 * 60, 7 * 60, 120 * 60]:
+            expected = compute_statistics(bucket_data(data, interval))
+            stats = stream_statistics(iter(data), interval)
+            self.assertEqual(sorted(stats.keys()), sorted(expected.keys()))
+            for name, stat in stats.iteritems():
+                self.assertEqual(stat.pop("_histogram").counts, expected[name].pop("_histogram").counts)
+                self.assertEqual(stat, expected[name])
+
+    def test_stream_partition_statistics(self):
+        data = [dict(mock_vehicle(20 + idx, to_epoch("1/1/2016", "05:%02d" % idx)), direction=direction)
+                for idx in xrange(20) for direction in ["North", "South"] if idx % 3 or direction == "North"]
+        partitions = stream_partition_statistics(iter(data), 15 * 60, ["direction"])
+        self.assertEqual(sorted(partitions), [("North",), ("South",)])
+        for (direction,), stats in partitions.iteritems():
+            vehicles = [val for val in data if val["direction"] == direction]
+            expected = stream_statistics(iter(vehicles), 15 * 60)
+            self.assertEqual(sorted(stats), sorted(expected))
+            self.assertEqual(stats[min(stats)]["count"], expected[min(expected)]["count"])
+        self.assertEqual(partitions[("South",)][min(partitions[("South",)])]["count"], 10)
+
+    def test_finest_interval(self):
+        self.assertEqual(finest_interval([5 * 60, 15 * 60, 30 * 60]), 5 * 60)
+        self.assertEqual(finest_interval([15 * 60, 20 * 60]), 5 * 60)
+
+    def test_interval_statistics_matches_compute_statistics(self):
+        data = [mock_vehicle(20 + idx % 13, to_epoch("1/%d/2016" % (1 + idx % 2), "5:%02d" % idx))
+                for idx in xrange(60)]
+        intervals = [5 * 60, 15 * 60, 30 * 60, 60 * 60]
+        interval_stats = interval_statistics(data, intervals)
+        self.assertEqual(sorted(interval_stats.keys()), intervals)
+        for interval in intervals:
+            expected = compute_statistics(bucket_data(data, interval))
+            stats = interval_stats[interval]
+            self.assertEqual(sorted(stats.keys()), sorted(expected.keys()))
+            for name, stat in stats.iteritems():
+                self.assertEqual(stat.pop("_histogram").counts, expected[name].pop("_histogram").counts)
+                self.assertEqual(stat, expected[name])
+
+    def test_sliding_statistics_match_each_window_alone(self):
+        times = [to_epoch("1/1/2016", "5:%02d" % minute) for minute in [3, 4, 4, 9, 17, 18, 40, 41, 59]]
+        data = [mock_vehicle(20 + idx * 3, data_time) for idx, data_time in enumerate(times)]
+        windows = sliding_statistics(compute_statistics(bucket_data(data, 60)), 15 * 60, 5 * 60)
+        expected = {}
+        for start in [to_epoch("1/1/2016", time_text) for time_text in ["5:00", "5:05", "5:40", "5:45"]]:
+            window = [vehicle for vehicle in data if start <= vehicle["datetime"] < start + 15 * 60]
+            expected[start] = compute_statistics({start: window})[start]
+        self.assertEqual(sorted(windows), sorted(expected))
+        for name, stat in windows.iteritems():
+            self.assertEqual(stat.pop("_histogram").counts, expected[name].pop("_histogram").counts)
+            self.assertEqual(stat, expected[name])
+
+    def test_sliding_windows_stay_within_the_observations(self):
+        data = [mock_vehicle(25, to_epoch(date, "5:%02d" % minute))
+                for date in ["1/1/2016", "1/2/2016"] for minute in xrange(0, 60, 3)]
+        windows = sliding_statistics(compute_statistics(bucket_data(data, 60)), 15 * 60, 60)
+        for date in ["1/1/2016", "1/2/2016"]:
+            starts = [start for start in windows if to_epoch(date, "0:00") <= start < to_epoch(date, "23:59")]
+            self.assertEqual(min(starts), to_epoch(date, "5:00"))
+            self.assertEqual(max(starts), to_epoch(date, "5:43"))
+            self.assertEqual(len(starts), 44)
+        self.assertTrue(all(stat["count"] == 5 for stat in windows.itervalues()))
+        self.assertEqual(sliding_statistics(compute_statistics(bucket_data(data[:4], 60)), 15 * 60, 60), {})
+
+    def test_sliding_intervals_without_overlap_are_tumbling(self):
+        data = [mock_vehicle(20 + idx % 13, to_epoch("1/%d/2016" % (1 + idx % 2), "5:%02d" % idx))
+                for idx in xrange(60)]
+        stats = sliding_intervals(compute_statistics(bucket_data(data, 15 * 60)), [15 * 60, 30 * 60], 15 * 60)
+        self.assertEqual(sorted(stats[15 * 60]), sorted(compute_statistics(bucket_data(data, 15 * 60))))
+        self.assertEqual(len(stats[30 * 60]), 2 * 3)
+        self.assertEqual(sliding_statistics({}, 15 * 60, 60), {})
+
+    def test_statistics_columns_come_after_their_dependencies(self):
+        self.assertEqual(statistics_columns(["count", "diff", "min", "85%"]), ["max", "min", "diff", "85%"])
+        self.assertRaises(Exception, statistics_columns, ["median"])
+        self.assertEqual(parse_columns("count, 85%,%legal"), ["count", "85%", "%legal"])
+        self.assertRaises(Exception, parse_columns, "count,median")
+
+    def test_speed_statistics_only_computes_the_columns_asked_for(self):
+        histogram = SpeedHistogram.from_speeds([20, 24, 30, 41])
+        stat = speed_statistics(histogram, 25.0, ["diff"])
+        self.assertEqual(sorted(stat), ["_histogram", "count", "count_legal", "diff", "limit", "max", "min"])
+        self.assertEqual(stat["diff"], 21)
+        with patch.object(SpeedHistogram, "percentile") as percentile:
+            speed_statistics(histogram, 25.0, ["count", "mean", "%legal"])
+        self.assertFalse(percentile.called)
+        self.assertEqual(evaluate_statistics(stat, ["%legal"])["%legal"], 50.0)
+
+    def test_register_statistic(self):
+        register_statistic("spread", lambda stat: stat["99%"] - stat["50%"], ["99%", "50%"])
+        try:
+            stats = compute_statistics({0: [mock_vehicle(speed) for speed in [20, 30, 35, 40]]}, ["spread"])
+            self.assertEqual(stats[0]["spread"], 5)
+            self.assertTrue("mean" not in stats[0])
+        finally:
+            del STATISTICS["spread"]
+
+    def test_stream_statistics_no_data(self):
+        self.assertEqual(stream_statistics(iter([]), 15 * 60), {})
+
     def test_group_statistics(self):
         buckets = {
-            timestring.Date("2016-01-01 05:00:00").date.timetuple(): [mock_vehicle(20), mock_vehicle(20)],
-            timestring.Date("2016-01-01 05:15:00").date.timetuple(): [mock_vehicle(20), mock_vehicle(20)],
-            timestring.Date("2016-01-02 05:00:00").date.timetuple(): [mock_vehicle(30), mock_vehicle(30)],
-            timestring.Date("2016-01-01 05:15:00").date.timetuple(): [mock_vehicle(25), mock_vehicle(25)]}
+            to_epoch("1/1/2016", "05:00"): [mock_vehicle(20), mock_vehicle(20)],
+            to_epoch("1/1/2016", "05:15"): [mock_vehicle(20), mock_vehicle(20)],
+            to_epoch("1/2/2016", "05:00"): [mock_vehicle(30), mock_vehicle(30)],
+            to_epoch("1/1/2016", "05:15"): [mock_vehicle(25), mock_vehicle(25)]}
         stats = compute_statistics(buckets)
         gstats = group_statistics(stats)
         period1 = gstats["05:00:00"]
@@ -78,9 +228,26 @@ class AnalyseDataTests(TestCase):
         self.assertAlmostEqual(period1["count"], 4)
         self.assertAlmostEqual(period1["limit"], 25)
 
+    def test_combine_stats_exact_percentiles(self):
+        stats = compute_statistics({
+            "1": [mock_vehicle(speed) for speed in [20, 21, 22]],
+            "2": [mock_vehicle(speed) for speed in [30, 31, 32, 33, 34, 35, 36]]})
+        combined = combine_stats([stats["1"], stats["2"]])
+        self.assertEqual(combined["count"], 10)
+        self.assertEqual(combined["count_legal"], 3)
+        self.assertAlmostEqual(combined["%legal"], 30.0)
+        self.assertAlmostEqual(combined["50%"], 31.0)
+        self.assertAlmostEqual(combined["85%"], 34.0)
+        self.assertAlmostEqual(combined["mean"], 29.4)
+        self.assertEqual(combined["_histogram"].count, 10)
+
     def test_count_speeds(self):
         self.assertEqual(count_speeds([10, 14.9, 20]), {"10-15": 2, "20-25": 1})
 
+    def test_count_speeds_histogram(self):
+        self.assertEqual(count_speeds(SpeedHistogram.from_speeds([10, 14, 20])),
+                         {"10-15": 2, "20-25": 1})
+
     def test_filter_statistics_no_min(self):
         self.assertEqual(filter_statistics("bart", 0), "bart")
         self.assertEqual(filter_statistics("bart", None), "bart")
@@ -0,0 +1,70 @@
+"""Tests of before and after comparisons"""
+from unittest import TestCase
+from toofast.analyse_data import speed_statistics
+from toofast.compare import (
+    align_reports, comparison_columns, compare_partitions, compare_statistics, kolmogorov_p,
+    kolmogorov_smirnov, mann_whitney)
+from toofast.histogram import SpeedHistogram
+
+BEFORE = [30, 32, 32, 35, 28, 40, 33, 32, 29, 31]
+AFTER = [25, 27, 32, 26, 28, 29, 24, 30]
+
+
+class CompareTests(TestCase):
+    """Tests of before and after comparisons"""
+
+    def test_mann_whitney_counts_faster_pairs(self):
+        u_after, z_score, p_value = mann_whitney(SpeedHistogram.from_speeds(BEFORE),
+                                                 SpeedHistogram.from_speeds(AFTER))
+        pairs = sum(1.0 if after > before else 0.5 if after == before else 0.0
+                    for before in BEFORE for after in AFTER)
+        self.assertEqual(u_after, pairs)
+        self.assertTrue(z_score < -2)
+        self.assertTrue(0 < p_value < 0.05)
+
+    def test_identical_speeds_do_not_differ(self):
+        histogram = SpeedHistogram.from_speeds(BEFORE)
+        _, z_score, p_value = mann_whitney(histogram, histogram.copy())
+        self.assertEqual((z_score, p_value), (0.0, 1.0))
+        self.assertEqual(kolmogorov_smirnov(histogram, histogram.copy()), (0.0, 1.0))
+        self.assertEqual(mann_whitney(histogram, SpeedHistogram())[1:], (0.0, 1.0))
+        self.assertEqual(kolmogorov_smirnov(SpeedHistogram(), histogram), (0.0, 1.0))
+
+    def test_kolmogorov_smirnov_is_largest_gap(self):
+        distance, p_value = kolmogorov_smirnov(SpeedHistogram.from_speeds(BEFORE),
+                                               SpeedHistogram.from_speeds(AFTER))
+        gaps = [abs(sum(1 for before in BEFORE if before <= speed) / float(len(BEFORE)) -
+                    sum(1 for after in AFTER if after <= speed) / float(len(AFTER)))
+                for speed in BEFORE + AFTER]
+        self.assertAlmostEqual(distance, max(gaps))
+        self.assertTrue(0.05 < p_value < 0.1)
+        self.assertEqual(kolmogorov_p(0), 1.0)
+        self.assertAlmostEqual(kolmogorov_p(1.36), 0.049, places=3)
+
+    def test_compare_statistics_only_tests_times_both_have(self):
+        before = {"05:00:00": speed_statistics(SpeedHistogram.from_speeds(BEFORE), 25.0),
+                  "05:15:00": speed_statistics(SpeedHistogram.from_speeds(BEFORE), 25.0)}
+        after = {"05:15:00": speed_statistics(SpeedHistogram.from_speeds(AFTER), 25.0)}
+        rows = compare_statistics(before, after, ["count", "max"])
+        self.assertEqual(comparison_columns(["count", "max"]), [
+            "count_before", "count_after", "count_change", "max_before", "max_after", "max_change",
+            "mann_whitney_z", "mann_whitney_p", "ks_d", "ks_p"])
+        self.assertEqual(rows["05:00:00"], {"count_before": 10, "max_before": 40.0})
+        self.assertEqual(sorted(rows["05:15:00"]), sorted(comparison_columns(["count", "max"])))
+        self.assertEqual(rows["05:15:00"]["count_change"], -2)
+        self.assertEqual(rows["05:15:00"]["max_change"], -8.0)
+
+    def test_compare_partitions_filters_buckets_of_each_partition(self):
+        before = {("North",): {"05:00:00": speed_statistics(SpeedHistogram.from_speeds(BEFORE), 25.0)},
+                  ("South",): {"05:00:00": speed_statistics(SpeedHistogram.from_speeds(AFTER), 25.0)}}
+        after = {("North",): {"05:00:00": speed_statistics(SpeedHistogram.from_speeds(AFTER), 25.0)}}
+        compared = compare_partitions(before, after, ["count"], min_count=8)
+        self.assertEqual(compared.keys(), [("North",), ("South",)])
+        self.assertEqual(compared[("North",)], {"05:00:00": {"count_before": 10}})
+        self.assertEqual(compared[("South",)], {})
+
+    def test_align_reports_pairs_intervals(self):
+        before = [(900, {"before": 15}, None), (1800, {"before": 30}, None)]
+        after = [(1800, {"after": 30}, None)]
+        self.assertEqual(list(align_reports(before, after)),
+                         [(900, {"before": 15}, {}), (1800, {"before": 30}, {"after": 30})])
@@ -0,0 +1,77 @@
+"""Tests of reading compressed data files and zip archives"""
+from unittest import TestCase
+import bz2
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+from toofast.data_files import (
+    data_file_exists, data_file_size, list_archive, open_data_file, split_archive)
+from toofast.parse_input import list_data_directory, read_table_file
+from helpers import sheet_text
+
+SHEET = sheet_text([(1, "5:01", 24), (2, "5:07", 31), (3, "5:22", 28)], date="1/1/2016", location="Main St")
+
+
+class DataFilesTests(TestCase):
+    """Tests of reading compressed data files and zip archives"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+        self.plain = os.path.join(self.tempdir, "a.csv")
+        with open(self.plain, "wb") as plain_file:
+            plain_file.write(SHEET)
+        self.gzipped = os.path.join(self.tempdir, "b.csv.gz")
+        with gzip.open(self.gzipped, "wb") as gzip_file:
+            gzip_file.write(SHEET)
+        self.bzipped = os.path.join(self.tempdir, "c.csv.bz2")
+        with bz2.BZ2File(self.bzipped, "wb") as bz2_file:
+            bz2_file.write(SHEET)
+        self.archive = os.path.join(self.tempdir, "d.zip")
+        with zipfile.ZipFile(self.archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("South.csv", SHEET)
+            zip_file.writestr("North.csv", SHEET)
+            zip_file.writestr("North.csv.meta.json", "{}")
+            zip_file.writestr("empty/", "")
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_split_archive(self):
+        self.assertEqual(split_archive(self.archive + "/North.csv"), (self.archive, "North.csv"))
+        self.assertEqual(split_archive(self.archive), (None, None))
+        self.assertEqual(split_archive(self.plain), (None, None))
+        os.mkdir(os.path.join(self.tempdir, "study.zip"))
+        self.assertEqual(split_archive(os.path.join(self.tempdir, "study.zip", "North.csv")), (None, None))
+        fake = os.path.join(self.tempdir, "fake.zip")
+        shutil.copy(self.plain, fake)
+        self.assertEqual(split_archive(fake + "/North.csv"), (None, None))
+
+    def test_list_archive(self):
+        self.assertEqual(list_archive(self.archive), [
+            self.archive + "/North.csv", self.archive + "/North.csv.meta.json", self.archive + "/South.csv"])
+
+    def test_list_data_directory_expands_archives(self):
+        self.assertEqual(list_data_directory(self.tempdir), [
+            self.plain, self.gzipped, self.bzipped, self.archive + "/North.csv", self.archive + "/South.csv"])
+
+    def test_every_kind_of_file_reads_the_same(self):
+        expected = read_table_file(self.plain)
+        self.assertEqual(list(expected.speeds), [24, 31, 28])
+        for filename in list_data_directory(self.tempdir):
+            with open_data_file(filename) as data_file:
+                self.assertEqual(data_file.read(), SHEET)
+            table = read_table_file(filename)
+            self.assertEqual(table.speeds, expected.speeds)
+            self.assertEqual(table.datetimes, expected.datetimes)
+            self.assertEqual(table.sessions[0]["filename"], filename)
+
+    def test_data_file_size_and_exists(self):
+        self.assertEqual(data_file_size(self.gzipped), os.path.getsize(self.gzipped))
+        self.assertTrue(0 < data_file_size(self.archive + "/North.csv") < len(SHEET))
+        self.assertTrue(data_file_exists(self.archive + "/North.csv.meta.json"))
+        self.assertFalse(data_file_exists(self.archive + "/South.csv.meta.json"))
+        self.assertFalse(data_file_exists(self.plain + ".meta.json"))
@@ -0,0 +1,71 @@
+"""Tests of compiled binary datasets"""
+from unittest import TestCase
+from mock import MagicMock, patch
+import os
+import shutil
+import tempfile
+from toofast.dataset import compile_dataset, is_dataset, load_dataset, stale_files
+from toofast.parse_input import read_table_file
+from helpers import write_sheet
+
+
+class DatasetTests(TestCase):
+    """Tests of compiled binary datasets"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tempdir, "data")
+        self.dataset = os.path.join(self.tempdir, "data.bin")
+        os.mkdir(self.data_dir)
+        write_sheet(os.path.join(self.data_dir, "a.csv"), [(1, "6:56", 44), (2, "7:01", 30)])
+        write_sheet(os.path.join(self.data_dir, "b.csv"), [(1, "8:15", 25)])
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_compile_and_load(self):
+        compiled = compile_dataset(self.data_dir, self.dataset)
+        self.assertTrue(is_dataset(self.dataset))
+        self.assertFalse(is_dataset(os.path.join(self.data_dir, "a.csv")))
+        metadata, table = load_dataset(self.dataset)
+        self.assertEqual(list(table.speeds), [44, 30, 25])
+        self.assertEqual(list(table.datetimes), list(compiled.datetimes))
+        self.assertEqual(list(table.timeofdays), [6 * 60 + 56, 7 * 60 + 1, 8 * 60 + 15])
+        self.assertEqual(table.header(2)["filename"], self.data_dir + "/b.csv")
+        self.assertEqual(table.speed_limit(0), 25.0)
+        self.assertEqual([source["count"] for source in metadata["files"]], [2, 1])
+        self.assertEqual(stale_files(metadata), [])
+
+    def test_recompile_only_parses_changed_files(self):
+        compile_dataset(self.data_dir, self.dataset)
+        write_sheet(os.path.join(self.data_dir, "b.csv"), [(1, "8:15", 25), (2, "8:16", 35)])
+        metadata, _ = load_dataset(self.dataset)
+        self.assertEqual(stale_files(metadata), [self.data_dir + "/b.csv"])
+
+        read_mock = MagicMock(side_effect=read_table_file)
+        with patch("toofast.parse_input.read_table_file", read_mock):
+            compile_dataset(self.data_dir, self.dataset)
+        self.assertEqual(read_mock.call_count, 1)
+        _, table = load_dataset(self.dataset)
+        self.assertEqual(list(table.speeds), [44, 30, 25, 35])
+
+    def test_deleted_files_are_stale(self):
+        compile_dataset(self.data_dir, self.dataset)
+        os.remove(os.path.join(self.data_dir, "a.csv"))
+        metadata, _ = load_dataset(self.dataset)
+        self.assertEqual(stale_files(metadata), [self.data_dir + "/a.csv"])
+
+    def test_dataset_inside_its_source_directory_is_not_a_source(self):
+        dataset = os.path.join(self.data_dir, "data.bin")
+        with open(dataset + ".tmp", "w") as partial:
+            partial.write("partial")
+        compile_dataset(self.data_dir, dataset)
+        metadata, table = load_dataset(dataset)
+        self.assertEqual([source["filename"] for source in metadata["files"]],
+                         [self.data_dir + "/a.csv", self.data_dir + "/b.csv"])
+        self.assertEqual(list(table.speeds), [44, 30, 25])
+        self.assertEqual(stale_files(metadata, dataset), [])
+        compile_dataset(self.data_dir, dataset)
+        self.assertEqual(len(load_dataset(dataset)[1]), 3)
@@ -0,0 +1,76 @@
+"""Tests of restricting a run to some of its data files"""
+from unittest import TestCase
+from mock import patch
+import json
+import os
+import shutil
+import tempfile
+from toofast.file_filter import FileFilter
+from toofast.parse_input import list_data_directory, read_data_table, select_data_files
+from toofast.parse_time import to_epoch
+from toofast.plan import read_filters
+from toofast.vehicle_table import VehicleTable
+from helpers import write_sheet
+
+EXPORT = """timestamp,speed
+2016-08-09 23:59:00,30
+2016-08-10 00:01:00,31
+2016-08-11 07:00:00,32
+"""
+
+
+class FileFilterTests(TestCase):
+    """Tests of restricting a run to some of its data files"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+        for name, date, direction in [("a.csv", "8/9/2016", "North"), ("b.csv", "8/10/2016", "North"),
+                                      ("c.csv", "8/10/2016", "South")]:
+            write_sheet(os.path.join(self.tempdir, name), [(1, "5:01", 24), (2, "5:07", 31)], date=date,
+                        location="Main St", direction=direction)
+        with open(os.path.join(self.tempdir, "d.csv"), "w") as export:
+            export.write(EXPORT)
+        with open(os.path.join(self.tempdir, "d.csv.meta.json"), "w") as sidecar:
+            json.dump({"location": "Main St", "direction": "North", "speed_limit": 25}, sidecar)
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_header_matches(self):
+        file_filter = FileFilter("8/10/2016", "8/10/2016", read_filters({"direction": "north"}))
+        self.assertTrue(file_filter.header_matches({"date": "8/10/2016", "direction": "North"}))
+        self.assertTrue(file_filter.header_matches({"date": "", "direction": "North"}))
+        self.assertFalse(file_filter.header_matches({"date": "8/11/2016", "direction": "North"}))
+        self.assertFalse(file_filter.header_matches({"date": "8/10/2016", "direction": "South"}))
+        self.assertFalse(FileFilter())
+
+    def test_select_data_files_only_reads_headers(self):
+        filenames = list_data_directory(self.tempdir)
+        file_filter = FileFilter(date_from="8/10/2016", headers=read_filters({"direction": "North"}))
+        with patch("toofast.parse_input.read_vehicle_table") as read_vehicle_table:
+            selected = select_data_files(filenames, file_filter)
+        self.assertFalse(read_vehicle_table.called)
+        self.assertEqual([os.path.basename(filename) for filename in selected], ["b.csv", "d.csv"])
+
+    def test_read_data_table_filters_exports_by_time(self):
+        counters = {"files_skipped": 0}
+        file_filter = FileFilter("8/10/2016", "8/10/2016")
+        table = read_data_table(self.tempdir, counters=counters, file_filter=file_filter)
+        self.assertEqual(sorted(table.speeds), [24, 24, 31, 31, 31])
+        self.assertEqual(counters["files_skipped"], 1)
+
+    def test_filter_table_and_vehicles_agree(self):
+        table = VehicleTable()
+        for date, direction in [("8/9/2016", "North"), ("8/10/2016", "South"), ("", "North")]:
+            session = table.add_session({"date": date, "direction": direction})
+            for minute in [0, 60 * 23 + 59]:
+                data_time = to_epoch(date or "8/10/2016", "0:00") + minute * 60
+                table.add(session, 30, data_time, minute)
+        file_filter = FileFilter(date_from="8/10/2016")
+        filtered = file_filter.filter_table(table)
+        self.assertEqual(len(filtered), 4)
+        self.assertEqual(list(filtered.datetimes), [vehicle["datetime"]
+                                                    for vehicle in file_filter.filter_vehicles(iter(table))])
+        self.assertEqual(len(FileFilter(headers=read_filters({"direction": "south"})).filter_table(table)), 2)
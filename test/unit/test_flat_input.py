@@ -0,0 +1,124 @@
+"""Tests of reading automated counter exports"""
+from unittest import TestCase
+from mock import patch
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter
+from toofast.flat_input import (
+    FlatInput, flat_rejection, is_flat_header, parse_metadata, parse_timestamp, read_flat_header)
+from toofast.parse_input import SheetInput, input_adapter, list_data_directory
+from toofast.parse_time import to_epoch
+from toofast.rejects import DEFAULT_LOG_LIMIT, RejectedRows, RejectSink
+
+EXPORT = """timestamp,speed,lane
+2016-08-10 07:00:01,27.4,1
+2016-08-10 07:01,8.2,2
+
+2016-08-10T07:02:00,31,1
+yesterday,30,1
+2016-08-10 07:03:00,fast,2
+2016-02-30 07:03:00,30,2
+2016-08-10 07:04:59.5,99.4,1
+2016-08-10 07:05:00,99.5,1
+"""
+
+
+class FlatInputTests(TestCase):
+    """Tests of reading automated counter exports"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+        self.export = os.path.join(self.tempdir, "radar.csv")
+        with open(self.export, "w") as export_file:
+            export_file.write(EXPORT)
+        with open(self.export + ".meta.json", "w") as sidecar:
+            json.dump({"location": "Main St", "speed_limit": 25}, sidecar)
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_is_flat_header(self):
+        self.assertTrue(is_flat_header("timestamp,speed,lane\n"))
+        self.assertTrue(is_flat_header("Timestamp, Speed\r\n"))
+        self.assertFalse(is_flat_header(",,,,\n"))
+
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp("2016-08-10 07:05"), to_epoch("8/10/2016", "7:05"))
+        self.assertEqual(parse_timestamp("2016-08-10T07:05:09.5"), to_epoch("8/10/2016", "7:05") + 9)
+        for text in ["2016-08-10", "2016-02-30 07:05", "2016-08-10 24:00", "2016-08-10 07:05Z", "today"]:
+            self.assertEqual(parse_timestamp(text), None)
+
+    def test_flat_rejection(self):
+        self.assertEqual(flat_rejection("2016-08-10 07:05", "24.5"),
+                         ((to_epoch("8/10/2016", "7:05"), 25), None))
+        self.assertEqual(flat_rejection("", "24.5"), (None, "null"))
+        self.assertEqual(flat_rejection("7:05", "24.5"), (None, "bad_time"))
+        self.assertEqual(flat_rejection("2016-08-10 07:05", "nan"), (None, "non_digit"))
+        self.assertEqual(flat_rejection("2016-08-10 07:05", "9.4"), (None, "out_of_range"))
+
+    def test_parse_metadata(self):
+        self.assertEqual(parse_metadata("location=Main St, speed_limit=25"),
+                         {"location": "Main St", "speed limit": "25"})
+        self.assertRaises(Exception, parse_metadata, "speed=25")
+
+    def test_sidecar_wins_over_metadata(self):
+        header = read_flat_header(self.export, {"speed limit": "30", "direction": "North"})
+        self.assertEqual(header["speed limit"], "25")
+        self.assertEqual(header["direction"], "North")
+        self.assertEqual(header["weather"], "")
+        os.remove(self.export + ".meta.json")
+        self.assertRaises(Exception, read_flat_header, self.export)
+
+    def test_read_table(self):
+        rejected = RejectedRows(self.export)
+        table = FlatInput.read_table(self.export, rejected=rejected)
+        self.assertEqual(list(table.speeds), [27, 31, 99])
+        self.assertEqual(table[1]["datetime"], to_epoch("8/10/2016", "7:02"))
+        self.assertEqual(table[1]["timeofday"], 7 * 60 + 2)
+        self.assertEqual(table.speed_limit(2), 25.0)
+        self.assertEqual([(line_num, reason) for line_num, _, reason in rejected.rows],
+                         [(3, "out_of_range"), (6, "bad_time"), (7, "non_digit"), (8, "bad_time"),
+                          (10, "out_of_range")])
+
+    def test_unrejected_rows_are_logged_up_to_the_limit_of_the_run(self):
+        with open(self.export, "w") as export_file:
+            export_file.write("timestamp,speed\n" + "2016-08-10 07:00:00,5\n" * 1000)
+        counters = Counter()
+        with patch("toofast.flat_input._LOG_REJECTS", RejectSink()):
+            with patch("toofast.rejects.logging") as logging:
+                table = FlatInput.read_table(self.export, counters=counters)
+                self.assertEqual(len(list(FlatInput.iter_vehicles(self.export))), 0)
+        self.assertEqual(len(table), 0)
+        self.assertEqual(logging.info.call_count, DEFAULT_LOG_LIMIT + 3)
+        self.assertEqual(counters["rejected_out_of_range"], 1000)
+        self.assertEqual(counters["rows_scanned"], 1001)
+
+    def test_chunks_read_with_and_without_numpy_agree(self):
+        with open(self.export, "w") as export_file:
+            export_file.write("timestamp,speed\n" + "".join(
+                "2016-08-10 07:{:02}:{:02},{}.{}\n".format(idx // 60, idx % 60, 5 + idx % 30, idx % 10)
+                for idx in xrange(250)))
+        with patch("toofast.flat_input.FLAT_CHUNK_ROWS", 64):
+            python_rows = RejectedRows(self.export)
+            with patch("toofast.flat_input.numpy", None):
+                python_table = FlatInput.read_table(self.export, rejected=python_rows)
+            rows = RejectedRows(self.export)
+            table = FlatInput.read_table(self.export, rejected=rows)
+        self.assertEqual(python_table.speeds, table.speeds)
+        self.assertEqual(python_table.datetimes, table.datetimes)
+        self.assertEqual(python_table.timeofdays, table.timeofdays)
+        self.assertEqual(python_rows.rows, rows.rows)
+        self.assertEqual(rows.rows[0][0], 2)
+        self.assertEqual(len(table.sessions), 1)
+
+    def test_input_adapter(self):
+        sheet = os.path.join(self.tempdir, "sheet.csv")
+        with open(sheet, "w") as sheet_file:
+            sheet_file.write(",,,,\n,Name[s],Tester,,\n")
+        self.assertTrue(input_adapter(self.export) is FlatInput)
+        self.assertTrue(input_adapter(sheet) is SheetInput)
+        self.assertEqual(list_data_directory(self.tempdir), [self.export, sheet])
@@ -0,0 +1,64 @@
+"""Tests of speed histograms"""
+from unittest import TestCase
+from toofast.histogram import SpeedHistogram
+
+
+def make_histogram(speeds):
+    histogram = SpeedHistogram()
+    for speed in speeds:
+        histogram.add(speed)
+    return histogram
+
+
+class SpeedHistogramTests(TestCase):
+    """Tests of speed histograms"""
+
+    def test_behaves_like_sorted_speeds(self):
+        histogram = make_histogram([30, 20, 25, 20])
+        self.assertEqual(len(histogram), 4)
+        self.assertEqual(list(histogram), [20.0, 20.0, 25.0, 30.0])
+        self.assertEqual(histogram[0], 20.0)
+        self.assertEqual(histogram[2], 25.0)
+        self.assertEqual(histogram[-1], 30.0)
+        self.assertRaises(IndexError, histogram.__getitem__, 4)
+
+    def test_percentile(self):
+        histogram = make_histogram(range(20, 30))
+        self.assertEqual(histogram.percentile(0.85), 27.0)
+        self.assertEqual(histogram.percentile(0.99), 28.0)
+        self.assertEqual(histogram.percentile(0.50), 24.0)
+
+    def test_statistics(self):
+        histogram = make_histogram([30, 20, 25, 20])
+        self.assertEqual(histogram.min(), 20.0)
+        self.assertEqual(histogram.max(), 30.0)
+        self.assertEqual(histogram.total(), 95)
+        self.assertAlmostEqual(histogram.mean(), 23.75)
+        self.assertEqual(histogram.count_at_most(25.0), 3)
+        self.assertEqual(histogram.count_at_most(5.0), 0)
+        self.assertEqual(list(histogram.speeds()), [(20, 2), (25, 1), (30, 1)])
+
+    def test_add_histograms(self):
+        histogram_a = make_histogram([20, 30])
+        histogram_b = make_histogram([25])
+        combined = histogram_a + histogram_b
+        self.assertEqual(list(combined), [20.0, 25.0, 30.0])
+        self.assertEqual(len(histogram_a), 2)
+        histogram_a += histogram_b
+        self.assertEqual(list(histogram_a), [20.0, 25.0, 30.0])
+
+    def test_subtract_histograms(self):
+        histogram = make_histogram([20, 25, 30])
+        self.assertEqual(list(histogram - make_histogram([25])), [20.0, 30.0])
+        histogram -= make_histogram([20, 30])
+        self.assertEqual(list(histogram), [25.0])
+        self.assertRaises(Exception, histogram.__isub__, make_histogram([20]))
+        self.assertEqual(list(histogram), [25.0])
+
+    def test_speeds_out_of_range(self):
+        histogram = make_histogram([20])
+        self.assertRaises(ValueError, histogram.add, 5)
+        self.assertRaises(ValueError, histogram.add, "3")
+        self.assertRaises(ValueError, histogram.add, 100)
+        self.assertRaises(ValueError, SpeedHistogram.from_speeds, [5, 20])
+        self.assertEqual(list(histogram), [20.0])
@@ -0,0 +1,57 @@
+"""Tests of stage metrics"""
+import os
+import pstats
+import shutil
+import tempfile
+from unittest import TestCase
+from toofast.metrics import StageMetrics
+
+
+class StageMetricsTests(TestCase):
+    """Tests of stage metrics"""
+
+    def test_stages_are_recorded_in_order(self):
+        metrics = StageMetrics()
+        with metrics.stage("parse"):
+            pass
+        with metrics.stage("bucket"):
+            pass
+        with metrics.stage("parse"):
+            pass
+        stages = metrics.as_dict()["stages"]
+        self.assertEqual([stage["name"] for stage in stages], ["parse", "bucket"])
+        for key in ["wall", "cpu", "peak_rss", "peak_rss_growth", "rss_start", "rss_end"]:
+            self.assertTrue(key in stages[0])
+        self.assertTrue(stages[0]["wall"] >= 0.0)
+
+    def test_stage_recorded_on_exception(self):
+        metrics = StageMetrics()
+        try:
+            with metrics.stage("parse"):
+                raise ValueError("bad file")
+        except ValueError:
+            pass
+        self.assertEqual(metrics.stages, ["parse"])
+
+    def test_counters_are_recorded(self):
+        metrics = StageMetrics()
+        metrics.counters["files_read"] += 2
+        self.assertEqual(metrics.as_dict()["counters"], {"files_read": 2})
+
+    def test_write_profiles(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            metrics = StageMetrics(profile=True)
+            with metrics.stage("parse"):
+                sorted(range(100))
+            prefix = os.path.join(temp_dir, "metrics.json")
+            self.assertEqual(metrics.write_profiles(prefix), [prefix + ".parse.prof"])
+            self.assertTrue(pstats.Stats(prefix + ".parse.prof").total_calls > 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_no_profiles_unless_asked(self):
+        metrics = StageMetrics()
+        with metrics.stage("parse"):
+            pass
+        self.assertEqual(metrics.write_profiles("unused"), [])
@@ -0,0 +1,39 @@
+"""Tests of the vectorized statistics engine"""
+from unittest import TestCase, skipIf
+from mock import patch
+from toofast.analyse_data import bucket_data, compute_statistics
+from toofast.numpy_statistics import numpy, vectorized_statistics
+from toofast.vehicle_table import VehicleTable
+from helpers import make_table
+
+
+@skipIf(numpy is None, "numpy is not installed")
+class VectorizedStatisticsTests(TestCase):
+    """Tests of the vectorized statistics engine"""
+
+    def test_matches_compute_statistics(self):
+        table = VehicleTable()
+        for day in xrange(3):
+            table.extend(make_table([("North", "25", [20 + idx % 17 for idx in xrange(day, 200, 3)])],
+                                    minutes_apart=1, date="1/%d/2016" % (1 + day)))
+        for interval in [15 * 60, 7 * 60, 120 * 60]:
+            expected = compute_statistics(bucket_data(table, interval))
+            stats = vectorized_statistics(table, interval)
+            self.assertEqual(sorted(stats.keys()), sorted(expected.keys()))
+            for name, stat in stats.iteritems():
+                self.assertEqual(stat.pop("_histogram").counts, expected[name].pop("_histogram").counts)
+                self.assertEqual(stat, expected[name])
+
+    def test_only_sorts_for_the_columns_that_need_it(self):
+        table = make_table([("North", "25", [20 + idx % 17 for idx in xrange(100)])], minutes_apart=1)
+        for columns in [(), ["count", "mean", "%legal"], ["85%"], ["diff"]]:
+            expected = compute_statistics(bucket_data(table, 15 * 60), columns)
+            with patch("toofast.numpy_statistics.numpy.lexsort", wraps=numpy.lexsort) as lexsort:
+                stats = vectorized_statistics(table, 15 * 60, columns)
+            self.assertEqual(lexsort.called, columns in (["85%"], ["diff"]))
+            for name, stat in stats.iteritems():
+                self.assertEqual(stat.pop("_histogram").counts, expected[name].pop("_histogram").counts)
+                self.assertEqual(stat, expected[name])
+
+    def test_empty_table(self):
+        self.assertEqual(vectorized_statistics(VehicleTable(), 15 * 60), {})
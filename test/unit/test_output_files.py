@@ -0,0 +1,39 @@
+"""Tests of writing output files atomically"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from toofast.output_files import atomic_output
+
+
+class OutputFilesTests(TestCase):
+    """Tests of writing output files atomically"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, "report.csv")
+        with open(self.filename, "w") as report:
+            report.write("old")
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_replaces_file_once_written(self):
+        with atomic_output(self.filename) as output_file:
+            output_file.write("new")
+            with open(self.filename) as report:
+                self.assertEqual(report.read(), "old")
+        with open(self.filename) as report:
+            self.assertEqual(report.read(), "new")
+        self.assertEqual(os.listdir(self.tempdir), ["report.csv"])
+
+    def test_failure_keeps_file_and_removes_temporary_file(self):
+        with self.assertRaises(ValueError):
+            with atomic_output(self.filename) as output_file:
+                output_file.write("partial")
+                raise ValueError("failed")
+        with open(self.filename) as report:
+            self.assertEqual(report.read(), "old")
+        self.assertEqual(os.listdir(self.tempdir), ["report.csv"])
@@ -1,9 +1,17 @@
 """Tests output of statistics"""
 from unittest import TestCase
 from mock import MagicMock, patch
+import json
+import math
 import timestring
 import StringIO
-from toofast.output_statistics import output_csv
+from collections import OrderedDict
+from toofast.analyse_data import speed_statistics, STATISTICS_COLUMNS
+from toofast.histogram import SpeedHistogram
+from toofast.metrics import StageMetrics
+from toofast.output_statistics import (
+    output_csv, output_report, output_partitions, report_columns, report_statistics, report_writer,
+    read_columnar_report)
 
 
 class OutputStatisticsTests(TestCase):
@@ -31,3 +39,64 @@ class OutputStatisticsTests(TestCase):
 
     def test_output_csv_ignores_underscore_data(self):
         assert "baddata" not in self.outstr
+
+    def test_statistics_columns_match_speed_statistics(self):
+        stat = speed_statistics(SpeedHistogram.from_speeds([20, 30]), 25.0)
+        self.assertEqual(report_columns({"05:00:00": stat}), STATISTICS_COLUMNS)
+
+    def test_jsonl_report(self):
+        out = StringIO.StringIO()
+        output_report(report_writer("jsonl", out, ["s1", "s2"]), {"b": {"s2": 2}, "a": {"s1": 1, "_fun": 0}})
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], '{"when": "a", "s1": 1, "s2": null}')
+        self.assertEqual(json.loads(lines[1]), {"when": "b", "s1": None, "s2": 2})
+
+    def test_columnar_report_round_trip(self):
+        out = StringIO.StringIO()
+        stats = {"{:02}:00:00".format(hour): {"count": hour, "mean": hour / 2.0} for hour in range(10)}
+        stats["10:00:00"] = {"count": 10}
+        with patch("toofast.output_statistics.ROW_GROUP_SIZE", 4):
+            output_report(report_writer("columnar", out, ["count", "mean"]), stats)
+        columns, rows = read_columnar_report(StringIO.StringIO(out.getvalue()))
+        self.assertEqual(columns, ["count", "mean"])
+        self.assertEqual([when for when, _ in rows], sorted(stats))
+        self.assertEqual(rows[3][1], {"count": 3.0, "mean": 1.5})
+        self.assertTrue(math.isnan(rows[10][1]["mean"]))
+
+    def test_partitioned_csv_report(self):
+        out = StringIO.StringIO()
+        partitions = OrderedDict([(("Main St", "North"), {"b": {"s1": 2}, "a": {"s1": 1}}),
+                                  (("Main St", "South"), {"a": {"s1": 3}})])
+        output_partitions(report_writer("csv", out, ["s1"], ["location", "direction"]), partitions)
+        self.assertEqual(out.getvalue().splitlines(), [
+            "location,direction,when,s1", "Main St,North,a,1", "Main St,North,b,2", "Main St,South,a,3"])
+
+    def test_partitioned_columnar_report_round_trip(self):
+        out = StringIO.StringIO()
+        partitions = OrderedDict([(("North",), {"a": {"count": 1}, "b": {"count": 2}}),
+                                  (("South",), {"a": {"count": 3}})])
+        with patch("toofast.output_statistics.ROW_GROUP_SIZE", 2):
+            output_partitions(report_writer("columnar", out, ["count"], ["direction"]), partitions)
+        columns, rows = read_columnar_report(StringIO.StringIO(out.getvalue()))
+        self.assertEqual(columns, ["direction", "count"])
+        self.assertEqual(rows, [("a", {"direction": "North", "count": 1.0}),
+                                ("b", {"direction": "North", "count": 2.0}),
+                                ("a", {"direction": "South", "count": 3.0})])
+
+    def test_unknown_report_format(self):
+        self.assertRaises(Exception, report_writer, "xml", StringIO.StringIO(), [])
+
+    def test_report_statistics(self):
+        grouped_stats = {("North",): {
+            "05:00:00": speed_statistics(SpeedHistogram.from_speeds([20, 30]), 25.0, ()),
+            "05:15:00": speed_statistics(SpeedHistogram.from_speeds([31]), 25.0, ())}}
+        metrics = StageMetrics()
+        final_stats, columns = report_statistics(grouped_stats, metrics, min_count=1,
+                                                 columns=["count", "max"])
+        self.assertEqual(columns, ["count", "max"])
+        self.assertEqual(final_stats[("North",)]["05:00:00"]["max"], 30.0)
+        self.assertNotIn("05:15:00", final_stats[("North",)])
+        self.assertEqual(metrics.counters["filtered_buckets"], 1)
+        final_stats, columns = report_statistics(grouped_stats, metrics, detail=True)
+        self.assertEqual(columns, ["20-25", "30-35"])
+        self.assertEqual(final_stats[("North",)]["05:15:00"], {"30-35": 1})
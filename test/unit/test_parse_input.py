@@ -1,15 +1,26 @@
 """
 Tests of CSV input parsing
 """
+from collections import Counter
 from unittest import TestCase
 from mock import MagicMock, patch
+from toofast.rejects import RejectedRows
 from toofast.parse_input import (
     extract_file_header,
     read_file_header,
     is_null_vehicle,
     is_valid_vehicle,
+    rejection_reason,
+    classify_row,
+    column_layout,
+    extract_header_info,
+    BLANK_ROW,
+    FILE_HEADER_ROW,
+    COLUMN_HEADER_ROW,
+    DATA_ROW,
     read_vehicle_data,
-    read_data_file)
+    read_data_file,
+    map_data_files)
 
 
 class ParseInputTests(TestCase):
@@ -70,6 +81,45 @@ class ParseInputTests(TestCase):
         self.assertFalse(is_valid_vehicle({"vehicle": "1", "time": "5:00", "speed": "2"}))
         self.assertFalse(is_valid_vehicle({"vehicle": "1", "time": "5:00", "speed": "200"}))
 
+    def test_rejection_reason(self):
+        self.assertEqual(rejection_reason({"vehicle": "1", "time": "5:00", "speed": "25"}), None)
+        self.assertEqual(rejection_reason({"vehicle": "1", "time": "5:00", "speed": ""}), "null")
+        self.assertEqual(rejection_reason({"vehicle": "Vehicle", "time": "Time", "speed": "Speed"}), "null")
+        self.assertEqual(rejection_reason({"vehicle": "blerg", "time": "5:00", "speed": "25"}), "non_digit")
+        self.assertEqual(rejection_reason({"vehicle": "1", "time": "5:00", "speed": "2 5"}), "non_digit")
+        self.assertEqual(rejection_reason({"vehicle": "1", "time": "5:00", "speed": "200"}), "out_of_range")
+
+    def test_classify_row(self):
+        self.assertEqual(classify_row(["", "", ""]), (BLANK_ROW, {}))
+        self.assertEqual(classify_row(["", "Weather", "Sunny"]), (FILE_HEADER_ROW, {}))
+        self.assertEqual(classify_row(["", "Vehicle", "Time", "Speed"]),
+                         (COLUMN_HEADER_ROW, {1: "vehicle", 2: "time", 3: "speed"}))
+        self.assertEqual(classify_row(["", "1", "5:00", "25"]), (DATA_ROW, {}))
+
+    def test_column_layout(self):
+        header_info = extract_header_info(["", "Vehicle", "Time", "Speed", "", "Speed", "Vehicle", "Time"])
+        self.assertEqual(column_layout(header_info), ((3, 1, 2, 3), (7, 6, 7, 5)))
+        self.assertTrue(column_layout(dict(header_info)) is column_layout(header_info))
+        self.assertEqual(column_layout({3: "speed"}), ())
+
+    def test_read_vehicle_data_collects_rejections(self):
+        csv_data = []
+        csv_data.append(["", "Vehicle", "Time", "Speed", "", "Vehicle", "Time", "Speed"])
+        csv_data.append(["", "1", "5:00", "bogus", "", "2", "5:01", "25"])
+        csv_data.append(["", "3", "5:02", "3", "", "4", "", ""])
+        csv_reader = MagicMock()
+        csv_reader.__iter__ = MagicMock(return_value=iter(csv_data))
+        csv_reader.line_num = 1
+        rejected = RejectedRows("fakename")
+        logging_mock = MagicMock()
+        with patch("logging.info", logging_mock):
+            data = read_vehicle_data({'date': '2/2/2016', "filename": "fakename"}, csv_reader, rejected)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(logging_mock.call_count, 0)
+        self.assertEqual(rejected.counts, Counter({"non_digit": 1, "out_of_range": 1, "null": 1}))
+        self.assertEqual(rejected.rows, [(1, ("1", "5:00", "bogus"), "non_digit"),
+                                         (1, ("3", "5:02", "3"), "out_of_range")])
+
     def test_read_vehicle_data(self):
         csv_data = []
         csv_data.append(["", "", "", "", "", "", "", "", "", "", "", ""])
@@ -105,3 +155,17 @@ class ParseInputTests(TestCase):
         self.assertTrue("fakename" in my_log_str)
         self.assertTrue("99" in my_log_str)
         self.assertTrue("bogus" in my_log_str)
+
+    def test_map_data_files_keeps_order(self):
+        filenames = ["ccc", "a", "bb"]
+        self.assertEqual(list(map_data_files(len, filenames)),
+                         [("ccc", 3), ("a", 1), ("bb", 2)])
+        self.assertEqual(list(map_data_files(len, filenames, jobs=2)),
+                         [("ccc", 3), ("a", 1), ("bb", 2)])
+
+    def test_map_data_files_logs_failing_file(self):
+        logging_mock = MagicMock()
+        with patch("logging.exception", logging_mock):
+            self.assertRaises(ValueError, list, map_data_files(int, ["1", "bogus", "3"], jobs=2))
+        self.assertEqual(logging_mock.call_count, 1)
+        self.assertEqual(logging_mock.call_args[0][1], "bogus")
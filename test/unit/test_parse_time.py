@@ -0,0 +1,45 @@
+"""Tests of date and time parsing"""
+from unittest import TestCase
+from mock import MagicMock, patch
+import calendar
+from toofast.parse_time import parse_date, parse_time_of_day, to_epoch
+
+
+class ParseTimeTests(TestCase):
+    """Tests of date and time parsing"""
+
+    def test_parse_date(self):
+        self.assertEqual(parse_date("8/10/2015"), calendar.timegm((2015, 8, 10, 0, 0, 0)))
+
+    def test_parse_time_of_day(self):
+        self.assertEqual(parse_time_of_day("0:00"), 0)
+        self.assertEqual(parse_time_of_day("6:56"), 6 * 60 + 56)
+        self.assertEqual(parse_time_of_day("21:05"), 21 * 60 + 5)
+
+    def test_to_epoch(self):
+        self.assertEqual(to_epoch("8/10/2015", "6:56"), calendar.timegm((2015, 8, 10, 6, 56, 0)))
+
+    def test_parse_time_of_day_is_memoized(self):
+        parse_time_of_day("7:31")
+        timestring_mock = MagicMock()
+        with patch("timestring.Date", timestring_mock):
+            self.assertEqual(parse_time_of_day("7:31"), 7 * 60 + 31)
+        self.assertEqual(timestring_mock.call_count, 0)
+
+    def test_timestring_fallback_is_memoized(self):
+        self.assertEqual(parse_time_of_day("7:01:00"), 7 * 60 + 1)
+        timestring_mock = MagicMock()
+        with patch("timestring.Date", timestring_mock):
+            self.assertEqual(parse_time_of_day("7:01:00"), 7 * 60 + 1)
+        self.assertEqual(timestring_mock.call_count, 0)
+
+    def test_unrecognized_values_fall_back_to_timestring(self):
+        self.assertEqual(parse_time_of_day("6:56pm"), 18 * 60 + 56)
+        self.assertEqual(parse_date("August 11 2015"), calendar.timegm((2015, 8, 11, 0, 0, 0)))
+
+    def test_time_cache_is_bounded(self):
+        with patch("toofast.parse_time._TIME_CACHE", {}) as cache:
+            with patch("toofast.parse_time.TIME_CACHE_SIZE", 2):
+                for minute in xrange(5):
+                    self.assertEqual(parse_time_of_day("7:%02d:00" % minute), 7 * 60 + minute)
+            self.assertEqual(sorted(cache), ["7:00:00", "7:01:00"])
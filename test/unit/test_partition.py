@@ -0,0 +1,41 @@
+"""Tests of partitioned reports"""
+from unittest import TestCase
+from toofast.analyse_data import bucket_data, compute_statistics
+from toofast.partition import parse_group_by, partition_table, partition_statistics
+from toofast.vehicle_table import VehicleTable
+from helpers import make_table
+
+
+class PartitionTests(TestCase):
+    """Tests of partitioned reports"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.south = make_table([("South", "30", [31, 35, 22, 40])])
+        self.north = make_table([("North", "25", [20, 26, 30, 24, 28, 33])])
+        self.table = VehicleTable()
+        self.table.extend(self.south)
+        self.table.extend(self.north)
+
+    def test_parse_group_by(self):
+        self.assertEqual(parse_group_by("location, Direction,speed_limit"),
+                         ["location", "direction", "speed limit"])
+        self.assertRaises(Exception, parse_group_by, "location,street")
+
+    def test_partition_table_is_in_key_order(self):
+        partitions = partition_table(self.table, ["location", "direction"])
+        self.assertEqual(partitions.keys(), [("Main St", "North"), ("Main St", "South")])
+        self.assertEqual(list(partitions[("Main St", "South")].speeds), [31, 35, 22, 40])
+
+    def test_partition_statistics_match_each_partition_alone(self):
+        partitions = partition_table(self.table, ["direction"])
+        for jobs in [1, 2]:
+            partitioned_stats = partition_statistics(partitions, 15 * 60, jobs=jobs)
+            self.assertEqual(partitioned_stats.keys(), [("North",), ("South",)])
+            for keys, table in [(("North",), self.north), (("South",), self.south)]:
+                expected = compute_statistics(bucket_data(table, 15 * 60))
+                stats = partitioned_stats[keys]
+                self.assertEqual(sorted(stats), sorted(expected))
+                for name, stat in stats.iteritems():
+                    self.assertEqual(stat.pop("_histogram").counts, expected[name].pop("_histogram").counts)
+                    self.assertEqual(stat, expected[name])
@@ -0,0 +1,86 @@
+"""Tests of report plans"""
+from unittest import TestCase
+import json
+import os
+import shutil
+import tempfile
+from toofast.analyse_data import bucket_data, compute_statistics, group_statistics
+from toofast.plan import filter_table, plan_statistics, read_filters, read_plan, read_report
+from helpers import make_table, without_histograms
+
+NORTH = ("North", "25", [20, 26, 30, 24, 28, 33])
+SOUTH = ("South", "25", [31, 35, 22, 40])
+
+
+class PlanTests(TestCase):
+    """Tests of report plans"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_read_report_defaults(self):
+        report = read_report({"output": "out.csv", "interval": 30})
+        self.assertEqual(report["interval"], 30 * 60)
+        self.assertEqual(report["min_count"], 0)
+        self.assertEqual(report["format"], "csv")
+        self.assertEqual(report["keys"], [])
+        self.assertEqual(report["filters"], ())
+        self.assertEqual(report["columns"], None)
+        self.assertEqual(read_report({"output": "out.csv", "columns": "count, 85%"})["columns"],
+                         ["count", "85%"])
+        self.assertEqual(read_report({"output": "out.csv", "columns": ["mean"]})["columns"], ["mean"])
+
+    def test_read_report_rejects_bad_reports(self):
+        self.assertRaises(Exception, read_report, {"interval": 15})
+        self.assertRaises(Exception, read_report, {"output": "out.csv", "intervals": 15})
+        self.assertRaises(Exception, read_report, {"output": "out.csv", "format": "xml"})
+        self.assertRaises(Exception, read_report, {"output": "out.csv", "interval": 0})
+        self.assertRaises(Exception, read_report, {"output": "out.csv", "columns": "count,median"})
+
+    def test_read_filters(self):
+        self.assertEqual(read_filters({"speed_limit": "25", "direction": ["North", "south"]}),
+                         (("direction", ("north", "south")), ("speed limit", ("25",))))
+        self.assertRaises(Exception, read_filters, {"street": "Main St"})
+
+    def test_read_plan(self):
+        filename = os.path.join(self.tempdir, "plan.json")
+        with open(filename, "w") as plan_file:
+            reports = [{"output": "a.csv"}, {"output": "b.csv", "detail": True}]
+            json.dump({"input": "data", "reports": reports}, plan_file)
+        input_path, reports = read_plan(filename)
+        self.assertEqual(input_path, "data")
+        self.assertEqual([report["output"] for report in reports], ["a.csv", "b.csv"])
+        with open(filename, "w") as plan_file:
+            json.dump({"input": "data", "reports": []}, plan_file)
+        self.assertRaises(Exception, read_plan, filename)
+
+    def test_filter_table(self):
+        table = make_table([NORTH, SOUTH], minutes_apart=11)
+        self.assertEqual(list(filter_table(table, read_filters({"direction": "north"})).speeds),
+                         [20, 26, 30, 24, 28, 33])
+        self.assertEqual(len(filter_table(table, read_filters({"direction": "East"}))), 0)
+
+    def test_plan_statistics(self):
+        table = make_table([NORTH, SOUTH], minutes_apart=11)
+        reports = [read_report(report) for report in [
+            {"output": "a.csv", "interval": 15},
+            {"output": "b.csv", "interval": 30},
+            {"output": "c.csv", "interval": 15, "detail": True},
+            {"output": "d.csv", "interval": 15, "filters": {"direction": "South"}},
+            {"output": "e.csv", "interval": 15, "group_by": "direction"},
+            {"output": "f.csv", "interval": 15, "filters": {"direction": "East"}}]]
+        report_stats = plan_statistics(table, reports)
+        self.assertTrue(report_stats[0] is report_stats[2])
+        for idx, data, interval in [(0, table, 15), (1, table, 30), (3, table.take(range(6, 10)), 15)]:
+            expected = group_statistics(compute_statistics(bucket_data(data, interval * 60), ()), ())
+            self.assertEqual(report_stats[idx].keys(), [()])
+            self.assertEqual(without_histograms(report_stats[idx][()]), without_histograms(expected))
+        self.assertEqual(report_stats[4].keys(), [("North",), ("South",)])
+        self.assertEqual(without_histograms(report_stats[4][("South",)]),
+                         without_histograms(report_stats[3][()]))
+        self.assertEqual(report_stats[5], {(): {}})
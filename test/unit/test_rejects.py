@@ -0,0 +1,69 @@
+"""Tests of rejected vehicle reporting"""
+from unittest import TestCase
+from mock import MagicMock, patch
+import csv
+import json
+import os
+import shutil
+import tempfile
+from toofast.rejects import RejectedRows, RejectSink
+
+
+def make_rejected(filename, count):
+    rejected = RejectedRows(filename)
+    rejected.add(1, ("Vehicle", "Time", "Speed"), "null")
+    for line_num in xrange(2, count + 2):
+        rejected.add(line_num, (str(line_num), "5:00", "bogus"), "non_digit")
+    return rejected
+
+
+class RejectsTests(TestCase):
+    """Tests of rejected vehicle reporting"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_rejected_rows_only_keeps_non_null_rows(self):
+        rejected = make_rejected("a.csv", 2)
+        self.assertEqual(rejected.counts, {"null": 1, "non_digit": 2})
+        self.assertEqual([row[0] for row in rejected.rows], [2, 3])
+
+    def test_log_limit(self):
+        logging_mock = MagicMock()
+        with patch("logging.info", logging_mock):
+            with RejectSink(log_limit=3) as rejects:
+                rejects.report(make_rejected("a.csv", 2))
+                rejects.report(make_rejected("b.csv", 0))
+                rejects.report(make_rejected("c.csv", 2))
+        messages = [call[0][0] % call[0][1:] for call in logging_mock.call_args_list]
+        self.assertEqual(len(messages), 6)
+        self.assertEqual(messages[0], "'a.csv' rejected 2 vehicles (non_digit: 2)")
+        self.assertTrue("'a.csv':2" in messages[1])
+        self.assertTrue("'c.csv':2" in messages[4])
+        self.assertTrue("first 3" in messages[5])
+
+    def test_csv_quarantine(self):
+        quarantine = os.path.join(self.tempdir, "rejects.csv")
+        with patch("logging.info"):
+            with RejectSink(quarantine) as rejects:
+                rejects.report(make_rejected("a.csv", 2))
+        with open(quarantine) as rejects_file:
+            rows = list(csv.reader(rejects_file))
+        self.assertEqual(rows, [["filename", "line", "reason", "vehicle", "time", "speed"],
+                                ["a.csv", "2", "non_digit", "2", "5:00", "bogus"],
+                                ["a.csv", "3", "non_digit", "3", "5:00", "bogus"]])
+
+    def test_jsonl_quarantine(self):
+        quarantine = os.path.join(self.tempdir, "rejects.jsonl")
+        with patch("logging.info"):
+            with RejectSink(quarantine) as rejects:
+                rejects.report(make_rejected("a.csv", 1))
+        with open(quarantine) as rejects_file:
+            rows = [json.loads(line) for line in rejects_file]
+        self.assertEqual(rows, [{"filename": "a.csv", "line": 2, "reason": "non_digit",
+                                 "cells": ["2", "5:00", "bogus"]}])
@@ -0,0 +1,83 @@
+"""Tests of the report server"""
+from unittest import TestCase
+from mock import MagicMock, patch
+import json
+import os
+import shutil
+import tempfile
+import threading
+import urllib2
+from toofast.flat_input import parse_metadata
+from toofast.report_server import ReportCache, ReportServer, make_server, report_parameters
+from helpers import write_sheet
+
+
+class ReportServerTests(TestCase):
+    """Tests of the report server"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+        write_sheet(os.path.join(self.tempdir, "a.csv"), [(1, "6:56", 44), (2, "7:01", 30)])
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = ReportCache(max_bytes=10)
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        cache.get("a")
+        cache.put("c", "cccc")
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), "aaaa")
+        self.assertEqual(cache.size, 8)
+        cache.put("d", "d" * 11)
+        self.assertEqual(cache.get("d"), None)
+
+    def test_report_is_cached(self):
+        reports = ReportServer(self.tempdir)
+        compute_mock = MagicMock(side_effect=reports.compute_report)
+        with patch.object(reports, "compute_report", compute_mock):
+            first = reports.report(interval=60)
+            self.assertEqual(reports.report(interval=60), first)
+        first = json.loads(first)
+        self.assertEqual(compute_mock.call_count, 1)
+        self.assertEqual([row["when"] for row in first["rows"]], ["06:00:00", "07:00:00"])
+        self.assertEqual(first["rows"][0]["max"], 44.0)
+
+    def test_changed_input_is_reloaded(self):
+        reports = ReportServer(self.tempdir)
+        self.assertEqual(len(json.loads(reports.report(interval=60))["rows"]), 2)
+        write_sheet(os.path.join(self.tempdir, "b.csv"), [(1, "8:15", 25)])
+        with patch("toofast.report_server.CHECK_INTERVAL", 0):
+            self.assertEqual(len(json.loads(reports.report(interval=60))["rows"]), 3)
+        self.assertEqual(len(reports.table), 3)
+
+    def test_counter_export_with_metadata(self):
+        with open(os.path.join(self.tempdir, "b.csv"), "w") as export:
+            export.write("timestamp,speed\n2015-08-10 08:15:00,25\n")
+        self.assertRaises(Exception, ReportServer, self.tempdir)
+        reports = ReportServer(self.tempdir, metadata=parse_metadata("speed_limit=25"))
+        self.assertEqual(len(reports.table), 3)
+
+    def test_report_parameters(self):
+        self.assertEqual(report_parameters("interval=30&detail=1"),
+                         {"interval": 30, "min_count": 0, "detail": True})
+        self.assertRaises(ValueError, report_parameters, "interval=0")
+        self.assertRaises(ValueError, report_parameters, "min_count=many")
+
+    def test_http_report(self):
+        server = make_server(ReportServer(self.tempdir), port=0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = "http://127.0.0.1:{}/report?interval=60&detail=1".format(server.server_port)
+            report = json.load(urllib2.urlopen(url))
+            self.assertEqual(report["rows"][0], {"when": "06:00:00", "30-35": None, "40-45": 1})
+            self.assertRaises(urllib2.HTTPError, urllib2.urlopen, url.replace("/report", "/other"))
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
@@ -0,0 +1,47 @@
+"""Tests of synthetic speed study generation"""
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+from collections import Counter
+from toofast.parse_input import read_data_table
+from toofast.synthetic import generate_study
+
+
+class SyntheticTests(TestCase):
+    """Tests of synthetic speed study generation"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def test_generated_study_parses(self):
+        valid = generate_study(self.tempdir, files=3, vehicles=400, seed=1, invalid_rate=0.1)
+        self.assertEqual(len(os.listdir(self.tempdir)), 3)
+        table = read_data_table(self.tempdir)
+        self.assertEqual(len(table), valid)
+        self.assertTrue(300 < valid < 400)
+        self.assertEqual(len(table.sessions), 3)
+
+    def test_invalid_entries_are_rejected_for_every_reason(self):
+        counters = Counter()
+        valid = generate_study(self.tempdir, files=1, vehicles=150, seed=3, invalid_rate=1.0)
+        self.assertEqual(valid, 0)
+        self.assertEqual(len(read_data_table(self.tempdir, counters=counters)), 0)
+        for reason in ["null", "non_digit", "out_of_range"]:
+            self.assertTrue(counters["rejected_" + reason] > 0)
+        self.assertEqual(counters["rejected_null"] + counters["rejected_non_digit"] +
+                         counters["rejected_out_of_range"], 150)
+
+    def test_same_seed_same_study(self):
+        other_dir = os.path.join(self.tempdir, "other")
+        generate_study(self.tempdir, files=1, vehicles=50, seed=7)
+        generate_study(other_dir, files=1, vehicles=50, seed=7)
+        filename = "Synthetic Speed Study - 00000.csv"
+        with open(os.path.join(self.tempdir, filename)) as first:
+            with open(os.path.join(other_dir, filename)) as second:
+                self.assertEqual(first.read(), second.read())
@@ -0,0 +1,54 @@
+"""Tests of the columnar vehicle table"""
+from unittest import TestCase
+from array import array
+from toofast.parse_time import to_epoch
+from helpers import make_table
+
+FIVE_AM = to_epoch("1/1/2016", "5:00")
+
+
+class VehicleTableTests(TestCase):
+    """Tests of the columnar vehicle table"""
+
+    def test_append(self):
+        table = make_table([("North", "25", [20, 30])])
+        self.assertEqual(len(table), 2)
+        self.assertEqual(list(table.speeds), [20, 30])
+        self.assertEqual(list(table.datetimes), [FIVE_AM, FIVE_AM + 7 * 60])
+        self.assertEqual(table.speed_limit(1), 25.0)
+        self.assertEqual(table[1]["speed"], 30)
+        self.assertEqual(table[1]["date"], "1/1/2016")
+
+    def test_sessions_are_shared(self):
+        table = make_table([("North", "25", [20, 30, 40])])
+        self.assertEqual(len(table.sessions), 1)
+        self.assertTrue(table.header(0) is table.header(2))
+
+    def test_extend_offsets_sessions(self):
+        table = make_table([("North", "25", [20])])
+        table.extend(make_table([("North", "25", [30, 40])], date="1/2/2016"))
+        self.assertEqual(list(table.speeds), [20, 30, 40])
+        self.assertEqual(list(table.session_index), [0, 1, 1])
+        self.assertEqual(table.header(2)["date"], "1/2/2016")
+
+    def test_take(self):
+        subset = make_table([("North", "25", [20, 30, 40])]).take([2, 0])
+        self.assertEqual(list(subset.speeds), [40, 20])
+        self.assertEqual(list(subset.datetimes), [FIVE_AM + 14 * 60, FIVE_AM])
+        self.assertEqual(subset.speed_limit(0), 25.0)
+
+    def test_add_columns(self):
+        table = make_table([("North", "25", [20])])
+        table.add_columns(0, array('B', [30, 40]), array('l', [2000, 2001]), array('H', [1, 2]))
+        self.assertEqual(list(table.speeds), [20, 30, 40])
+        self.assertEqual(list(table.session_index), [0, 0, 0])
+        self.assertEqual(table[2]["datetime"], 2001)
+
+    def test_partition(self):
+        table = make_table([("North", "25", [20, 30])])
+        table.extend(make_table([("North", "25", [40])], date="1/2/2016"))
+        table.extend(make_table([("North", "25", [50])]))
+        partitions = table.partition(["date"])
+        self.assertEqual(sorted(partitions), [("1/1/2016",), ("1/2/2016",)])
+        self.assertEqual(list(partitions[("1/1/2016",)].speeds), [20, 30, 50])
+        self.assertEqual(partitions[("1/2/2016",)][0]["date"], "1/2/2016")
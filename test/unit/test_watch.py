@@ -0,0 +1,72 @@
+"""Tests of watching a directory"""
+from unittest import TestCase
+from mock import patch
+import os
+import shutil
+import tempfile
+from toofast.analyse_data import bucket_data, compute_statistics
+from toofast.parse_input import read_data_table, read_table_file
+from toofast.watch import DirectoryWatcher, IncrementalStatistics, watch_statistics
+from helpers import without_histograms, write_sheet
+
+
+class WatchTests(TestCase):
+    """Tests of watching a directory"""
+
+    def setUp(self):
+        """Pre-test setup"""
+        self.tempdir = tempfile.mkdtemp()
+        self.a_csv = os.path.join(self.tempdir, "a.csv")
+        self.b_csv = os.path.join(self.tempdir, "b.csv")
+        write_sheet(self.a_csv, [(1, "6:56", 44), (2, "7:01", 30), (3, "7:14", 28)])
+        write_sheet(self.b_csv, [(1, "7:05", 22), (2, "8:20", 35)], speed_limit=30)
+
+    def tearDown(self):
+        """Post-test cleanup"""
+        shutil.rmtree(self.tempdir)
+
+    def expected_statistics(self, block_duration):
+        buckets = bucket_data(read_data_table(self.tempdir), block_duration)
+        return without_histograms(compute_statistics(buckets))
+
+    def incremental_statistics(self, block_duration, filenames):
+        incremental = IncrementalStatistics(block_duration)
+        for filename in filenames:
+            incremental.add_file(filename, read_table_file(filename))
+        return incremental
+
+    def test_matches_full_statistics(self):
+        for block_duration in [300, 900, 3600]:
+            incremental = self.incremental_statistics(block_duration, [self.b_csv, self.a_csv])
+            self.assertEqual(without_histograms(incremental.statistics()),
+                             self.expected_statistics(block_duration))
+
+    def test_modified_and_removed_files(self):
+        incremental = self.incremental_statistics(900, [self.a_csv, self.b_csv])
+        write_sheet(self.b_csv, [(1, "9:40", 31)], speed_limit=30)
+        incremental.add_file(self.b_csv, read_table_file(self.b_csv))
+        self.assertEqual(without_histograms(incremental.statistics()), self.expected_statistics(900))
+        incremental.remove_file(self.b_csv)
+        os.remove(self.b_csv)
+        self.assertEqual(without_histograms(incremental.statistics()), self.expected_statistics(900))
+        incremental.remove_file(self.a_csv)
+        self.assertEqual(incremental.statistics(), {})
+        self.assertEqual(incremental.steps, {})
+
+    def test_directory_watcher(self):
+        watcher = DirectoryWatcher(self.tempdir)
+        self.assertEqual(watcher.poll(), ([self.a_csv, self.b_csv], []))
+        self.assertEqual(watcher.poll(), ([], []))
+        write_sheet(self.a_csv, [(1, "6:56", 44), (2, "7:01", 30), (3, "7:14", 28), (4, "7:20", 26)])
+        os.utime(self.a_csv, (0, 0))
+        os.remove(self.b_csv)
+        self.assertEqual(watcher.poll(), ([self.a_csv], [self.b_csv]))
+        watcher.forget(self.a_csv)
+        self.assertEqual(watcher.poll(), ([self.a_csv], []))
+
+    def test_watch_statistics_yields_on_changes(self):
+        with patch("time.sleep"), patch("logging.info"):
+            watching = watch_statistics(self.tempdir, 3600, poll_interval=0)
+            self.assertEqual(without_histograms(next(watching)), self.expected_statistics(3600))
+            os.remove(self.b_csv)
+            self.assertEqual(without_histograms(next(watching)), self.expected_statistics(3600))
@@ -0,0 +1,86 @@
+'''
+Partial aggregate state files
+
+A state file holds everything needed to produce a report for each time of day:
+the speed histogram, legal count and speed limit. State files from different
+machines can be merged without any raw data. Merging is associative, so any
+number of states can be reduced in any grouping and give the same result.
+
+States are JSON of the form:
+{
+    "version": 1,
+    "interval": 900,
+    "buckets": {
+        "05:00:00": {"limit": 25.0, "count_legal": 13, "histogram": [0, 0, 1, ...]}
+    }
+}
+'''
+import json
+from .analyse_data import combine_stats
+from .constants import MINIMUM_SPEED, MAXIMUM_SPEED
+from .histogram import SpeedHistogram
+from .output_files import atomic_output
+
+STATE_VERSION = 1
+
+
+def statistics_state(grouped_stats, block_duration):
+    '''Returns the state for statistics grouped by time of day by group_statistics'''
+    return {
+        "version": STATE_VERSION,
+        "interval": block_duration,
+        "minimum_speed": MINIMUM_SPEED,
+        "maximum_speed": MAXIMUM_SPEED,
+        "buckets": {
+            when: {
+                "limit": stat["limit"],
+                "count_legal": stat["count_legal"],
+                "histogram": stat["_histogram"].counts.tolist()}
+            for when, stat in grouped_stats.iteritems()}
+    }
+
+
+def state_statistics(state):
+    '''Returns the statistics grouped by time of day that a state holds'''
+    return {
+        str(when): combine_stats([{"limit": bucket["limit"], "count_legal": bucket["count_legal"],
+                                   "_histogram": SpeedHistogram(bucket["histogram"])}])
+        for when, bucket in state["buckets"].iteritems()}
+
+
+def merge_states(states):
+    '''
+    Merges a list of states into one
+
+    All the states must share the same interval. Each time of day keeps the
+    speed limit of the first state it appears in.
+    '''
+    intervals = set(state["interval"] for state in states)
+    if len(intervals) != 1:
+        raise Exception("Unable to merge states with different intervals {}".format(sorted(intervals)))
+    tod_stats = {}
+    for state in states:
+        for when, stat in state_statistics(state).iteritems():
+            tod_stats.setdefault(when, []).append(stat)
+    grouped_stats = {when: combine_stats(stats) for when, stats in tod_stats.iteritems()}
+    return statistics_state(grouped_stats, intervals.pop())
+
+
+def write_state(filename, state):
+    '''Writes a state to a file atomically with atomic_output'''
+    with atomic_output(filename) as state_file:
+        json.dump(state, state_file, sort_keys=True)
+
+
+def read_state(filename):
+    '''
+    Reads a state from a file
+
+    An exception is raised if the state was written by an incompatible version.
+    '''
+    with open(filename) as state_file:
+        state = json.load(state_file)
+    if state.get("version") != STATE_VERSION or \
+            (state["minimum_speed"], state["maximum_speed"]) != (MINIMUM_SPEED, MAXIMUM_SPEED):
+        raise Exception("Incompatible state file {}".format(filename))
+    return state
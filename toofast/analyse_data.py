@@ -1,74 +1,264 @@
 """
 Analyse our speeding data
 """
+import fractions
+import functools
 import math
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
+from .histogram import SpeedHistogram
+from .parse_time import SECONDS_PER_MINUTE, SECONDS_PER_HOUR, SECONDS_PER_DAY
+from .vehicle_table import VehicleTable
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# The columns of a statistics report, which are the public keys of speed_statistics in sorted order
+STATISTICS_COLUMNS = ["%legal", "50%", "85%", "99%", "count", "count_legal", "diff", "limit", "max", "mean",
+                      "min"]
+
+# The statistics every bucket has, along with its "_histogram". These are all that
+# combining buckets needs, so they are kept however the statistics are computed.
+BASE_STATISTICS = ["count", "count_legal", "limit"]
+
+# Every other statistic by name, as the function computing it from a bucket's
+# statistics and the names of the statistics that function uses
+STATISTICS = OrderedDict()
 
 
 def min_timekey(datetimes):
-    '''Finds minumum times from a list'''
-    min_datetime = min(datetimes) + 0  # + 0 forces copy
-    min_datetime.minute = 0
-    return min_datetime
+    '''Finds the start of the hour containing the minumum epoch time in a list'''
+    min_datetime = min(datetimes)
+    return min_datetime - min_datetime % SECONDS_PER_HOUR
 
 
 def get_bucket_name(data_time, min_datetime, block_duration):
-    '''Computes the bucket name based on the data point time'''
-    sec_diff = data_time.to_unixtime() - min_datetime.to_unixtime()
-    sec_diff = int(math.floor(sec_diff / block_duration)) * block_duration
-    date = min_datetime + sec_diff
-    return date.date.timetuple()
+    '''Computes the bucket name, the epoch time the bucket starts at, based on the data point's epoch time'''
+    return min_datetime + (data_time - min_datetime) // block_duration * block_duration
+
+
+def time_of_day_label(data_time):
+    '''Returns the HH:MM:00 time of day label for an epoch time'''
+    minute = data_time % SECONDS_PER_DAY // SECONDS_PER_MINUTE
+    return "{:02}:{:02}:00".format(minute // 60, minute % 60)
 
 
 def bucket_data(data, block_duration):
     '''
     Buckets our data by time of day
 
-    This returns a dictionary where the key is a time.struct_time
+    This returns a dictionary where the key is the integer epoch time
     corresponding to the begining of a bucket's time interval and
     the value is a list of vehicles that fall in the bucket of
     time starting at that time and ending before a block_duration
     number of seconds have elapsed.
 
+    The data may also be a VehicleTable, in which case each bucket
+    is a VehicleTable too. There are no buckets when there is no data.
     '''
+    if not data:
+        return {}
+    if isinstance(data, VehicleTable):
+        return _bucket_table(data, block_duration)
     timekey = "datetime"
     min_datetime = min_timekey([val[timekey] for val in data])
-    buckets = {}
+    buckets = defaultdict(list)
     for vehicle in data:
-        name = get_bucket_name(vehicle[timekey], min_datetime, block_duration)
-        if buckets.get(name):
-            buckets[name].append(vehicle)
-        else:
-            buckets[name] = [vehicle]
-    return buckets
+        buckets[(vehicle[timekey] - min_datetime) // block_duration].append(vehicle)
+    return {min_datetime + bucket_id * block_duration: bucket for bucket_id, bucket in buckets.iteritems()}
+
+
+def _bucket_table(table, block_duration):
+    '''
+    Buckets a VehicleTable by time of day working directly on its columns
+
+    With NumPy every vehicle's bucket id is computed at once and the vehicles are
+    split by a stable sort on it, which keeps each bucket's vehicles in table order.
+    '''
+    min_datetime = min_timekey(table.datetimes)
+    if numpy is not None:
+        datetimes = numpy.frombuffer(table.datetimes, dtype=numpy.dtype(table.datetimes.typecode))
+        ids = (datetimes - min_datetime) // block_duration
+        order = numpy.argsort(ids, kind="mergesort")
+        bucket_ids, starts = numpy.unique(ids[order], return_index=True)
+        return {min_datetime + int(bucket_id) * block_duration: table.take(bucket_indices.tolist())
+                for bucket_id, bucket_indices in zip(bucket_ids, numpy.split(order, starts[1:]))}
+    indices = defaultdict(list)
+    for idx, data_time in enumerate(table.datetimes):
+        indices[(data_time - min_datetime) // block_duration].append(idx)
+    return {min_datetime + bucket_id * block_duration: table.take(bucket_indices)
+            for bucket_id, bucket_indices in indices.iteritems()}
+
+
+def register_statistic(name, func, depends=()):
+    '''
+    Registers a statistic that reports can ask for by name
+
+    The func is given the statistics of a bucket, which hold its BASE_STATISTICS,
+    its "_histogram" and every statistic named in depends, and returns the value.
+    '''
+    STATISTICS[name] = (func, tuple(depends))
+
+
+def _percentile(fraction, stat):
+    '''Returns a percentile of the speeds in a bucket'''
+    return stat["_histogram"].percentile(fraction)
+
+
+register_statistic("%legal", lambda stat: 100.0 * stat["count_legal"] / stat["count"])
+register_statistic("50%", functools.partial(_percentile, 0.50))
+register_statistic("85%", functools.partial(_percentile, 0.85))
+register_statistic("99%", functools.partial(_percentile, 0.99))
+register_statistic("min", lambda stat: stat["_histogram"].min())
+register_statistic("max", lambda stat: stat["_histogram"].max())
+register_statistic("diff", lambda stat: stat["max"] - stat["min"], ["max", "min"])
+register_statistic("mean", lambda stat: stat["_histogram"].mean())
+
+
+def statistics_columns(columns):
+    '''
+    Returns the registered statistics needed for some columns, each after the ones it depends on
+
+    An exception is raised for any column that isn't a statistic.
+    '''
+    needed = []
 
+    def need(name):
+        '''Adds a statistic and its dependencies to the ones needed'''
+        if name in BASE_STATISTICS or name in needed:
+            return
+        if name not in STATISTICS:
+            raise Exception("Unknown statistic {}, expected any of {}".format(
+                name, ", ".join(BASE_STATISTICS + STATISTICS.keys())))
+        for dependency in STATISTICS[name][1]:
+            need(dependency)
+        needed.append(name)
 
-def compute_statistics(buckets):
-    '''Computes all the statistics we might want to know about a time series'''
+    for column in columns:
+        need(column)
+    return needed
+
+
+def parse_columns(text):
+    '''Returns the statistics in a comma separated list such as "count,85%,%legal", checking each is known'''
+    columns = [column.strip() for column in text.split(",")]
+    statistics_columns(columns)
+    return columns
+
+
+def evaluate_statistics(stat, columns):
+    '''Adds the columns, and any statistics they depend on, to the statistics of a bucket and returns them'''
+    for name in statistics_columns(columns):
+        if name not in stat:
+            stat[name] = STATISTICS[name][0](stat)
+    return stat
+
+
+def speed_statistics(histogram, speed_limit, columns=None):
+    '''
+    Computes the statistics for the SpeedHistogram of a single bucket
+
+    Only the BASE_STATISTICS and the given columns are computed, or every one of
+    STATISTICS_COLUMNS if columns is None.
+    '''
+    stat = {
+        "limit": speed_limit,
+        "count_legal": histogram.count_at_most(speed_limit),
+        "count": histogram.count,
+        "_histogram": histogram
+    }
+    return evaluate_statistics(stat, STATISTICS_COLUMNS if columns is None else columns)
+
+
+def compute_statistics(buckets, columns=None):
+    '''
+    Computes all the statistics we might want to know about a time series
+
+    Each bucket may be a list of vehicles or a VehicleTable. The speeds in
+    each bucket are kept as a SpeedHistogram under the "_histogram" key.
+    The columns computed are as in speed_statistics.
+    '''
     stats = {}
     for name, bucket in buckets.iteritems():
-        speeds = sorted([float(val["speed"]) for val in bucket])
-        if not speeds:
+        if not bucket:
             continue
-        speed_limit = float(bucket[0]["speed limit"])
-        max_speed_index = len(speeds) - 1
-        stats[name] = {
-            "limit": speed_limit,
-            "count_legal": len([spd for spd in speeds if spd <= speed_limit]),
-            "%legal": 100.0 * len([spd for spd in speeds if spd <= speed_limit]) / len(speeds),
-            "min": float(speeds[0]),
-            "max": float(speeds[-1]),
-            "count": len(speeds),
-            "85%": float(speeds[int(math.floor(max_speed_index * 0.85))]),
-            "99%": float(speeds[int(math.floor(max_speed_index * 0.99))]),
-            "diff": float(speeds[-1]) - float(speeds[0]),
-            "mean": float(sum(speeds)) / len(speeds),
-            "50%": float(speeds[int(math.floor(max_speed_index * 0.50))]),
-            "_speeds": speeds
-        }
+        if isinstance(bucket, VehicleTable):
+            speeds, speed_limit = bucket.speeds, bucket.speed_limit(0)
+        else:
+            speeds, speed_limit = [val["speed"] for val in bucket], bucket[0]["speed limit"]
+        stats[name] = speed_statistics(SpeedHistogram.from_speeds(speeds), float(speed_limit), columns)
     return stats
 
 
+def stream_statistics(vehicles, block_duration, columns=None):
+    '''
+    Computes the same statistics as compute_statistics(bucket_data(...)) in one pass
+
+    The vehicles may be any iterable and are consumed one at a time. Each bucket
+    only keeps a SpeedHistogram of its speeds, so memory use is bounded by the
+    number of buckets rather than the number of vehicles.
+
+    Buckets begin on the hour of the earliest vehicle, which we only know at the
+    end. Every bucket boundary is a multiple of the greatest common divisor of an
+    hour and the block_duration, so we accumulate at that step and roll the steps
+    up into buckets once all the vehicles have been seen. The columns computed
+    are as in speed_statistics.
+    '''
+    return stream_partition_statistics(vehicles, block_duration, [], columns).get((), {})
+
+
+def stream_partition_statistics(vehicles, block_duration, keys, columns=None):
+    '''
+    Streams vehicles into separate statistics for each partition of them
+
+    A partition is every vehicle with the same values for the given file header
+    keys, e.g. ["location", "direction"]. Returns a dictionary of the statistics
+    of each partition, as stream_statistics computes them, keyed by the tuple of
+    its values.
+    '''
+    step = statistics_step(block_duration)
+    partitions = defaultdict(OrderedDict)
+    for vehicle in vehicles:
+        steps = partitions[tuple(vehicle[key] for key in keys)]
+        key = vehicle["datetime"] // step
+        if key not in steps:
+            steps[key] = (float(vehicle["speed limit"]), SpeedHistogram())
+        steps[key][1].add(vehicle["speed"])
+    return {partition: step_statistics(steps, step, block_duration, columns)
+            for partition, steps in partitions.iteritems()}
+
+
+def statistics_step(block_duration):
+    '''Returns the duration every bucket boundary is a multiple of, whichever hour the buckets begin on'''
+    return fractions.gcd(block_duration, SECONDS_PER_HOUR)
+
+
+def step_statistics(steps, step, block_duration, columns=None):
+    '''
+    Computes statistics for block_duration long buckets from step long ones
+
+    The steps are an OrderedDict mapping each epoch time // step to its speed limit
+    and SpeedHistogram, in the order their first vehicles were seen. The columns
+    computed are as in speed_statistics.
+    '''
+    if not steps:
+        return {}
+
+    # steps are in the order they were first seen, so each bucket's
+    # speed limit comes from its first vehicle just like compute_statistics
+    min_datetime = min_timekey([key * step for key in steps])
+    buckets = OrderedDict()
+    for key, (speed_limit, histogram) in steps.iteritems():
+        name = get_bucket_name(key * step, min_datetime, block_duration)
+        if name in buckets:
+            bucket_histogram = buckets[name][1]
+            bucket_histogram += histogram
+        else:
+            buckets[name] = (speed_limit, histogram.copy())
+    return {name: speed_statistics(histogram, speed_limit, columns)
+            for name, (speed_limit, histogram) in buckets.iteritems()}
+
+
 def count_speeds(speeds):
     '''
     Count the speeds in each 5 mph interval
@@ -77,53 +267,162 @@ def count_speeds(speeds):
     a count of values found between that value and 5 mph faster.
 
     i.e. {"10": 2, "15": 5, "20": 2}
+
+    The speeds may also be given as a SpeedHistogram or a VehicleTable.
     '''
+    if isinstance(speeds, VehicleTable):
+        speeds = speeds.speeds
+    if isinstance(speeds, SpeedHistogram):
+        counted_speeds = speeds.speeds()
+    else:
+        counted_speeds = ((speed, 1) for speed in speeds)
     speedbuckets = defaultdict(int)
-    for speed in speeds:
-        speedbuckets[int(math.floor(speed / 5) * 5)] += 1
+    for speed, count in counted_speeds:
+        speedbuckets[int(math.floor(speed / 5) * 5)] += count
     return {"{}-{}".format(key, key + 5): value
             for key, value in speedbuckets.iteritems()}
 
 
-def combine_stats(stats):
-    '''Given a list of stats compute combined statistics'''
-    count = sum([stat["count"] for stat in stats])
-    count_legal = sum([stat["count_legal"] for stat in stats])
-    inv_stat_cnt = 1.0 / len(stats)
-    min_spd = min([stat["min"] for stat in stats])
-    max_spd = max([stat["max"] for stat in stats])
-    speeds = []
+def combine_stats(stats, columns=None):
+    '''
+    Given a list of stats compute combined statistics
+
+    The speed histograms are merged so the percentiles and mean are exact over
+    all of the combined vehicles. Legal counts are summed, so each keeps the
+    speed limit it was computed against. The columns computed are as in
+    speed_statistics.
+    '''
+    histogram = SpeedHistogram()
     for stat in stats:
-        speeds += stat["_speeds"]
-    return {
-        "limit": stats[0]["limit"],
-        "count_legal": count_legal,
-        "count": count,
-        "%legal": count_legal * 100.0 / count,
-        "min": min_spd,
-        "max": max_spd,
-        "85%": sum([stat["85%"] for stat in stats]) * inv_stat_cnt,
-        "99%": sum([stat["99%"] for stat in stats]) * inv_stat_cnt,
-        "diff": max_spd - min_spd,
-        "mean": sum([stat["mean"] for stat in stats]) * inv_stat_cnt,
-        "50%": sum([stat["50%"] for stat in stats]) * inv_stat_cnt,
-        "_speeds": speeds
-    }
+        histogram += stat["_histogram"]
+    combined = speed_statistics(histogram, stats[0]["limit"], columns=())
+    combined["count_legal"] = sum([stat["count_legal"] for stat in stats])
+    return evaluate_statistics(combined, STATISTICS_COLUMNS if columns is None else columns)
+
+
+def rollup_statistics(stats, block_duration, columns=None):
+    '''
+    Rolls statistics computed for short buckets up into block_duration long buckets
+
+    The block_duration must be a multiple of the duration the stats were bucketed
+    with. Each rolled up bucket combines the histograms of the buckets it covers,
+    so no vehicles need to be looked at again.
+    '''
+    min_datetime = min_timekey(stats)
+    rolled_up = defaultdict(list)
+    for name, stat in sorted(stats.iteritems()):
+        rolled_up[get_bucket_name(name, min_datetime, block_duration)].append(stat)
+    return {name: combine_stats(group, columns) for name, group in rolled_up.iteritems()}
+
 
+def finest_interval(block_durations):
+    '''Returns the longest bucket duration that all of the block_durations are multiples of'''
+    return reduce(fractions.gcd, block_durations)
 
-def group_statistics(stats):
-    '''Group our statistics by time of day'''
-    # remap stats by time of day tuple (hour,minute)
-    tod_stat = {}
-    for when, stat in stats.iteritems():
-        tod = (when.tm_hour, when.tm_min)
-        if tod_stat.get(tod):
-            tod_stat[tod].append(stat)
+
+def rollup_intervals(stats, block_durations, columns=None):
+    '''
+    Returns a dictionary of statistics for each of the block_durations
+
+    The stats must have been bucketed at finest_interval(block_durations). The
+    stats of the finest interval are returned as they are, and those rolled up
+    have the given columns as in speed_statistics.
+    '''
+    finest = finest_interval(block_durations)
+    intervals = {}
+    for block_duration in block_durations:
+        if block_duration == finest:
+            intervals[block_duration] = stats
         else:
-            tod_stat[tod] = [stat]
-    return {
-        str("{:02}:{:02}:00".format(when[0], when[1])):
-        combine_stats(group_stats) for when, group_stats in tod_stat.iteritems()}
+            intervals[block_duration] = rollup_statistics(stats, block_duration, columns)
+    return intervals
+
+
+def bucket_runs(names, block_duration, step):
+    '''
+    Splits sorted bucket names into runs, starting a new run wherever the gap between
+    two buckets is wide enough to hold an empty block_duration window
+
+    Returns a [first slot, last slot, names] list for each run, where the slots are the
+    starts of the step long slots of the sliding_statistics grid holding the run's first
+    and last buckets.
+    '''
+    origin = min_timekey(names)
+    runs = []
+    for name in names:
+        slot = get_bucket_name(name, origin, step)
+        if not runs or slot - runs[-1][1] - step >= block_duration:
+            runs.append([slot, slot, []])
+        runs[-1][1] = slot
+        runs[-1][2].append(name)
+    return runs
+
+
+def sliding_statistics(stats, block_duration, step, columns=None):
+    '''
+    Computes statistics for block_duration long windows starting every step from step long buckets
+
+    Windows start every step along the same grid as tumbling buckets, which begin
+    on the hour of the earliest bucket. Only windows lying wholly within a run of
+    observed buckets are included, from the one starting with the run's first bucket
+    to the one ending with its last, so no window reaches past the start or end of
+    the observations and a run shorter than block_duration has no windows at all.
+    The block_duration must be a multiple of the step the stats were bucketed with.
+
+    The window's histogram and legal count are kept as it slides along, adding the
+    bucket entering the window and subtracting the one leaving it, so each window
+    costs the same however many buckets it covers. The columns computed are as in
+    speed_statistics.
+    '''
+    if not stats:
+        return {}
+    windows = {}
+    for first, last, run in bucket_runs(sorted(stats), block_duration, step):
+        window = deque()
+        histogram = SpeedHistogram()
+        count_legal = 0
+        entering = 0
+        for start in xrange(first, last + step - block_duration + 1, step):
+            while entering < len(run) and run[entering] < start + block_duration:
+                stat = stats[run[entering]]
+                histogram += stat["_histogram"]
+                count_legal += stat["count_legal"]
+                window.append((run[entering], stat))
+                entering += 1
+            while window[0][0] < start:
+                _, stat = window.popleft()
+                histogram -= stat["_histogram"]
+                count_legal -= stat["count_legal"]
+            windows[start] = speed_statistics(histogram.copy(), window[0][1]["limit"], columns=())
+            windows[start]["count_legal"] = count_legal
+            evaluate_statistics(windows[start], STATISTICS_COLUMNS if columns is None else columns)
+    return windows
+
+
+def sliding_intervals(stats, block_durations, step, columns=None):
+    '''
+    Returns a dictionary of statistics for windows of each of the block_durations starting every step
+
+    The stats must have been bucketed at step.
+    '''
+    return {block_duration: sliding_statistics(stats, block_duration, step, columns)
+            for block_duration in block_durations}
+
+
+def interval_statistics(data, block_durations):
+    '''Buckets data once at the finest resolution and returns statistics for each of the block_durations'''
+    return rollup_intervals(compute_statistics(bucket_data(data, finest_interval(block_durations))),
+                            block_durations)
+
+
+def group_statistics(stats, columns=None):
+    '''Group our statistics by time of day, computing the columns as in speed_statistics'''
+    # remap stats by their time of day label, in time order so that
+    # combining them always sums in the same order
+    tod_stat = defaultdict(list)
+    for when, stat in sorted(stats.iteritems()):
+        tod_stat[time_of_day_label(when)].append(stat)
+    return {when: combine_stats(group_stats, columns) for when, group_stats in tod_stat.iteritems()}
 
 
 def filter_statistics(stats, min_count):
@@ -0,0 +1,138 @@
+'''
+Before and after comparisons
+
+To tell whether traffic calming worked, the statistics of a study after the
+change are compared with those of a study before it for each time of day. Each
+statistic is reported before, after and as the change from before to after,
+along with two tests of whether the speeds after differ from the speeds before:
+
+    mann_whitney_z, mann_whitney_p
+        The Mann-Whitney U test with a correction for ties, as a z score that is
+        negative when the speeds after tend to be lower, and its two sided p value
+    ks_d, ks_p
+        The two sample Kolmogorov-Smirnov statistic, the largest gap between the
+        distributions of the speeds before and after, and its asymptotic p value
+
+Speeds are whole numbers, so both tests are computed straight from the counts in
+the speed histograms in O(bins), however many vehicles they hold.
+'''
+import math
+from collections import OrderedDict
+from .analyse_data import evaluate_statistics, filter_statistics
+
+# The columns of each time of day's test results
+TEST_COLUMNS = ["mann_whitney_z", "mann_whitney_p", "ks_d", "ks_p"]
+
+
+def mann_whitney(before, after):
+    '''
+    Returns the U statistic of the after SpeedHistogram, its z score and the two sided p value
+
+    U counts the pairs of a vehicle before and a vehicle after where the one after
+    was faster, counting ties as half. The z score uses the normal approximation
+    with the tie correction and a continuity correction.
+    '''
+    if not before.count or not after.count:
+        return 0.0, 0.0, 1.0
+    u_after = 0.0
+    below = 0
+    ties = 0
+    for before_count, after_count in zip(before.counts, after.counts):
+        u_after += after_count * (below + before_count / 2.0)
+        below += before_count
+        tied = before_count + after_count
+        ties += tied ** 3 - tied
+    total = before.count + after.count
+    mean = before.count * after.count / 2.0
+    variance = before.count * after.count / 12.0 * ((total + 1) - float(ties) / (total * (total - 1)))
+    if variance <= 0:
+        return u_after, 0.0, 1.0
+    difference = u_after - mean
+    z_score = math.copysign(max(abs(difference) - 0.5, 0.0), difference) / math.sqrt(variance)
+    return u_after, z_score, math.erfc(abs(z_score) / math.sqrt(2))
+
+
+def kolmogorov_p(statistic):
+    '''Returns the probability of a Kolmogorov distributed variable exceeding statistic'''
+    if statistic <= 0:
+        return 1.0
+    total = 0.0
+    previous = 0.0
+    for idx in xrange(1, 101):
+        term = 2 * (-1) ** (idx - 1) * math.exp(-2 * (idx * statistic) ** 2)
+        total += term
+        if abs(term) <= 0.001 * previous or abs(term) <= 1e-8 * total:
+            return min(max(total, 0.0), 1.0)
+        previous = abs(term)
+    # The series doesn't converge for small statistics, which are not significant at all
+    return 1.0
+
+
+def kolmogorov_smirnov(before, after):
+    '''Returns the two sample Kolmogorov-Smirnov statistic of two SpeedHistograms and its p value'''
+    if not before.count or not after.count:
+        return 0.0, 1.0
+    distance = 0.0
+    before_below = 0
+    after_below = 0
+    for before_count, after_count in zip(before.counts, after.counts):
+        before_below += before_count
+        after_below += after_count
+        distance = max(distance, abs(float(before_below) / before.count - float(after_below) / after.count))
+    effective = math.sqrt(float(before.count * after.count) / (before.count + after.count))
+    return distance, kolmogorov_p((effective + 0.12 + 0.11 / effective) * distance)
+
+
+def comparison_columns(columns):
+    '''Returns the columns of a comparison report of the given statistics columns'''
+    return ["{}_{}".format(column, side) for column in columns for side in ["before", "after", "change"]] + \
+        TEST_COLUMNS
+
+
+def compare_statistics(before, after, columns):
+    '''
+    Compares two sets of statistics grouped by time of day, returning a row for each time of day
+
+    Each row has the columns of comparison_columns. A time of day that only one of
+    them has only gets that side's statistics.
+    '''
+    rows = {}
+    for when in set(before) | set(after):
+        row = {}
+        sides = [("before", before.get(when)), ("after", after.get(when))]
+        for side, stat in sides:
+            if stat is not None:
+                evaluate_statistics(stat, columns)
+                row.update(("{}_{}".format(column, side), stat[column]) for column in columns)
+        if all(stat is not None for _, stat in sides):
+            before_histogram, after_histogram = before[when]["_histogram"], after[when]["_histogram"]
+            for column in columns:
+                row[column + "_change"] = after[when][column] - before[when][column]
+            _, row["mann_whitney_z"], row["mann_whitney_p"] = mann_whitney(before_histogram, after_histogram)
+            row["ks_d"], row["ks_p"] = kolmogorov_smirnov(before_histogram, after_histogram)
+        rows[when] = row
+    return rows
+
+
+def compare_partitions(before, after, columns, min_count=0):
+    '''
+    Compares two sets of statistics grouped by partition and then time of day, returning an
+    OrderedDict of the rows of compare_statistics for each partition either of them has
+
+    Buckets with min_count vehicles or fewer are left out of both sides first.
+    '''
+    return OrderedDict(
+        (partition, compare_statistics(filter_statistics(before.get(partition, {}), min_count),
+                                       filter_statistics(after.get(partition, {}), min_count), columns))
+        for partition in sorted(set(before) | set(after)))
+
+
+def align_reports(before_reports, after_reports):
+    '''
+    Yields the interval and the before and after statistics grouped by partition for each
+    interval of the before reports, given (interval, grouped statistics, states) reports
+    for each side. An interval the after reports don't have is compared with no statistics.
+    '''
+    after = {delta: grouped_stats for delta, grouped_stats, _ in after_reports}
+    for delta, grouped_stats, _ in before_reports:
+        yield delta, grouped_stats, after.get(delta, {})
@@ -0,0 +1,88 @@
+'''
+Opening data files, compressed or not
+
+Data files may be plain CSV files, CSV files compressed with gzip (.csv.gz) or
+bzip2 (.csv.bz2), or members of a zip archive like the ones Google Sheets
+exports a multi-sheet study as. A zip member is named by the archive's path
+followed by the member's name, e.g. "study.zip/North.csv", and each member is
+read as a data file of its own.
+
+Every file is decompressed as it is read, through a buffer of DATA_BUFFER_SIZE
+bytes, so nothing is ever extracted to disk.
+'''
+import bz2
+import gzip
+import io
+import os
+import zipfile
+from contextlib import contextmanager
+
+DATA_BUFFER_SIZE = 1 << 20
+ZIP_SUFFIX = ".zip"
+
+
+def split_archive(filename):
+    '''
+    Returns the zip archive and member name of a zip member's filename, or (None, None) otherwise
+
+    The filename is only split after a ".zip" that ends the name of an existing zip
+    file, so a directory or anything else named like an archive is left alone.
+    '''
+    end = filename.find(ZIP_SUFFIX + "/")
+    while end >= 0:
+        archive, member = filename[:end + len(ZIP_SUFFIX)], filename[end + len(ZIP_SUFFIX) + 1:]
+        if member and os.path.isfile(archive) and zipfile.is_zipfile(archive):
+            return archive, member
+        end = filename.find(ZIP_SUFFIX + "/", end + 1)
+    return None, None
+
+
+def list_archive(archive):
+    '''Returns the filename of every file in a zip archive in sorted member name order'''
+    with zipfile.ZipFile(archive) as zip_file:
+        members = [info.filename for info in zip_file.infolist() if not info.filename.endswith("/")]
+    return [archive + "/" + member for member in sorted(members)]
+
+
+@contextmanager
+def open_data_file(filename):
+    '''Opens a data file for reading in binary mode, decompressing it as it is read'''
+    archive, member = split_archive(filename)
+    if archive:
+        with zipfile.ZipFile(archive) as zip_file:
+            with io.BufferedReader(zip_file.open(member), DATA_BUFFER_SIZE) as data_file:
+                yield data_file
+    elif filename.endswith(".gz"):
+        with io.BufferedReader(gzip.open(filename, 'rb'), DATA_BUFFER_SIZE) as data_file:
+            yield data_file
+    elif filename.endswith(".bz2"):
+        with bz2.BZ2File(filename, 'rb', DATA_BUFFER_SIZE) as data_file:
+            yield data_file
+    else:
+        with open(filename, 'rb', DATA_BUFFER_SIZE) as data_file:
+            yield data_file
+
+
+def data_file_size(filename):
+    '''Returns the number of bytes a data file takes on disk, compressed if it is'''
+    archive, member = split_archive(filename)
+    if archive:
+        with zipfile.ZipFile(archive) as zip_file:
+            return zip_file.getinfo(member).compress_size
+    return os.path.getsize(filename)
+
+
+def data_file_mtime(filename):
+    '''Returns the modification time of a data file, which for a zip member is that of its archive'''
+    return os.path.getmtime(split_archive(filename)[0] or filename)
+
+
+def data_file_exists(filename):
+    '''Returns True if there is a data file, including a zip member, with the given filename'''
+    archive, member = split_archive(filename)
+    if archive:
+        if not os.path.isfile(archive):
+            return False
+        with zipfile.ZipFile(archive) as zip_file:
+            return member in zip_file.namelist()
+    return os.path.exists(filename)
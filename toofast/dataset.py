@@ -0,0 +1,245 @@
+'''
+Compiled binary datasets
+
+A dataset holds the parsed vehicles from a directory of CSV files so that later
+runs can skip parsing entirely. The file is laid out as:
+
+    MAGIC
+    metadata length as a little endian uint32
+    metadata as JSON
+    padding to an 8 byte boundary
+    the datetimes column, then the timeofdays column, then the speeds column
+
+Each column is a native array of every vehicle, with the vehicles of each source
+file stored contiguously in sorted filename order. The metadata lists the source
+files along with their headers, vehicle counts, mtimes, sizes and SHA-1 hashes
+so that stale files can be detected and recompiled on their own.
+'''
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from .data_files import data_file_mtime, data_file_size, open_data_file
+from .output_files import TEMP_SUFFIX, atomic_output
+from .parse_input import list_data_directory, read_table_files
+from .vehicle_table import VehicleTable
+
+MAGIC = "TOOFAST\x01"
+FORMAT_VERSION = 1
+LENGTH_FORMAT = "<I"
+ALIGNMENT = 8
+# (column, typecode) in the order they are stored
+COLUMNS = [("datetimes", "l"), ("timeofdays", "H"), ("speeds", "B")]
+
+
+def file_hash(filename):
+    '''Returns the SHA-1 hex digest of a file's contents'''
+    sha = hashlib.sha1()
+    with open_data_file(filename) as source:
+        for chunk in iter(lambda: source.read(1 << 20), ""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def source_info(filename):
+    '''Returns the metadata we use to tell whether a source file has changed'''
+    return {"filename": filename, "mtime": data_file_mtime(filename), "size": data_file_size(filename)}
+
+
+def _utf8(value):
+    '''Returns unicode values as UTF-8 strs, which is what the csv module gives us'''
+    return value.encode("utf-8") if isinstance(value, unicode) else value
+
+
+def _utf8_object(obj):
+    '''JSON object hook decoding every key and string value as a str'''
+    return {_utf8(key): _utf8(value) for key, value in obj.iteritems()}
+
+
+def _file_table(header, columns, start, stop):
+    '''Returns a VehicleTable of one file's vehicles given the columns they are stored in'''
+    return VehicleTable.from_columns(
+        header,
+        speeds=columns["speeds"][start:stop],
+        datetimes=columns["datetimes"][start:stop],
+        timeofdays=columns["timeofdays"][start:stop])
+
+
+def is_dataset(filename):
+    '''Returns True if and only if filename is a compiled dataset'''
+    if not os.path.isfile(filename):
+        return False
+    with open(filename, 'rb') as dataset:
+        return dataset.read(len(MAGIC)) == MAGIC
+
+
+def _data_offset(metadata_length):
+    '''Returns where the columns start given the length of the metadata'''
+    offset = len(MAGIC) + struct.calcsize(LENGTH_FORMAT) + metadata_length
+    return offset + (-offset % ALIGNMENT)
+
+
+def read_metadata(dataset):
+    '''Reads the metadata from the start of an open dataset and returns it with the column offset'''
+    if dataset.read(len(MAGIC)) != MAGIC:
+        raise Exception("{} is not a toofast dataset".format(dataset.name))
+    length, = struct.unpack(LENGTH_FORMAT, dataset.read(struct.calcsize(LENGTH_FORMAT)))
+    metadata = json.loads(dataset.read(length), object_hook=_utf8_object)
+    if metadata["version"] != FORMAT_VERSION:
+        raise Exception("Unsupported dataset version {} in {}".format(metadata["version"], dataset.name))
+    if metadata["byteorder"] != sys.byteorder or metadata["itemsizes"] != _itemsizes():
+        raise Exception("Dataset {} was compiled on an incompatible platform".format(dataset.name))
+    return metadata, _data_offset(length)
+
+
+def _itemsizes():
+    '''Returns the item size of each column on this platform'''
+    return {column: array(typecode).itemsize for column, typecode in COLUMNS}
+
+
+def load_dataset(filename):
+    '''
+    Returns the metadata and a VehicleTable for a compiled dataset
+
+    The file is memory mapped and each column is copied straight into its array
+    in one go, so no per vehicle work is done.
+    '''
+    with open(filename, 'rb') as dataset:
+        metadata, offset = read_metadata(dataset)
+        count = sum(source["count"] for source in metadata["files"])
+        columns = {}
+        if count:
+            mapped = mmap.mmap(dataset.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for column, typecode in COLUMNS:
+                    columns[column] = array(typecode)
+                    columns[column].fromstring(buffer(mapped, offset, count * columns[column].itemsize))
+                    offset += count * columns[column].itemsize
+            finally:
+                mapped.close()
+        else:
+            columns = {column: array(typecode) for column, typecode in COLUMNS}
+
+    table = VehicleTable()
+    start = 0
+    for source in metadata["files"]:
+        stop = start + source["count"]
+        table.extend(_file_table(source["header"], columns, start, stop))
+        start = stop
+    return metadata, table
+
+
+def write_dataset(filename, metadata, table):
+    '''Writes a dataset atomically with atomic_output'''
+    metadata = dict(metadata, version=FORMAT_VERSION, byteorder=sys.byteorder, itemsizes=_itemsizes())
+    encoded = json.dumps(metadata, sort_keys=True)
+    with atomic_output(filename) as dataset:
+        dataset.write(MAGIC)
+        dataset.write(struct.pack(LENGTH_FORMAT, len(encoded)))
+        dataset.write(encoded)
+        dataset.write("\0" * (_data_offset(len(encoded)) - dataset.tell()))
+        for column, _ in COLUMNS:
+            getattr(table, column).tofile(dataset)
+
+
+def _unchanged_source(previous, current):
+    '''Returns True if and only if the previous and current info describe the same file'''
+    if not previous:
+        return False
+    if previous["size"] != current["size"]:
+        return False
+    if previous["mtime"] == current["mtime"]:
+        return True
+    current["sha1"] = current.get("sha1") or file_hash(current["filename"])
+    return previous["sha1"] == current["sha1"]
+
+
+def _dataset_paths(filename):
+    '''Returns the paths a dataset is written to, which are never its own source files'''
+    return [filename, filename + TEMP_SUFFIX]
+
+
+def stale_files(metadata, filename=None):
+    '''
+    Returns the source files that were added, changed or deleted since the dataset was compiled
+
+    If the source directory no longer exists there is nothing to compare against, so
+    nothing is reported as stale. Given the dataset's filename, the dataset itself
+    is not taken for a new source file if it sits in the source directory.
+    '''
+    if not os.path.isdir(metadata["source"]):
+        return []
+    previous = {source["filename"]: source for source in metadata["files"]}
+    filenames = list_data_directory(metadata["source"], _dataset_paths(filename) if filename else ())
+    stale = [filename for filename in filenames
+             if not _unchanged_source(previous.get(filename), source_info(filename))]
+    return stale + sorted(set(previous) - set(filenames))
+
+
+def _previous_sources(filename, data_dir):
+    '''
+    Returns the sources of the dataset at filename by name, each with where its vehicles
+    start, and the dataset's columns, or nothing if it wasn't compiled from data_dir
+    '''
+    if not is_dataset(filename):
+        return {}, None
+    previous_metadata, previous_table = load_dataset(filename)
+    if previous_metadata["source"] != data_dir:
+        return {}, None
+    previous_files = {}
+    start = 0
+    for source in previous_metadata["files"]:
+        previous_files[source["filename"]] = (source, start)
+        start += source["count"]
+    return previous_files, {column: getattr(previous_table, column) for column, _ in COLUMNS}
+
+
+def _reused_sources(sources, previous_files):
+    '''Returns the previous source and start of each source that hasn't changed, by name'''
+    reused = {}
+    for source in sources:
+        previous = previous_files.get(source["filename"])
+        if previous and _unchanged_source(previous[0], source):
+            reused[source["filename"]] = previous
+    return reused
+
+
+def _source_table(source, reused, parsed, previous_columns):
+    '''Returns a source's VehicleTable, copied from the previous dataset or freshly parsed'''
+    if source["filename"] in reused:
+        previous, start = reused[source["filename"]]
+        source["sha1"] = previous["sha1"]
+        return _file_table(previous["header"], previous_columns, start, start + previous["count"])
+    source["sha1"] = source.get("sha1") or file_hash(source["filename"])
+    return parsed[source["filename"]]
+
+
+def compile_dataset(data_dir, filename, jobs=1, rejects=None, metadata=None):
+    '''
+    Compiles the CSV files in data_dir into a dataset
+
+    If filename is already a dataset compiled from data_dir, the vehicles of any
+    source file that has not changed are copied over and only new or changed
+    files are parsed, using jobs processes. Entries rejected from the parsed files
+    and metadata are handled as in read_table_files. A dataset written into data_dir
+    is not compiled into itself.
+    '''
+    previous_files, previous_columns = _previous_sources(filename, data_dir)
+    sources = [source_info(name) for name in list_data_directory(data_dir, _dataset_paths(filename))]
+    reused = _reused_sources(sources, previous_files)
+    changed = [source["filename"] for source in sources if source["filename"] not in reused]
+    parsed = dict(read_table_files(changed, jobs, rejects=rejects, metadata=metadata))
+    logging.info("Compiling %s: %d files unchanged, %d files parsed", filename, len(reused), len(parsed))
+
+    table = VehicleTable()
+    for source in sources:
+        file_table = _source_table(source, reused, parsed, previous_columns)
+        source["header"] = file_table.sessions[0]
+        source["count"] = len(file_table)
+        table.extend(file_table)
+    write_dataset(filename, {"source": data_dir, "files": sources}, table)
+    return table
@@ -0,0 +1,57 @@
+'''
+Restricting a run to some of its data files
+
+A FileFilter keeps the data files whose file headers fall in a range of dates
+and have the given values for other headers, such as the location or
+direction. Only the header block at the top of each file is read to decide, so
+the vehicle rows of files that don't match are never parsed.
+
+Counter exports have no date header of their own and may span several days, so
+they are never skipped by date. Their vehicles are filtered by time instead.
+'''
+from .parse_time import SECONDS_PER_DAY, parse_date
+
+
+class FileFilter(object):
+    '''
+    The dates and file header values a run is restricted to
+
+    Dates are anything parse_date understands and both ends of the range are
+    included. The headers are a tuple of (file header, allowed values) as returned
+    by plan.read_filters, and are compared case insensitively.
+    '''
+
+    def __init__(self, date_from=None, date_to=None, headers=()):
+        self.start = parse_date(date_from) if date_from else None
+        self.end = parse_date(date_to) + SECONDS_PER_DAY if date_to else None
+        self.headers = headers
+
+    def __nonzero__(self):
+        return self.start is not None or self.end is not None or bool(self.headers)
+
+    def time_matches(self, data_time):
+        '''Returns True if a time in epoch seconds is within the range of dates'''
+        return (self.start is None or data_time >= self.start) and (self.end is None or data_time < self.end)
+
+    def header_matches(self, header):
+        '''Returns True if the vehicles of a file with these file headers may be kept'''
+        if not all(header.get(key, "").lower() in values for key, values in self.headers):
+            return False
+        return not header.get("date") or self.time_matches(parse_date(header["date"]))
+
+    def filter_vehicles(self, vehicles):
+        '''Yields the vehicles in the range of dates, their files having already been matched'''
+        for vehicle in vehicles:
+            if self.time_matches(vehicle["datetime"]):
+                yield vehicle
+
+    def filter_table(self, table):
+        '''Returns the vehicles of a VehicleTable whose file headers match and whose dates are in range'''
+        matches = [self.header_matches(session) for session in table.sessions]
+        # Only the vehicles of matching files without a date need their times checking
+        check_time = [match and not session.get("date") and (self.start is not None or self.end is not None)
+                      for match, session in zip(matches, table.sessions)]
+        if all(matches) and not any(check_time):
+            return table
+        return table.take([idx for idx, session in enumerate(table.session_index) if matches[session] and (
+            not check_time[session] or self.time_matches(table.datetimes[idx]))])
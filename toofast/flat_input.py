@@ -0,0 +1,272 @@
+'''
+Reading automated counter exports
+
+Pneumatic tube and radar counters export one vehicle per row in a flat layout
+with a full timestamp and a decimal speed, and optionally the lane:
+
+    timestamp,speed,lane
+    2016-08-10 13:05:22,27.4,1
+
+These files run to millions of rows, so rather than going through the sheet
+parser they are read in chunks of FLAT_CHUNK_ROWS rows and each chunk is
+converted to columns at once, with NumPy when it is available. Speeds are
+rounded to whole mph and kept if they are from MINIMUM_SPEED to MAXIMUM_SPEED,
+just like speeds entered on sheets. The lane is not used.
+
+The exports carry no file headers, so the location, direction, speed limit and
+so on come from a JSON sidecar file next to the export, named like the export
+plus SIDECAR_SUFFIX, or from metadata given on the command line. The sidecar
+wins where both give a header. Every file needs a speed limit.
+'''
+import calendar
+import csv
+import datetime
+import itertools
+import json
+import re
+from array import array
+from .constants import FILE_HEADERS, MINIMUM_SPEED, MAXIMUM_SPEED
+from .data_files import data_file_exists, open_data_file
+from .metrics import count_file
+from .parse_time import SECONDS_PER_DAY, SECONDS_PER_MINUTE
+from .rejects import RejectedRows, RejectSink
+from .vehicle_table import VehicleTable
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+FLAT_COLUMNS = ["timestamp", "speed"]
+FLAT_CHUNK_ROWS = 1 << 16
+SIDECAR_SUFFIX = ".meta.json"
+
+# YYYY-MM-DD HH:MM[:SS[.fff]], with a T or a space between the date and time
+TIMESTAMP_REGEX = re.compile(r"^\s*(\d{4})-(\d{2})-(\d{2})[T ](\d{1,2}):(\d{2})(?::(\d{2})(?:\.\d*)?)?\s*$")
+
+_MIDNIGHT_CACHE = {}
+
+# Logs the rows rejected by reads that don't collect them, one sink so --log-limit caps the whole run
+_LOG_REJECTS = RejectSink()
+
+
+def is_flat_header(first_line):
+    '''Returns True if the first line of a file is the header of a flat counter export'''
+    return [cell.strip().lower() for cell in first_line.split(",")][:len(FLAT_COLUMNS)] == FLAT_COLUMNS
+
+
+def parse_metadata(text):
+    '''
+    Returns the file headers in a comma separated list of KEY=VALUE pairs
+
+    e.g. "location=Rogers Ave & Midwood St,direction=North,speed_limit=25". Underscores
+    may stand in for spaces in the keys. An exception is raised for anything that
+    isn't one of the FILE_HEADERS.
+    '''
+    metadata = {}
+    for pair in text.split(","):
+        key, _, value = pair.partition("=")
+        key = key.strip().lower().replace("_", " ")
+        if key not in FILE_HEADERS or not value.strip():
+            raise Exception("Can't use {!r} as metadata, expected KEY=VALUE for any of {}".format(
+                pair, FILE_HEADERS))
+        metadata[key] = value.strip()
+    return metadata
+
+
+def read_flat_header(filename, metadata=None):
+    '''Returns the file header for a flat export from its sidecar and any metadata given'''
+    header = dict.fromkeys(FILE_HEADERS, "")
+    header.update(metadata or {})
+    sidecar = filename + SIDECAR_SUFFIX
+    if data_file_exists(sidecar):
+        with open_data_file(sidecar) as sidecar_file:
+            header.update((str(key.lower().replace("_", " ")), str(value))
+                          for key, value in json.load(sidecar_file).iteritems())
+    if not header["speed limit"]:
+        raise Exception("No speed limit for {}, give one in {} or with --meta".format(filename, sidecar))
+    header["filename"] = filename
+    return header
+
+
+def parse_timestamp(text):
+    '''Returns the epoch seconds of a YYYY-MM-DD HH:MM[:SS] timestamp, or None if it isn't one'''
+    match = TIMESTAMP_REGEX.match(text)
+    if not match:
+        return None
+    year, month, day, hour, minute, second = match.groups()
+    midnight = _MIDNIGHT_CACHE.get((year, month, day))
+    if midnight is None:
+        try:
+            midnight = calendar.timegm(datetime.date(int(year), int(month), int(day)).timetuple())
+        except ValueError:
+            return None
+        _MIDNIGHT_CACHE[(year, month, day)] = midnight
+    if int(hour) > 23 or int(minute) > 59 or int(second or 0) > 59:
+        return None
+    return midnight + int(hour) * 3600 + int(minute) * SECONDS_PER_MINUTE + int(second or 0)
+
+
+def flat_rejection(timestamp, speed):
+    '''
+    Returns the epoch seconds and whole mph of one row, or None and why the row was rejected
+
+    Rows are rejected as "null" when empty, "bad_time" for a timestamp that can't be
+    parsed, "non_digit" for a speed that isn't a number and "out_of_range" as on sheets.
+    '''
+    if not timestamp or not speed:
+        return None, "null"
+    data_time = parse_timestamp(timestamp)
+    if data_time is None:
+        return None, "bad_time"
+    try:
+        mph = int(float(speed) + 0.5)
+    except (ValueError, OverflowError):
+        return None, "non_digit"
+    if not MINIMUM_SPEED <= mph <= MAXIMUM_SPEED:
+        return None, "out_of_range"
+    return (data_time, mph), None
+
+
+def _is_full_timestamps(cells):
+    '''
+    Returns True if a NumPy array of timestamp strings only holds full timestamps
+
+    NumPy also parses dates without times, time zones and words like "today", none
+    of which parse_timestamp accepts. It rejects anything else parse_timestamp does.
+    '''
+    if cells.dtype.itemsize < len("YYYY-MM-DD HH:MM"):
+        return False
+    chars = cells.view(numpy.uint8).reshape(len(cells), cells.dtype.itemsize)
+    return bool(((chars[:, 10] == ord("T")) | (chars[:, 10] == ord(" "))).all() and
+                (chars[:, 13] == ord(":")).all() and not (chars[:, 8:] == ord("-")).any() and
+                not numpy.in1d(chars, [ord("+"), ord("Z")]).any())
+
+
+def _numpy_columns(timestamps, speeds):
+    '''
+    Returns the datetimes, whole mph speeds and an in range mask of a chunk as NumPy
+    arrays, or None if any row can't be converted so the chunk needs looking at row by row
+    '''
+    cells = numpy.array(timestamps, dtype=str)
+    if not _is_full_timestamps(cells):
+        return None
+    try:
+        datetimes = cells.astype("datetime64[s]")
+        mph = numpy.floor(numpy.array(speeds, dtype=float) + 0.5)
+    except (ValueError, TypeError):
+        return None
+    if numpy.isnat(datetimes).any() or not numpy.isfinite(mph).all():
+        return None
+    return datetimes.astype(numpy.int64), mph, (mph >= MINIMUM_SPEED) & (mph <= MAXIMUM_SPEED)
+
+
+def _column(typecode, values):
+    '''Returns an array of the given typecode holding a NumPy array's values'''
+    return array(typecode, values.astype(numpy.dtype(typecode)).tostring())
+
+
+def _add_numpy_chunk(table, session, columns, cells, first_line_num, rejected):
+    '''Adds the in range vehicles of a chunk converted by _numpy_columns, returning how many'''
+    timestamps, speeds = cells
+    datetimes, mph, in_range = columns
+    for idx in numpy.flatnonzero(~in_range):
+        rejected.add(first_line_num + int(idx), ("", timestamps[idx], speeds[idx]), "out_of_range")
+    datetimes = datetimes[in_range]
+    table.add_columns(session, _column('B', mph[in_range]), _column('l', datetimes),
+                      _column('H', datetimes % SECONDS_PER_DAY // SECONDS_PER_MINUTE))
+    return len(datetimes)
+
+
+def _add_chunk_rows(table, session, cells, first_line_num, rejected):
+    '''Converts a chunk one row at a time and adds its accepted vehicles, returning how many'''
+    timestamps, speeds = cells
+    added = 0
+    for idx, (timestamp, speed) in enumerate(zip(timestamps, speeds)):
+        entry, reason = flat_rejection(timestamp.strip(), speed.strip())
+        if entry is None:
+            rejected.add(first_line_num + idx, ("", timestamp, speed), reason)
+            continue
+        data_time, mph = entry
+        table.add(session, mph, data_time, data_time % SECONDS_PER_DAY // SECONDS_PER_MINUTE)
+        added += 1
+    return added
+
+
+def add_flat_chunk(table, session, rows, first_line_num, rejected):
+    '''
+    Converts a chunk of flat export rows and adds the vehicles in range to a VehicleTable
+
+    The rows are lists of cells and the first of them is on line first_line_num.
+    Rejected rows are collected in rejected. Returns the number of vehicles added.
+    '''
+    cells = ([row[0] if row else "" for row in rows], [row[1] if len(row) > 1 else "" for row in rows])
+    columns = _numpy_columns(*cells) if numpy is not None and rows else None
+    if columns is not None:
+        return _add_numpy_chunk(table, session, columns, cells, first_line_num, rejected)
+    return _add_chunk_rows(table, session, cells, first_line_num, rejected)
+
+
+def _iter_flat_chunks(filename, header, counters, rejected):
+    '''Yields a VehicleTable for each chunk of a flat export with the given headers, as iter_tables does'''
+    rows_rejected = rejected if rejected is not None else RejectedRows(filename)
+    with open_data_file(filename) as speed_file:
+        speed_reader = csv.reader(speed_file)
+        next(speed_reader)
+        accepted = 0
+        while True:
+            first_line_num = speed_reader.line_num + 1
+            rows = list(itertools.islice(speed_reader, FLAT_CHUNK_ROWS))
+            if not rows:
+                break
+            table = VehicleTable()
+            session = table.add_session(header)
+            accepted += add_flat_chunk(table, session, rows, first_line_num, rows_rejected)
+            yield table
+        if rejected is None:
+            _LOG_REJECTS.report(rows_rejected)
+        if counters is not None:
+            count_file(counters, filename, speed_reader, accepted, rows_rejected)
+
+
+class FlatInput(object):
+    '''The input adapter for flat timestamp,speed[,lane] counter exports'''
+
+    name = "flat"
+
+    @staticmethod
+    def matches(first_line):
+        '''Returns True if a file starting with first_line is a flat export'''
+        return is_flat_header(first_line)
+
+    @staticmethod
+    def iter_tables(filename, counters=None, rejected=None, metadata=None):
+        '''
+        Yields a VehicleTable for each chunk of a flat export, all sharing one session
+
+        Rejected rows are collected in rejected if given, otherwise they are logged
+        by a RejectSink shared by the whole run. If a counters Counter is given, what
+        was read is added to it as in metrics.count_file.
+        '''
+        return _iter_flat_chunks(filename, read_flat_header(filename, metadata), counters, rejected)
+
+    @staticmethod
+    def read_header(filename, metadata=None):
+        '''Returns a flat export's file headers, which come from its sidecar and the metadata'''
+        return read_flat_header(filename, metadata)
+
+    @staticmethod
+    def read_table(filename, counters=None, rejected=None, metadata=None):
+        '''Reads a flat export into one VehicleTable'''
+        header = read_flat_header(filename, metadata)
+        table = VehicleTable()
+        table.add_session(header)
+        for chunk in _iter_flat_chunks(filename, header, counters, rejected):
+            table.add_columns(0, chunk.speeds, chunk.datetimes, chunk.timeofdays)
+        return table
+
+    @classmethod
+    def iter_vehicles(cls, filename, counters=None, rejected=None, metadata=None):
+        '''Yields the vehicles in a flat export one at a time, a chunk of them in memory at a time'''
+        for chunk in cls.iter_tables(filename, counters, rejected, metadata):
+            for vehicle in chunk:
+                yield vehicle
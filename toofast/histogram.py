@@ -0,0 +1,126 @@
+'''Compact speed histograms'''
+import math
+from array import array
+from .constants import MINIMUM_SPEED, MAXIMUM_SPEED
+
+# Valid vehicles have whole number speeds in this range, so one slot per speed
+# is an exact representation of any number of vehicles.
+SPEED_BINS = MAXIMUM_SPEED - MINIMUM_SPEED + 1
+
+
+class SpeedHistogram(object):
+    '''
+    Counts of the vehicles seen at each valid speed
+
+    Every statistic we report can be computed exactly from the counts in O(bins)
+    time, and histograms merge by adding their counts, so combining buckets gives
+    exact statistics over the combined vehicles without keeping any speed lists.
+
+    A histogram also behaves like a sorted list of float speeds: it has a length,
+    can be indexed and iterated in ascending order.
+    '''
+    __slots__ = ("counts", "count")
+
+    def __init__(self, counts=None):
+        self.counts = array('l', counts if counts is not None else [0] * SPEED_BINS)
+        self.count = sum(self.counts)
+
+    @classmethod
+    def from_speeds(cls, speeds):
+        '''Returns a histogram of an iterable of speeds'''
+        histogram = cls()
+        for speed in speeds:
+            histogram.add(speed)
+        return histogram
+
+    def add(self, speed, count=1):
+        '''Adds count vehicles travelling at speed, which must be a valid speed'''
+        speed = int(speed)
+        if not MINIMUM_SPEED <= speed <= MAXIMUM_SPEED:
+            raise ValueError("Speed {} is outside the valid range {}-{}".format(
+                speed, MINIMUM_SPEED, MAXIMUM_SPEED))
+        self.counts[speed - MINIMUM_SPEED] += count
+        self.count += count
+
+    def copy(self):
+        '''Returns an independent copy of this histogram'''
+        return SpeedHistogram(self.counts)
+
+    __copy__ = copy
+
+    def __iadd__(self, other):
+        for idx, value in enumerate(other.counts):
+            if value:
+                self.counts[idx] += value
+        self.count += other.count
+        return self
+
+    def __add__(self, other):
+        result = self.copy()
+        result += other
+        return result
+
+    def __isub__(self, other):
+        if any(value > mine for value, mine in zip(other.counts, self.counts)):
+            raise Exception("Unable to subtract vehicles that were never added")
+        for idx, value in enumerate(other.counts):
+            if value:
+                self.counts[idx] -= value
+        self.count -= other.count
+        return self
+
+    def __sub__(self, other):
+        result = self.copy()
+        result -= other
+        return result
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for speed, value in self.speeds():
+            for _ in xrange(value):
+                yield float(speed)
+
+    def __getitem__(self, index):
+        '''Returns the index'th slowest speed'''
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("histogram index out of range")
+        for speed, value in self.speeds():
+            if index < value:
+                return float(speed)
+            index -= value
+        raise IndexError("histogram index out of range")
+
+    def speeds(self):
+        '''Yields (speed, count) for each speed at least one vehicle travelled at'''
+        for idx, value in enumerate(self.counts):
+            if value:
+                yield idx + MINIMUM_SPEED, value
+
+    def min(self):
+        '''Returns the slowest speed'''
+        return self[0]
+
+    def max(self):
+        '''Returns the fastest speed'''
+        return self[-1]
+
+    def total(self):
+        '''Returns the sum of all the speeds'''
+        return sum(speed * value for speed, value in self.speeds())
+
+    def mean(self):
+        '''Returns the mean speed'''
+        return float(self.total()) / self.count
+
+    def count_at_most(self, limit):
+        '''Returns the number of vehicles travelling at or below limit'''
+        bins = int(math.floor(limit)) - MINIMUM_SPEED + 1
+        return sum(self.counts[:max(0, bins)])
+
+    def percentile(self, fraction):
+        '''Returns the speed at the floor((count - 1) * fraction) index'''
+        return self[int(math.floor((self.count - 1) * fraction))]
@@ -0,0 +1,125 @@
+'''Measures the time and memory each stage of a run takes'''
+import collections
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from .data_files import data_file_size
+
+
+def count_file(counters, filename, csv_reader, accepted, rejected):
+    '''
+    Adds what was read from one CSV file to a Counter
+
+    The counts are "files_read", "bytes_read", "rows_scanned", "vehicles_accepted"
+    and, given the file's RejectedRows, "rejected_" plus each rejection_reason.
+    The bytes read are those on disk, so compressed files count their compressed size.
+    '''
+    counters["files_read"] += 1
+    counters["bytes_read"] += data_file_size(filename)
+    counters["rows_scanned"] += csv_reader.line_num
+    counters["vehicles_accepted"] += accepted
+    for reason, count in (rejected.counts if rejected is not None else {}).iteritems():
+        counters["rejected_" + reason] += count
+
+
+def current_rss():
+    '''Returns the resident set size of this process in bytes, or None where we can't tell'''
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+def cpu_time():
+    '''Returns the user plus system CPU time this process has used in seconds'''
+    user, system = os.times()[:2]
+    return user + system
+
+
+def peak_rss():
+    '''Returns the peak resident set size of this process so far in bytes'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes while OS X reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageMetrics(object):
+    '''
+    Records the wall time, CPU time and memory use of each named stage of a run
+
+    Use it as:
+
+        metrics = StageMetrics()
+        with metrics.stage("parse"):
+            data = read_data_table(...)
+
+    Stages are kept in the order they first ran. Running a stage again adds to
+    its times. Stages must not be nested.
+
+    Counts of what each stage did, such as the number of files read, are kept
+    in the counters Counter. With profile set each stage is also run under
+    cProfile, see write_profiles.
+    '''
+
+    def __init__(self, profile=False):
+        self.stages = []
+        self.results = {}
+        self.counters = collections.Counter()
+        self.profiles = {} if profile else None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''Context manager measuring one stage'''
+        profiler = None
+        if self.profiles is not None:
+            profiler = self.profiles.setdefault(name, cProfile.Profile())
+        rss_start = current_rss()
+        peak_start = peak_rss()
+        wall_start = time.time()
+        cpu_start = cpu_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            result = self.results.get(name)
+            if result is None:
+                self.stages.append(name)
+                result = self.results[name] = {
+                    "wall": 0.0, "cpu": 0.0, "rss_start": rss_start, "peak_rss_growth": 0}
+            result["wall"] += time.time() - wall_start
+            result["cpu"] += cpu_time() - cpu_start
+            result["rss_end"] = current_rss()
+            result["peak_rss"] = peak_rss()
+            result["peak_rss_growth"] += result["peak_rss"] - peak_start
+
+    def as_dict(self):
+        '''Returns the stage results and counters in a form suitable for JSON'''
+        return {"stages": [dict(self.results[name], name=name) for name in self.stages],
+                "counters": dict(self.counters)}
+
+    def write(self, filename):
+        '''Writes the stage results and counters to a file as JSON'''
+        with open(filename, 'w') as metrics_file:
+            json.dump(self.as_dict(), metrics_file, indent=4, sort_keys=True)
+
+    def write_profiles(self, prefix):
+        '''
+        Writes the profile of each stage to prefix.STAGE.prof
+
+        The files can be read with pstats or any tool that reads cProfile output.
+        Returns the names of the files written.
+        '''
+        filenames = []
+        for name in self.stages:
+            if self.profiles and name in self.profiles:
+                filenames.append("{}.{}.prof".format(prefix, name))
+                self.profiles[name].dump_stats(filenames[-1])
+        return filenames
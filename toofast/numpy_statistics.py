@@ -0,0 +1,116 @@
+'''
+Vectorized statistics using NumPy
+
+This computes the same statistics as compute_statistics(bucket_data(...)) for a
+VehicleTable, but does the bucketing, sorting and per bucket arithmetic for every
+bucket at once as array operations keyed by bucket id.
+
+NumPy is optional, the rest of toofast works without it.
+'''
+from .analyse_data import (
+    BASE_STATISTICS, STATISTICS_COLUMNS, evaluate_statistics, min_timekey, statistics_columns)
+from .constants import MINIMUM_SPEED
+from .histogram import SpeedHistogram, SPEED_BINS
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+def column_array(column):
+    '''Returns a numpy view of one of a VehicleTable's array columns without copying it'''
+    return numpy.frombuffer(column, dtype=numpy.dtype(column.typecode))
+
+
+def table_columns(table):
+    '''Returns numpy arrays of a VehicleTable's speeds, times and speed limits'''
+    speeds = column_array(table.speeds).astype(numpy.int64)
+    datetimes = column_array(table.datetimes)
+    session_limits = numpy.array([float(session["speed limit"]) for session in table.sessions])
+    limits = session_limits[column_array(table.session_index)]
+    return speeds, datetimes, limits
+
+
+def percentile_indices(starts, counts, fraction):
+    '''Returns the sorted index of the floor((count - 1) * fraction) speed in each bucket'''
+    return starts + numpy.floor((counts - 1) * fraction).astype(numpy.int64)
+
+
+# The statistics that need the speeds of each bucket sorting
+SORTED_STATISTICS = set(["min", "max", "diff", "50%", "85%", "99%"])
+
+
+def bucket_ids(datetimes, block_duration):
+    '''
+    Returns the bucket names, the index of each bucket's first vehicle and the
+    bucket id of every vehicle, the buckets being those of bucket_data
+    '''
+    min_datetime = min_timekey([int(datetimes.min())])
+    bucket_starts = min_datetime + (datetimes - min_datetime) // block_duration * block_duration
+    return numpy.unique(bucket_starts, return_index=True, return_inverse=True)
+
+
+def bucket_histograms(ids, speeds, num_buckets):
+    '''Returns a num_buckets by SPEED_BINS array of the speed counts of each bucket in one bincount'''
+    return numpy.bincount(ids * SPEED_BINS + speeds - MINIMUM_SPEED,
+                          minlength=num_buckets * SPEED_BINS).reshape(num_buckets, SPEED_BINS)
+
+
+def count_vectors(ids, speeds, bucket_limits, needed):
+    '''Returns the statistics of every bucket that need no sorting as arrays, as far as needed'''
+    counts = numpy.bincount(ids, minlength=len(bucket_limits))
+    count_legal = numpy.bincount(ids, weights=speeds <= bucket_limits[ids], minlength=len(bucket_limits))
+    vectors = {"limit": bucket_limits, "count_legal": count_legal.astype(numpy.int64), "count": counts}
+    if "%legal" in needed:
+        vectors["%legal"] = 100.0 * count_legal / counts
+    if "mean" in needed:
+        vectors["mean"] = numpy.bincount(ids, weights=speeds, minlength=len(bucket_limits)) / counts
+    return vectors
+
+
+def sorted_vectors(ids, speeds, counts):
+    '''Returns the statistics of every bucket that need its speeds sorting as arrays'''
+    sorted_speeds = speeds[numpy.lexsort((speeds, ids))].astype(numpy.float64)
+    starts = numpy.cumsum(counts) - counts
+    vectors = {"min": sorted_speeds[starts], "max": sorted_speeds[starts + counts - 1]}
+    vectors["diff"] = vectors["max"] - vectors["min"]
+    for key, fraction in [("50%", 0.50), ("85%", 0.85), ("99%", 0.99)]:
+        vectors[key] = sorted_speeds[percentile_indices(starts, counts, fraction)]
+    return vectors
+
+
+def bucket_statistics(names, vectors, histograms, columns):
+    '''Returns the statistics dictionary of each named bucket from the arrays of statistics'''
+    vectors = {key: vector.tolist() for key, vector in vectors.iteritems()}
+    stats = {}
+    for idx, name in enumerate(names.tolist()):
+        stat = {key: vector[idx] for key, vector in vectors.iteritems()}
+        stat["_histogram"] = SpeedHistogram(histograms[idx].tolist())
+        stats[name] = evaluate_statistics(stat, columns)
+    return stats
+
+
+def vectorized_statistics(table, block_duration, columns=None):
+    '''
+    Buckets a VehicleTable and computes all the statistics for every bucket in one batch
+
+    The result matches compute_statistics(bucket_data(table, block_duration), columns),
+    with every bucket's "_histogram" built by a single bincount over the whole table.
+    The speeds are only sorted if one of the columns needs them to be, and any
+    statistic registered beyond STATISTICS_COLUMNS is computed bucket by bucket.
+    '''
+    if numpy is None:
+        raise Exception("The numpy statistics engine requires numpy to be installed")
+    if not table:
+        return {}
+    speeds, datetimes, limits = table_columns(table)
+    names, first_index, ids = bucket_ids(datetimes, block_duration)
+    columns = STATISTICS_COLUMNS if columns is None else columns
+    needed = set(statistics_columns(columns))
+
+    # Each bucket's speed limit comes from its first vehicle, just like compute_statistics
+    vectors = count_vectors(ids, speeds, limits[first_index], needed)
+    if needed & SORTED_STATISTICS:
+        vectors.update(sorted_vectors(ids, speeds, vectors["count"]))
+    vectors = {key: vector for key, vector in vectors.iteritems() if key in needed or key in BASE_STATISTICS}
+    return bucket_statistics(names, vectors, bucket_histograms(ids, speeds, len(names)), columns)
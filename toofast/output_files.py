@@ -0,0 +1,29 @@
+'''
+Writing output files atomically
+
+Reports, states and datasets are written to a temporary file next to their
+destination, which is renamed over the destination once it has been written
+completely. Anything reading the destination, such as a dashboard polling a
+watched report, only ever sees a whole file.
+'''
+import os
+from contextlib import contextmanager
+
+TEMP_SUFFIX = ".tmp"
+
+
+@contextmanager
+def atomic_output(filename):
+    '''
+    Opens a temporary file to write in binary mode that replaces filename once it
+    has been written, or is removed if writing it fails
+    '''
+    temp_filename = filename + TEMP_SUFFIX
+    try:
+        with open(temp_filename, 'wb') as output_file:
+            yield output_file
+        os.rename(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
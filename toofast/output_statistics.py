@@ -1,5 +1,227 @@
-'''Output our statistics'''
+'''
+Output our statistics
+
+Reports are written by a report writer, which is given the columns of the report
+up front and then written one row at a time, so rows can be streamed out in time
+order without collecting them first. There are writers for CSV, JSON lines and a
+compact binary columnar format.
+
+A partitioned report, e.g. one per location and direction, also has key columns
+holding the values that identify the partition of each row. These come before
+the when column.
+'''
 import csv
+import json
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+from .analyse_data import count_speeds, evaluate_statistics, filter_statistics, STATISTICS_COLUMNS
+
+REPORT_FORMATS = ["csv", "jsonl", "columnar"]
+COLUMNAR_MAGIC = "TFREPORT"
+COLUMNAR_VERSION = 2
+COLUMNAR_LENGTH_FORMAT = "<I"
+ROW_GROUP_SIZE = 4096
+
+
+def report_columns(stats):
+    '''
+    Returns the columns of a report of stats in a stable sorted ordering
+
+    Keys prefixed with an underscore "_" are private and are never reported.
+    '''
+    return sorted(set([key for stat in stats.itervalues() for key in stat if key[0:1] != "_"]))
+
+
+def report_statistics(grouped_stats, metrics, min_count=0, detail=False, columns=None):
+    '''
+    Returns the rows of a report and its columns given the grouped statistics of each partition
+
+    The statistics are filtered by min_count. A detail report has a row of speed
+    counts for each time of day, otherwise the columns, or all the
+    STATISTICS_COLUMNS if None, are computed for each row.
+    '''
+    final_stats = OrderedDict()
+    with metrics.stage("filter"):
+        for keys, stats in grouped_stats.iteritems():
+            final_stats[keys] = filter_statistics(stats, min_count=min_count)
+            metrics.counters["grouped_buckets"] += len(stats)
+            metrics.counters["filtered_buckets"] += len(stats) - len(final_stats[keys])
+
+    columns = columns or STATISTICS_COLUMNS
+    if detail:
+        for keys, stats in final_stats.iteritems():
+            final_stats[keys] = {key: count_speeds(stat["_histogram"]) for key, stat in stats.iteritems()}
+        columns = sorted(set().union(*[report_columns(stats) for stats in final_stats.itervalues()]))
+    else:
+        with metrics.stage("columns"):
+            for stats in final_stats.itervalues():
+                for stat in stats.itervalues():
+                    evaluate_statistics(stat, columns)
+    return final_stats, columns
+
+
+class CsvReportWriter(object):
+    '''Writes a report as CSV with any key columns, then a when column, then the report columns'''
+
+    def __init__(self, output_file, columns, key_columns=()):
+        self.columns = columns
+        self.writer = csv.writer(output_file)
+        self.writer.writerow(list(key_columns) + ["when"] + columns)
+
+    def write_row(self, when, stat, keys=()):
+        '''Writes the statistics for one time, leaving any missing column empty'''
+        self.writer.writerow(list(keys) + [str(when)] + [stat.get(key, "") for key in self.columns])
+
+    def close(self):
+        '''Finishes the report'''
+        pass
+
+
+class JsonLinesReportWriter(object):
+    '''Writes a report as one JSON object per line, with null for any missing column'''
+
+    def __init__(self, output_file, columns, key_columns=()):
+        self.output_file = output_file
+        self.columns = columns
+        self.key_columns = key_columns
+
+    def write_row(self, when, stat, keys=()):
+        '''Writes the statistics for one time'''
+        row = OrderedDict(zip(self.key_columns, keys) + [("when", str(when))] +
+                          [(key, stat.get(key)) for key in self.columns])
+        self.output_file.write(json.dumps(row) + "\n")
+
+    def close(self):
+        '''Finishes the report'''
+        pass
+
+
+class ColumnarReportWriter(object):
+    '''
+    Writes a report in a compact binary columnar format
+
+    The file starts with COLUMNAR_MAGIC, then the length of a JSON header as a
+    little endian uint32, then the JSON header listing the columns and key columns.
+    Rows follow in groups of up to ROW_GROUP_SIZE rows. Each group is:
+
+        the number of rows as a little endian uint32
+        the length of the when labels as a little endian uint32
+        the when labels separated by newlines
+        for each key column, the length of its values as a little endian uint32
+            followed by the values separated by newlines
+        each column in turn as little endian float64s, NaN where a value is missing
+
+    Use read_columnar_report to read it back.
+    '''
+
+    def __init__(self, output_file, columns, key_columns=()):
+        self.output_file = output_file
+        self.columns = columns
+        self.key_columns = key_columns
+        self._labels = []
+        self._keys = [[] for _ in key_columns]
+        self._values = [array('d') for _ in columns]
+        header = json.dumps({"version": COLUMNAR_VERSION, "columns": columns, "keys": list(key_columns)})
+        output_file.write(COLUMNAR_MAGIC + struct.pack(COLUMNAR_LENGTH_FORMAT, len(header)) + header)
+
+    def write_row(self, when, stat, keys=()):
+        '''Adds the statistics for one time, writing out a row group once it is full'''
+        self._labels.append(str(when))
+        for key, key_values in zip(keys, self._keys):
+            key_values.append(str(key))
+        for key, values in zip(self.columns, self._values):
+            value = stat.get(key)
+            values.append(float("nan") if value is None else value)
+        if len(self._labels) == ROW_GROUP_SIZE:
+            self._write_group()
+
+    def _write_group(self):
+        '''Writes out the rows added since the last row group'''
+        labels = "\n".join(self._labels)
+        self.output_file.write(struct.pack("<II", len(self._labels), len(labels)) + labels)
+        for key_values in self._keys:
+            key_labels = "\n".join(key_values)
+            self.output_file.write(struct.pack(COLUMNAR_LENGTH_FORMAT, len(key_labels)) + key_labels)
+        for values in self._values:
+            if sys.byteorder != "little":
+                values.byteswap()
+            self.output_file.write(values.tostring())
+        self._labels = []
+        self._keys = [[] for _ in self.key_columns]
+        self._values = [array('d') for _ in self.columns]
+
+    def close(self):
+        '''Writes out any rows not yet written'''
+        if self._labels:
+            self._write_group()
+
+
+REPORT_WRITERS = {"csv": CsvReportWriter, "jsonl": JsonLinesReportWriter, "columnar": ColumnarReportWriter}
+
+
+def report_writer(report_format, output_file, columns, key_columns=()):
+    '''
+    Returns a writer of the given format, one of REPORT_FORMATS, for a report with
+    the given columns and key columns
+    '''
+    if report_format not in REPORT_WRITERS:
+        raise Exception("Unknown report format {}, expected one of {}".format(report_format, REPORT_FORMATS))
+    return REPORT_WRITERS[report_format](output_file, columns, key_columns)
+
+
+def _read_length(input_file):
+    '''Reads a little endian uint32 length'''
+    length, = struct.unpack(COLUMNAR_LENGTH_FORMAT, input_file.read(struct.calcsize(COLUMNAR_LENGTH_FORMAT)))
+    return length
+
+
+def read_columnar_report(input_file):
+    '''
+    Returns the columns and a list of (when, values dictionary) rows of a columnar report
+
+    The columns of a partitioned report start with its key columns, whose values are strings.
+    '''
+    if input_file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise Exception("Not a columnar report")
+    header = json.loads(input_file.read(_read_length(input_file)))
+    key_columns = [str(column) for column in header.get("keys", [])]
+    columns = [str(column) for column in header["columns"]]
+    rows = []
+    group_header = input_file.read(struct.calcsize("<II"))
+    while group_header:
+        count, labels_length = struct.unpack("<II", group_header)
+        labels = input_file.read(labels_length).split("\n")
+        keys = [input_file.read(_read_length(input_file)).split("\n") for _ in key_columns]
+        values = []
+        for _ in columns:
+            column = array('d')
+            column.fromstring(input_file.read(count * column.itemsize))
+            if sys.byteorder != "little":
+                column.byteswap()
+            values.append(column)
+        rows += [(labels[idx], dict([(key, column[idx]) for key, column in zip(key_columns, keys)] +
+                                    [(key, column[idx]) for key, column in zip(columns, values)]))
+                 for idx in xrange(count)]
+        group_header = input_file.read(struct.calcsize("<II"))
+    return key_columns + columns, rows
+
+
+def output_report(writer, stats):
+    '''Writes stats to a report writer one row at a time in time order'''
+    output_partitions(writer, {(): stats})
+
+
+def output_partitions(writer, partitions):
+    '''
+    Writes the stats of each partition to a report writer, in the order of the
+    partitions and then in time order, with the partition's keys on each row
+    '''
+    for keys, stats in partitions.iteritems():
+        for when in sorted(stats):
+            writer.write_row(when, stats[when], keys)
+    writer.close()
 
 
 def output_csv(output_file, stats):
@@ -25,15 +247,6 @@ def output_csv(output_file, stats):
     when 1,value1,value2,
     when 2,value1,,value3
     '''
-    rows = sorted(stats.keys())
-    if not rows:
+    if not stats:
         return
-
-    writer = csv.writer(output_file)
-    stats_key_set = set([key for row in rows for key in stats[row].keys() if key[0:1] != "_"])
-    stats_keys = sorted(list(stats_key_set))
-    writer.writerow(["when"] + stats_keys)
-
-    for row in rows:
-        values = [stats[row].get(key, "") for key in stats_keys]
-        writer.writerow([str(row)] + values)
+    output_report(CsvReportWriter(output_file, report_columns(stats)), stats)
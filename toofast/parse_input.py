@@ -1,11 +1,33 @@
 '''Handles Parsing of CSV Input'''
 import logging
+import collections
 import csv
+import functools
+import itertools
+import multiprocessing
 import os
-import timestring
+import re
+from .data_files import ZIP_SUFFIX, list_archive, open_data_file
+from .flat_input import FlatInput, SIDECAR_SUFFIX
+from .metrics import count_file
+from .parse_time import SECONDS_PER_MINUTE, to_epoch, parse_date, parse_time_of_day
+from .rejects import RejectedRows, RejectSink, rejected_message
+from .vehicle_table import VehicleTable
 from .constants import (
     FILE_HEADERS, VEHICLE_HEADERS, MINIMUM_SPEED, MAXIMUM_SPEED)
 
+# The kinds of row classify_row tells apart
+BLANK_ROW = "blank"
+FILE_HEADER_ROW = "file header"
+COLUMN_HEADER_ROW = "column header"
+DATA_ROW = "data"
+
+# Header labels match case insensitively at the start of a cell, e.g. "Name[s]" is a name
+FILE_HEADER_REGEX = re.compile("|".join(re.escape(header) for header in FILE_HEADERS), re.IGNORECASE)
+VEHICLE_HEADER_REGEX = re.compile("|".join(re.escape(header) for header in VEHICLE_HEADERS), re.IGNORECASE)
+
+_LAYOUT_CACHE = {}
+
 
 def extract_file_header(row):
     '''
@@ -21,10 +43,14 @@ def extract_file_header(row):
     dictionary if no matching key is found.
 
     '''
+    label_columns = {}
+    for idx, cell in enumerate(row):
+        match = FILE_HEADER_REGEX.match(cell)
+        if match:
+            label_columns.setdefault(match.group().lower(), idx)
     for header in FILE_HEADERS:
-        for idx in xrange(len(row)):
-            if row[idx] and header == row[idx][0:len(header)].lower():
-                return {header: row[idx + 1]}
+        if header in label_columns:
+            return {header: row[label_columns[header] + 1]}
     return {}
 
 
@@ -51,20 +77,129 @@ def is_null_vehicle(cur):
     return False
 
 
+def rejection_reason(cur):
+    '''
+    Returns why a vehicle entry should not be treated as a valid entry, or None if it should
+
+    The reason is "null" for headers and empty entries, "non_digit" for a vehicle
+    number or speed that isn't a whole number and "out_of_range" for a speed
+    outside MINIMUM_SPEED to MAXIMUM_SPEED.
+    '''
+    if is_null_vehicle(cur):
+        return "null"
+    return vehicle_rejection(cur.get("vehicle", "not integer"), cur.get("time", "not time"),
+                             cur.get("speed", "not integer"))
+
+
+def is_blank_entry(vehicle, time_text, speed):
+    '''Returns True if any of the vehicle, time and speed cells of an entry is empty'''
+    return not vehicle or not time_text or not speed
+
+
+def is_header_entry(vehicle, time_text, speed):
+    '''Returns True if any of the vehicle, time and speed cells of an entry is a column header'''
+    return vehicle.lower() == "vehicle" or time_text.lower() == "time" or speed.lower() == "speed"
+
+
+def vehicle_rejection(vehicle, time_text, speed):
+    '''Returns the rejection_reason for the vehicle, time and speed cells of one entry'''
+    if is_blank_entry(vehicle, time_text, speed) or is_header_entry(vehicle, time_text, speed):
+        return "null"
+    if not vehicle.isdigit() or not speed.isdigit():
+        return "non_digit"
+    if not MINIMUM_SPEED <= int(speed) <= MAXIMUM_SPEED:
+        return "out_of_range"
+    return None
+
+
 def is_valid_vehicle(cur):
     '''Returns True if and only if we should treat this as a valid entry'''
-    if is_null_vehicle(cur):
-        return False
-    if not cur.get("vehicle", "not integer").isdigit():
-        return False
-    if not cur.get("speed", "not integer").isdigit():
-        return False
-    if float(cur.get("speed")) < MINIMUM_SPEED or float(cur.get("speed")) > MAXIMUM_SPEED:
-        return False
-    return True
+    return rejection_reason(cur) is None
+
+
+def classify_row(row):
+    '''
+    Returns what kind of row this is, one of BLANK_ROW, FILE_HEADER_ROW, COLUMN_HEADER_ROW
+    or DATA_ROW, along with the header info for a column header row
+    '''
+    if not any(row):
+        return BLANK_ROW, {}
+    header_info = extract_header_info(row)
+    if header_info:
+        return COLUMN_HEADER_ROW, header_info
+    if extract_file_header(row):
+        return FILE_HEADER_ROW, {}
+    return DATA_ROW, {}
+
+
+def column_layout(header_info):
+    '''
+    Returns the columns holding each vehicle entry for a header info
+
+    The layout is a tuple with a (last column, vehicle column, time column, speed column)
+    tuple for each group of columns, in the order the groups complete reading left to
+    right. Layouts are cached, as every block of a sheet usually has the same columns.
+    '''
+    shape = tuple(sorted(header_info.iteritems()))
+    layout = _LAYOUT_CACHE.get(shape)
+    if layout is None:
+        groups = []
+        cur = {}
+        for idx, header in shape:
+            cur[header] = idx
+            if len(cur) == len(VEHICLE_HEADERS):
+                groups.append((idx, cur["vehicle"], cur["time"], cur["speed"]))
+                cur = {}
+        layout = _LAYOUT_CACHE[shape] = tuple(groups)
+    return layout
+
+
+def extract_row_entries(file_header, layout, row, line_num, rejected=None):
+    '''
+    Returns a (vehicle, time, speed, speed in mph) tuple for each valid entry in a row
+
+    Valid entries are checked with a single conversion of the speed. Anything else is
+    rejected as in extract_data_row.
+    '''
+    entries = []
+    width = len(row)
+    for last_idx, vehicle_idx, time_idx, speed_idx in layout:
+        if last_idx >= width:
+            break
+        vehicle, time_text, speed = row[vehicle_idx], row[time_idx], row[speed_idx]
+        if vehicle.isdigit() and speed.isdigit() and time_text and time_text.lower() != "time":
+            mph = int(speed)
+            if MINIMUM_SPEED <= mph <= MAXIMUM_SPEED:
+                entries.append((vehicle, time_text, speed, mph))
+                continue
+        reject_entry(file_header, line_num, (vehicle, time_text, speed), rejected)
+    return entries
 
 
-def extract_data_row(file_header, header_info, row, line_num):
+def reject_entry(file_header, line_num, cells, rejected=None):
+    '''
+    Collects the (vehicle, time, speed) cells of a rejected entry in rejected if given,
+    otherwise logs them unless they are null
+    '''
+    reason = vehicle_rejection(*cells)
+    if rejected is not None:
+        rejected.add(line_num, cells, reason)
+    elif reason != "null":
+        msg = rejected_message(file_header["filename"], line_num, cells)
+        logging.info(msg)  # pylint wants me to use % but I want prettier printing
+
+
+def entry_vehicle(file_header, entry):
+    '''Returns the vehicle dictionary for an entry from extract_row_entries'''
+    vehicle, time_text, speed, _ = entry
+    cur = {"vehicle": vehicle, "time": time_text, "speed": speed}
+    cur.update(file_header)  # Note: Verified this was not a significant slowdown
+    cur["datetime"] = to_epoch(file_header['date'], time_text)
+    cur["timeofday"] = parse_time_of_day(time_text)
+    return cur
+
+
+def extract_data_row(file_header, header_info, row, line_num, rejected=None):
     '''
     Extracts one row of speed data given a header info telling us the meaning of each column.
 
@@ -73,27 +208,14 @@ def extract_data_row(file_header, header_info, row, line_num):
     We expect the row to contain one or more vehicles.
 
     The return value is a list of vehicle dictionaries where a vehicle consists of each of the keys
-    in VEHICLE_HEADER with their values plus any key value pairs in the file_header.
-
-    Any unexpected data is logged at the info level.
-    '''
-    data = []
-    cur = {}
-    for idx in xrange(len(row)):
-        if idx in header_info:
-            cur[header_info[idx]] = row[idx]
-        if len(cur) == len(VEHICLE_HEADERS):
-            if is_valid_vehicle(cur):
-                cur.update(file_header)  # Note: Verified this was not a significant slowdown
-                cur["datetime"] = timestring.Date(file_header['date'] + " " + cur['time'])
-                cur["timeofday"] = timestring.Date("1/1/2016" + " " + cur['time'])
-                data += [cur]
-            elif not is_null_vehicle(cur):
-                msg = "'{}':{:<4} Invalid vehicle {}".format(
-                    file_header["filename"], line_num, cur)
-                logging.info(msg)  # pylint wants me to use % but I want prettier printing
-            cur = {}
-    return data
+    in VEHICLE_HEADER with their values plus any key value pairs in the file_header. The vehicle's
+    "datetime" is stored as integer epoch seconds and its "timeofday" as the minute of the day.
+
+    Any unexpected data is logged at the info level, unless a RejectedRows is given
+    to collect the rejected entries in.
+    '''
+    return [entry_vehicle(file_header, entry) for entry in
+            extract_row_entries(file_header, column_layout(header_info), row, line_num, rejected)]
 
 
 def extract_header_info(row):
@@ -104,43 +226,309 @@ def extract_header_info(row):
     VEHICLE_HEADER keys which map to those columns.
 
     '''
-    return {idx: header for header in VEHICLE_HEADERS for idx in xrange(len(row))
-            if row[idx] and header == row[idx][0:len(header)].lower()}
+    header_info = {}
+    for idx, cell in enumerate(row):
+        match = VEHICLE_HEADER_REGEX.match(cell)
+        if match:
+            header_info[idx] = match.group().lower()
+    return header_info
 
 
-def read_vehicle_data(file_header, csv_reader):
-    '''Reads the vehicle data in a CSV file'''
-    header_info = None
-    data = []
+def iter_vehicle_entries(file_header, csv_reader, rejected=None):
+    '''
+    Yields each valid entry in a CSV file as a tuple like extract_row_entries returns
+
+    Rows are read with the column layout of the last column header seen. Only a row
+    without any valid entries is classified, so a new column header can be picked up.
+    '''
+    layout = ()
     for row in csv_reader:
-        if header_info:
-            row_data = extract_data_row(file_header, header_info, row, csv_reader.line_num)
-            if row_data:
-                data += row_data
-            elif extract_header_info(row):
-                header_info = None
-        if not header_info:
-            header_info = extract_header_info(row)
-    return data
-
-
-def read_data_file(filename):  # pragma: no cover
+        entries = extract_row_entries(file_header, layout, row, csv_reader.line_num, rejected)
+        for entry in entries:
+            yield entry
+        if not entries:
+            kind, header_info = classify_row(row)
+            if kind == COLUMN_HEADER_ROW:
+                layout = column_layout(header_info)
+
+
+def iter_vehicle_data(file_header, csv_reader, rejected=None):
+    '''Yields the vehicles in a CSV file one at a time, collecting rejected entries in rejected if given'''
+    for entry in iter_vehicle_entries(file_header, csv_reader, rejected):
+        yield entry_vehicle(file_header, entry)
+
+
+def read_vehicle_data(file_header, csv_reader, rejected=None):
+    '''Reads the vehicle data in a CSV file'''
+    return list(iter_vehicle_data(file_header, csv_reader, rejected))
+
+
+def read_vehicle_table(file_header, csv_reader, table=None, rejected=None):
+    '''Reads the vehicle data in a CSV file into a VehicleTable, a new one unless given'''
+    table = table if table is not None else VehicleTable()
+    session = table.add_session(file_header)
+    date = file_header["date"]
+    for _, time_text, _, speed in iter_vehicle_entries(file_header, csv_reader, rejected):
+        minute = parse_time_of_day(time_text)
+        table.add(session, speed, parse_date(date) + SECONDS_PER_MINUTE * minute, minute)
+    return table
+
+
+class SheetInput(object):
+    '''The input adapter for hand entered speed study sheets, which every other file is taken to be'''
+
+    name = "sheet"
+
+    @staticmethod
+    def matches(first_line):  # pylint: disable=unused-argument
+        '''Returns True for any file, sheets come in too many shapes to recognize from one line'''
+        return True
+
+    @staticmethod
+    def iter_vehicles(filename, counters=None, rejected=None,
+                      metadata=None):  # pylint: disable=unused-argument
+        '''
+        Open a single sheet and yields the vehicles in the file
+
+        The sheet's own file headers are used, so any metadata is ignored.
+        '''
+        with open_data_file(filename) as speed_file:
+            speed_reader = csv.reader(speed_file)
+            header = read_file_header(filename, speed_reader)
+            accepted = 0
+            for vehicle in iter_vehicle_data(header, speed_reader, rejected):
+                accepted += 1
+                yield vehicle
+            if counters is not None:
+                count_file(counters, filename, speed_reader, accepted, rejected)
+
+    @staticmethod
+    def read_header(filename, metadata=None):  # pylint: disable=unused-argument
+        '''Returns a sheet's file headers, reading no further than its header block'''
+        with open_data_file(filename) as speed_file:
+            return read_file_header(filename, csv.reader(speed_file))
+
+    @staticmethod
+    def read_table(filename, counters=None, rejected=None, metadata=None):  # pylint: disable=unused-argument
+        '''Open a single sheet and reads the data in the file into a VehicleTable'''
+        with open_data_file(filename) as speed_file:
+            speed_reader = csv.reader(speed_file)
+            header = read_file_header(filename, speed_reader)
+            table = read_vehicle_table(header, speed_reader, rejected=rejected)
+            if counters is not None:
+                count_file(counters, filename, speed_reader, len(table), rejected)
+            return table
+
+
+# Input adapters are tried in turn and the first whose matches() accepts the first
+# line of a file reads it. Each has iter_vehicles and read_table functions taking
+# (filename, counters=None, rejected=None, metadata=None) like those of SheetInput,
+# and a read_header function taking (filename, metadata=None).
+INPUT_ADAPTERS = [FlatInput, SheetInput]
+
+
+def input_adapter(filename):
+    '''Returns the input adapter that reads a file'''
+    with open_data_file(filename) as speed_file:
+        first_line = speed_file.readline()
+    for adapter in INPUT_ADAPTERS:
+        if adapter.matches(first_line):
+            return adapter
+    raise Exception("No input adapter can read {}".format(filename))
+
+
+def read_data_header(filename, metadata=None):
+    '''Returns the file headers of a data file without reading any of its vehicles'''
+    return input_adapter(filename).read_header(filename, metadata)
+
+
+def select_data_files(filenames, file_filter, counters=None, metadata=None):
+    '''
+    Returns the filenames whose file headers match a FileFilter, in the order given
+
+    Only the file headers are read. If a counters Counter is given, the number of
+    files skipped is added to its "files_skipped".
+    '''
+    selected = [filename for filename in filenames
+                if file_filter.header_matches(read_data_header(filename, metadata))]
+    logging.debug("Skipping %d of %d files that don't match the filters",
+                  len(filenames) - len(selected), len(filenames))
+    if counters is not None:
+        counters["files_skipped"] += len(filenames) - len(selected)
+    return selected
+
+
+def list_selected_files(data_dir, file_filter=None, counters=None, metadata=None):
+    '''
+    Returns the data files in a directory as list_data_directory does, keeping
+    those matching any FileFilter
+    '''
+    filenames = list_data_directory(data_dir)
+    if file_filter:
+        filenames = select_data_files(filenames, file_filter, counters, metadata)
+    return filenames
+
+
+def iter_data_file(filename, counters=None, rejected=None, metadata=None):  # pragma: no cover
+    '''
+    Open a single CSV file and yields the vehicles in the file
+
+    Rejected entries are collected in rejected if given, otherwise they are logged.
+    If a counters Counter is given, what was read is added to it as in metrics.count_file.
+    Files without file headers of their own, like counter exports, take them from
+    the metadata dictionary.
+    '''
+    return input_adapter(filename).iter_vehicles(filename, counters, rejected, metadata)
+
+
+def read_data_file(filename, counters=None, rejected=None, metadata=None):  # pragma: no cover
     '''Open a single CSV file and reads the data in the file'''
-    with open(filename, 'rb') as speed_file:
-        speed_reader = csv.reader(speed_file)
-        header = read_file_header(filename, speed_reader)
-        data = read_vehicle_data(header, speed_reader)
-        return data
-
-
-def read_data_directory(data_dir):  # pragma: no cover
-    '''Reads the CSV data in all the files in a directory'''
-    data = []
-    for filename in os.listdir(data_dir):
-        full_filename = data_dir + "/" + filename
+    return list(iter_data_file(filename, counters, rejected, metadata))
+
+
+def read_table_file(filename, counters=None, rejected=None, metadata=None):  # pragma: no cover
+    '''Open a single CSV file and reads the data in the file into a VehicleTable'''
+    return input_adapter(filename).read_table(filename, counters, rejected, metadata)
+
+
+def read_counted_data_file(filename, metadata=None):  # pragma: no cover
+    '''Reads the data in a CSV file, returning it with a Counter of what was read and the RejectedRows'''
+    counters = collections.Counter()
+    rejected = RejectedRows(filename)
+    return read_data_file(filename, counters, rejected, metadata), counters, rejected
+
+
+def read_counted_table_file(filename, metadata=None):  # pragma: no cover
+    '''
+    Reads a CSV file into a VehicleTable, returning it with a Counter of what was
+    read and the RejectedRows
+    '''
+    counters = collections.Counter()
+    rejected = RejectedRows(filename)
+    return read_table_file(filename, counters, rejected, metadata), counters, rejected
+
+
+def map_data_files(func, filenames, jobs=1):
+    '''
+    Yields (filename, func(filename)) for each filename, in the order given.
+
+    When jobs is more than one the files are handed to a pool of that many
+    processes, but results are still yielded in the order of filenames so
+    callers see exactly what a serial run would produce.
+
+    Any failure is logged along with the name of the file that caused it and
+    then re-raised, aborting the run.
+    '''
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    results = pool.imap(func, filenames) if pool else itertools.imap(func, filenames)
+    try:
+        for filename in filenames:
+            try:
+                yield filename, next(results)
+            except Exception:
+                logging.exception("Exception reading %s", filename)
+                raise
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def list_data_directory(data_dir, exclude=()):
+    '''
+    Returns the full path of every data file in a directory in sorted filename order, skipping sidecars
+
+    Zip archives are listed as each of their members in turn, see data_files. Any
+    of the exclude paths, such as an output file written into the directory, are
+    skipped too.
+    '''
+    excluded = set(os.path.abspath(path) for path in exclude)
+    filenames = []
+    for filename in sorted(os.listdir(data_dir)):
+        if os.path.abspath(data_dir + "/" + filename) in excluded:
+            continue
+        if filename.endswith(ZIP_SUFFIX):
+            filenames.extend(list_archive(data_dir + "/" + filename))
+        else:
+            filenames.append(data_dir + "/" + filename)
+    return [filename for filename in filenames if not filename.endswith(SIDECAR_SUFFIX)]
+
+
+def read_table_files(filenames, jobs=1, counters=None, rejects=None, metadata=None):  # pragma: no cover
+    '''
+    Yields (filename, VehicleTable) for each CSV file, in the order given, reading them with jobs processes
+
+    If a counters Counter is given, what was read is added to it as in metrics.count_file.
+    The entries rejected from each file are reported to the rejects RejectSink, or
+    to one that only logs if none is given. The metadata is passed to read_table_file.
+    '''
+    rejects = rejects if rejects is not None else RejectSink()
+    for filename, (file_table, file_counters, rejected) in map_data_files(
+            functools.partial(read_counted_table_file, metadata=metadata), filenames, jobs):
+        if counters is not None:
+            counters.update(file_counters)
+        rejects.report(rejected)
+        yield filename, file_table
+
+
+def iter_data_directory(data_dir, jobs=1, counters=None, rejects=None, metadata=None,
+                        file_filter=None):  # pragma: no cover
+    '''
+    Yields the vehicles in all the CSV files in a directory in sorted filename order
+
+    A serial read only holds one row, or one chunk of a counter export, in memory at
+    a time. With more than one job each worker parses a whole file, so one file per
+    worker is held at a time. Counters, rejected entries and metadata are handled
+    as in read_table_files. Given a FileFilter, files whose headers don't match are
+    skipped unread and only the vehicles in its range of dates are yielded.
+    '''
+    filenames = list_selected_files(data_dir, file_filter, counters, metadata)
+    vehicles = _iter_data_files(filenames, jobs, counters, rejects, metadata)
+    return file_filter.filter_vehicles(vehicles) if file_filter else vehicles
+
+
+def _iter_data_files(filenames, jobs, counters, rejects, metadata):  # pragma: no cover
+    '''Yields the vehicles in the given files in turn, as iter_data_directory does'''
+    rejects = rejects if rejects is not None else RejectSink()
+    if jobs > 1:
+        for _, (file_data, file_counters, rejected) in map_data_files(
+                functools.partial(read_counted_data_file, metadata=metadata), filenames, jobs):
+            if counters is not None:
+                counters.update(file_counters)
+            rejects.report(rejected)
+            for vehicle in file_data:
+                yield vehicle
+        return
+    for filename in filenames:
+        rejected = RejectedRows(filename)
         try:
-            data += read_data_file(full_filename)
-        except:
-            logging.exception("Exception reading %s", full_filename)
+            for vehicle in iter_data_file(filename, counters, rejected, metadata):
+                yield vehicle
+        except Exception:
+            logging.exception("Exception reading %s", filename)
             raise
-    return data
+        rejects.report(rejected)
+
+
+def read_data_directory(data_dir, jobs=1):  # pragma: no cover
+    '''
+    Reads the CSV data in all the files in a directory
+
+    Files are merged in sorted filename order, reading them with jobs processes.
+    '''
+    return list(iter_data_directory(data_dir, jobs))
+
+
+def read_data_table(data_dir, jobs=1, counters=None, rejects=None, metadata=None,
+                    file_filter=None):  # pragma: no cover
+    '''
+    Reads the CSV data in all the files in a directory into one VehicleTable
+
+    Files are merged in sorted filename order, reading them with jobs processes.
+    Counters, rejected entries and metadata are handled as in read_table_files,
+    and a FileFilter as in iter_data_directory.
+    '''
+    table = VehicleTable()
+    filenames = list_selected_files(data_dir, file_filter, counters, metadata)
+    for _, file_table in read_table_files(filenames, jobs, counters, rejects, metadata):
+        table.extend(file_filter.filter_table(file_table) if file_filter else file_table)
+    return table
@@ -0,0 +1,71 @@
+'''
+Fast parsing of the dates and times found in our speed study sheets
+
+The sheets only ever contain M/D/YYYY dates and H:MM times, so rather than
+running every value through timestring's natural language parser we match
+those two layouts directly and memoize the results. There is one date per file
+and at most 1440 distinct times in a day, so the caches stay small. Times that
+only timestring understands are memoized too, but the time cache stops growing
+at TIME_CACHE_SIZE values, after which new times are parsed every time they
+are seen.
+
+All times are plain integers. Epoch seconds treat the sheet's wall clock
+time as UTC, which keeps the arithmetic free of daylight saving surprises.
+Anything we can't match is handed to timestring as before.
+'''
+import calendar
+import datetime
+import re
+import timestring
+
+SECONDS_PER_MINUTE = 60
+SECONDS_PER_HOUR = 60 * SECONDS_PER_MINUTE
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+MINUTES_PER_DAY = 24 * 60
+
+DATE_REGEX = re.compile(r"^\s*(\d{1,2})/(\d{1,2})/(\d{4})\s*$")
+TIME_REGEX = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*$")
+TIME_CACHE_SIZE = 4096
+
+_DATE_CACHE = {}
+_TIME_CACHE = {}
+
+
+def _timestring_datetime(text):
+    '''Falls back to timestring for values we don't recognize'''
+    return timestring.Date(text).date
+
+
+def parse_date(text):
+    '''Returns the epoch seconds of midnight on an M/D/YYYY date'''
+    midnight = _DATE_CACHE.get(text)
+    if midnight is None:
+        match = DATE_REGEX.match(text)
+        try:
+            month, day, year = [int(val) for val in match.groups()]
+            date = datetime.date(year, month, day)
+        except (AttributeError, ValueError):
+            date = _timestring_datetime(text).date()
+        midnight = calendar.timegm(date.timetuple())
+        _DATE_CACHE[text] = midnight
+    return midnight
+
+
+def parse_time_of_day(text):
+    '''Returns the minute of the day for an H:MM time, or anything else timestring understands'''
+    minute = _TIME_CACHE.get(text)
+    if minute is None:
+        match = TIME_REGEX.match(text)
+        if match and int(match.group(1)) < 24 and int(match.group(2)) < 60:
+            minute = int(match.group(1)) * 60 + int(match.group(2))
+        else:
+            when = _timestring_datetime("1/1/2016 " + text)
+            minute = when.hour * 60 + when.minute
+        if len(_TIME_CACHE) < TIME_CACHE_SIZE:
+            _TIME_CACHE[text] = minute
+    return minute
+
+
+def to_epoch(date_text, time_text):
+    '''Returns the epoch seconds for a sheet date and time of day'''
+    return parse_date(date_text) + SECONDS_PER_MINUTE * parse_time_of_day(time_text)
@@ -0,0 +1,62 @@
+'''
+Partitioned reports
+
+A speed study program usually covers several streets, each in both directions.
+Rather than splitting the input by hand and running once per street, the vehicles
+can be partitioned by the values of some of their file headers, such as location
+and direction, and each partition gets its own statistics from a single read of
+the input.
+'''
+import multiprocessing
+from collections import OrderedDict
+from .analyse_data import bucket_data, compute_statistics
+from .constants import FILE_HEADERS
+from .numpy_statistics import vectorized_statistics
+
+
+def parse_group_by(group_by):
+    '''
+    Returns the file header keys in a comma separated list such as "location,direction"
+
+    Underscores may stand in for spaces, e.g. speed_limit. An exception is raised
+    for anything that isn't one of the FILE_HEADERS.
+    '''
+    keys = [key.strip().lower().replace("_", " ") for key in group_by.split(",")]
+    unknown = [key for key in keys if key not in FILE_HEADERS]
+    if unknown:
+        raise Exception("Can't group by {}, expected any of {}".format(", ".join(unknown), FILE_HEADERS))
+    return keys
+
+
+def partition_table(table, keys):
+    '''Returns an OrderedDict of the VehicleTable of each partition of a table, in partition order'''
+    return OrderedDict(sorted(table.partition(keys).iteritems()))
+
+
+def table_statistics(job):
+    '''Computes the statistics of a (VehicleTable, block_duration, engine, columns) job'''
+    table, block_duration, engine, columns = job
+    if engine == "numpy":
+        return vectorized_statistics(table, block_duration, columns)
+    return compute_statistics(bucket_data(table, block_duration), columns)
+
+
+def partition_statistics(partitions, block_duration, engine="python", jobs=1, columns=None):
+    '''
+    Returns an OrderedDict of the statistics of each partition for block_duration long buckets
+
+    Each partition is bucketed on its own, so its statistics are exactly those of a
+    run over just its vehicles. With more than one job and more than one partition
+    the partitions are computed by a pool of processes. The columns computed are as
+    in analyse_data.speed_statistics.
+    '''
+    work = [(table, block_duration, engine, columns) for table in partitions.itervalues()]
+    if jobs > 1 and len(work) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(work)))
+        try:
+            results = pool.map(table_statistics, work)
+        finally:
+            pool.terminate()
+    else:
+        results = [table_statistics(job) for job in work]
+    return OrderedDict(zip(partitions, results))
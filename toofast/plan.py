@@ -0,0 +1,131 @@
+'''
+Report plans
+
+A plan is a JSON file listing every report wanted from one input, e.g.
+
+    {
+        "input": "study_data",
+        "reports": [
+            {"interval": 15, "output": "all_15.csv"},
+            {"interval": 60, "min_count": 10, "detail": true, "output": "all_60_detail.csv"},
+            {"interval": 30, "group_by": "direction", "output": "by_direction.jsonl", "format": "jsonl"},
+            {"interval": 30, "filters": {"direction": "North"}, "output": "north_30.csv"}
+        ]
+    }
+
+The input is read once for the whole plan. Reports with the same filters and
+grouping share one bucketing at the finest of their intervals, which is rolled
+up into each of their intervals, and reports with the same interval too share
+the statistics grouped by time of day. Only filtering by min_count, the detail
+breakdown and computing the report's columns are done for each report.
+'''
+import datetime
+import json
+from collections import defaultdict, OrderedDict
+from .analyse_data import finest_interval, group_statistics, parse_columns, rollup_intervals
+from .constants import FILE_HEADERS
+from .output_statistics import REPORT_FORMATS
+from .partition import parse_group_by, partition_table, partition_statistics
+
+# Each report setting and its default, a report must give its output
+REPORT_DEFAULTS = {
+    "interval": 15,
+    "min_count": 0,
+    "detail": False,
+    "format": "csv",
+    "group_by": None,
+    "filters": {},
+    "columns": None,
+}
+
+
+def read_report(report):
+    '''Returns a report of a plan with defaults filled in, raising an exception if it is invalid'''
+    unknown = set(report) - set(REPORT_DEFAULTS) - set(["output"])
+    if unknown:
+        raise Exception("Unknown report settings {}".format(", ".join(sorted(unknown))))
+    if "output" not in report:
+        raise Exception("Every report needs an output")
+    report = dict(REPORT_DEFAULTS, **report)
+    if report["format"] not in REPORT_FORMATS:
+        raise Exception("Unknown report format {}, expected one of {}".format(
+            report["format"], REPORT_FORMATS))
+    if int(report["interval"]) <= 0 or int(report["min_count"]) < 0:
+        raise Exception("A report's interval must be positive and its min_count not negative")
+    report["interval"] = datetime.timedelta(minutes=int(report["interval"])).seconds
+    report["min_count"] = int(report["min_count"])
+    report["keys"] = parse_group_by(report["group_by"]) if report["group_by"] else []
+    report["filters"] = read_filters(report["filters"])
+    if isinstance(report["columns"], basestring):
+        report["columns"] = parse_columns(report["columns"])
+    elif report["columns"] is not None:
+        report["columns"] = parse_columns(",".join(report["columns"]))
+    return report
+
+
+def read_filters(filters):
+    '''
+    Returns the filters of a report as a sorted tuple of (file header, allowed values)
+
+    Each filter is a file header and the value, or list of values, a vehicle's file
+    header must have. Values are compared case insensitively.
+    '''
+    unknown = [key for key in filters if key.replace("_", " ") not in FILE_HEADERS]
+    if unknown:
+        raise Exception("Can't filter by {}, expected any of {}".format(", ".join(unknown), FILE_HEADERS))
+    allowed = []
+    for key, values in filters.iteritems():
+        values = [values] if isinstance(values, basestring) else values
+        allowed.append((str(key.replace("_", " ")), tuple(sorted(set(value.lower() for value in values)))))
+    return tuple(sorted(allowed))
+
+
+def read_plan(filename):
+    '''Reads a plan file, returning its input and the list of its reports with defaults filled in'''
+    with open(filename) as plan_file:
+        plan = json.load(plan_file)
+    if "input" not in plan or not plan.get("reports"):
+        raise Exception("A plan needs an input and a list of reports")
+    return str(plan["input"]), [read_report(report) for report in plan["reports"]]
+
+
+def filter_table(table, filters):
+    '''Returns the vehicles of a VehicleTable whose file headers match the filters from read_filters'''
+    if not filters:
+        return table
+    sessions = set(idx for idx, session in enumerate(table.sessions)
+                   if all(session[key].lower() in values for key, values in filters))
+    return table.take([idx for idx, session in enumerate(table.session_index) if session in sessions])
+
+
+def plan_statistics(table, reports, engine="python", jobs=1):
+    '''
+    Returns the statistics grouped by time of day for each of a plan's reports in turn
+
+    Each is an OrderedDict of the statistics of each partition, as group_reports in
+    speeders.py produces them, and reports with the same filters, grouping and
+    interval are given the very same statistics. Only the base statistics are
+    computed, leaving each report's columns to be evaluated as it is written.
+    '''
+    intervals = defaultdict(set)
+    for report in reports:
+        intervals[(report["filters"], tuple(report["keys"]))].add(report["interval"])
+
+    grouped_stats = {}
+    for (filters, keys), block_durations in intervals.iteritems():
+        subset = filter_table(table, filters)
+        if subset:
+            partitions = partition_table(subset, keys) if keys else OrderedDict([((), subset)])
+            partitioned_stats = partition_statistics(
+                partitions, finest_interval(block_durations), engine, jobs, columns=())
+        else:
+            partitioned_stats = OrderedDict() if keys else OrderedDict([((), {})])
+        interval_stats = OrderedDict(
+            (partition, rollup_intervals(stats, block_durations, ()) if stats else defaultdict(dict))
+            for partition, stats in partitioned_stats.iteritems())
+        for block_duration in block_durations:
+            grouped_stats[(filters, keys, block_duration)] = OrderedDict(
+                (partition, group_statistics(stats[block_duration], ()))
+                for partition, stats in interval_stats.iteritems())
+    return [grouped_stats[(report["filters"], tuple(report["keys"]), report["interval"])]
+            for report in reports]
@@ -0,0 +1,106 @@
+'''
+Rejected vehicle entries
+
+Volunteer sheets often contain mistyped vehicles. Rather than logging each one as
+it is found, the entries rejected from a file are collected in a RejectedRows
+and handed to a RejectSink once the file has been read. The sink logs a summary
+of each file, logs individual entries only up to a limit and can write every
+rejected entry to a quarantine file so the sheets needing fixing are easy to find.
+
+Nothing is formatted unless it is actually logged or written.
+'''
+import csv
+import json
+import logging
+from collections import Counter
+
+# Rejected entries logged individually in a run before only summaries are logged
+DEFAULT_LOG_LIMIT = 10
+QUARANTINE_FIELDS = ["filename", "line", "reason", "vehicle", "time", "speed"]
+QUARANTINE_BUFFER_SIZE = 1 << 20
+
+
+class RejectedRows(object):
+    '''
+    The entries rejected from one file
+
+    Every rejection is counted by reason. Headers and empty entries are rejected
+    as "null" on almost every row, so only the other rejections are kept as
+    (line number, (vehicle, time, speed) cells, reason) tuples.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.counts = Counter()
+        self.rows = []
+
+    def add(self, line_num, cells, reason):
+        '''Records one rejected entry'''
+        self.counts[reason] += 1
+        if reason != "null":
+            self.rows.append((line_num, cells, reason))
+
+
+def rejected_message(filename, line_num, cells):
+    '''Returns the log message for one rejected entry'''
+    cur = dict(zip(["vehicle", "time", "speed"], cells))
+    return "'{}':{:<4} Invalid vehicle {}".format(filename, line_num, cur)
+
+
+class RejectSink(object):
+    '''
+    Reports the entries rejected from each file
+
+    Each file with rejected entries gets a one line summary of its counts by
+    reason, and the first log_limit entries of the run are logged individually.
+    If a quarantine filename is given every rejected entry is also written to
+    it, as JSON lines if it ends in .jsonl and as CSV otherwise.
+
+    Use it as a context manager so the quarantine file is closed.
+    '''
+
+    def __init__(self, quarantine=None, log_limit=DEFAULT_LOG_LIMIT):
+        self.log_limit = log_limit
+        self.logged = 0
+        self.quarantine = quarantine
+        self._file = None
+        self._writer = None
+        if quarantine:
+            self._file = open(quarantine, 'wb', QUARANTINE_BUFFER_SIZE)
+            if not quarantine.endswith(".jsonl"):
+                self._writer = csv.writer(self._file)
+                self._writer.writerow(QUARANTINE_FIELDS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''Closes the quarantine file'''
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def report(self, rejected):
+        '''Logs and quarantines the entries rejected from one file'''
+        if not rejected.rows:
+            return
+        counts = ", ".join("{}: {}".format(reason, count)
+                           for reason, count in sorted(rejected.counts.iteritems()) if reason != "null")
+        logging.info("'%s' rejected %d vehicles (%s)", rejected.filename, len(rejected.rows), counts)
+        for line_num, cells, _ in rejected.rows[:max(self.log_limit - self.logged, 0)]:
+            logging.info(rejected_message(rejected.filename, line_num, cells))
+        self.logged += len(rejected.rows)
+        if self.logged > self.log_limit >= self.logged - len(rejected.rows):
+            logging.info("Only the first %d invalid vehicles are logged individually", self.log_limit)
+        if self._writer:
+            self._writer.writerows([rejected.filename, line_num, reason] + list(cells)
+                                   for line_num, cells, reason in rejected.rows)
+        elif self._file:
+            self._file.write("".join(
+                json.dumps({"filename": rejected.filename, "line": line_num, "reason": reason,
+                            "cells": [cell.decode("utf-8", "replace") for cell in cells]},
+                           sort_keys=True) + "\n"
+                for line_num, cells, reason in rejected.rows))
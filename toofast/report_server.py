@@ -0,0 +1,176 @@
+'''
+A long running local report server
+
+The server reads its input once and keeps the vehicles in memory, then answers
+report requests over HTTP with JSON:
+
+    GET /report?interval=15&min_count=0&detail=0
+
+returns {"interval": 15, "columns": [...], "rows": [{"when": "05:00:00", ...}, ...]}.
+
+Computed reports are kept in an LRU cache keyed by their parameters, up to a
+total size in bytes. Before answering, the server checks at most once every
+CHECK_INTERVAL seconds whether the input has changed and if so reads it again
+and empties the cache.
+'''
+import BaseHTTPServer
+import json
+import logging
+import time
+import urlparse
+from collections import OrderedDict
+from .analyse_data import bucket_data, compute_statistics, group_statistics
+from .dataset import is_dataset, load_dataset, source_info
+from .metrics import StageMetrics
+from .output_statistics import report_statistics
+from .parse_input import list_data_directory, read_data_table
+
+CHECK_INTERVAL = 1.0
+DEFAULT_CACHE_BYTES = 64 << 20
+
+
+def input_signature(input_path):
+    '''Returns something that changes whenever the files of a directory or a dataset change'''
+    filenames = [input_path] if is_dataset(input_path) else list_data_directory(input_path)
+    return [tuple(sorted(source_info(filename).iteritems())) for filename in filenames]
+
+
+class ReportCache(object):
+    '''A least recently used cache of encoded reports holding at most max_bytes of them'''
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.reports = OrderedDict()
+
+    def get(self, key):
+        '''Returns the report cached for key, or None'''
+        report = self.reports.pop(key, None)
+        if report is not None:
+            self.reports[key] = report
+        return report
+
+    def put(self, key, report):
+        '''Caches a report, evicting the least recently used reports to stay under max_bytes'''
+        if len(report) > self.max_bytes:
+            return
+        self.size -= len(self.reports.pop(key, ""))
+        self.reports[key] = report
+        self.size += len(report)
+        while self.size > self.max_bytes:
+            _, evicted = self.reports.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        '''Empties the cache'''
+        self.reports.clear()
+        self.size = 0
+
+
+class ReportServer(object):
+    '''
+    Holds the vehicles read from an input directory or dataset and computes reports from them
+
+    The metadata are the file headers for counter exports without a sidecar, as
+    given to read_data_table.
+    '''
+
+    def __init__(self, input_path, jobs=1, cache_bytes=DEFAULT_CACHE_BYTES, metadata=None):
+        self.input_path = input_path
+        self.jobs = jobs
+        self.metadata = metadata
+        self.cache = ReportCache(cache_bytes)
+        self.table = None
+        self.signature = None
+        self.checked = 0
+        self.load()
+
+    def load(self):
+        '''Reads the input and empties the cache'''
+        self.signature = input_signature(self.input_path)
+        if is_dataset(self.input_path):
+            self.table = load_dataset(self.input_path)[1]
+        else:
+            self.table = read_data_table(self.input_path, jobs=self.jobs, metadata=self.metadata)
+        self.checked = time.time()
+        self.cache.clear()
+        logging.info("Loaded %d vehicles from %s", len(self.table), self.input_path)
+
+    def refresh(self):
+        '''Reads the input again if it has changed since it was last read'''
+        if time.time() - self.checked < CHECK_INTERVAL:
+            return
+        self.checked = time.time()
+        if input_signature(self.input_path) != self.signature:
+            logging.info("%s changed, reloading", self.input_path)
+            self.load()
+
+    def compute_report(self, interval, min_count, detail):
+        '''Returns the report for the given parameters as a dictionary'''
+        grouped_stats = {}
+        if self.table:
+            buckets = bucket_data(self.table, interval * 60)
+            grouped_stats = group_statistics(compute_statistics(buckets, columns=()), columns=())
+        final_stats, columns = report_statistics({(): grouped_stats}, StageMetrics(), min_count=min_count,
+                                                 detail=detail)
+        final_stats = final_stats[()]
+        return {
+            "interval": interval,
+            "columns": columns,
+            "rows": [OrderedDict([("when", when)] + [(key, final_stats[when].get(key)) for key in columns])
+                     for when in sorted(final_stats)]}
+
+    def report(self, interval=15, min_count=0, detail=False):
+        '''Returns the report for the given parameters encoded as JSON, from the cache if possible'''
+        self.refresh()
+        key = (interval, min_count, bool(detail))
+        report = self.cache.get(key)
+        if report is None:
+            report = json.dumps(self.compute_report(interval, min_count, detail))
+            self.cache.put(key, report)
+        return report
+
+
+def report_parameters(query):
+    '''Returns the report parameters in a URL query string, raising ValueError if any are invalid'''
+    params = urlparse.parse_qs(query)
+    interval = int(params.get("interval", ["15"])[0])
+    min_count = int(params.get("min_count", ["0"])[0])
+    detail = params.get("detail", ["0"])[0].lower() in ("1", "true", "yes")
+    if interval <= 0 or min_count < 0:
+        raise ValueError("interval must be positive and min_count not negative")
+    return {"interval": interval, "min_count": min_count, "detail": detail}
+
+
+class ReportRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''Answers GET /report requests from the server's ReportServer'''
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        '''Handles a report request'''
+        url = urlparse.urlparse(self.path)
+        if url.path != "/report":
+            return self.send_json(404, json.dumps({"error": "Not found"}))
+        try:
+            params = report_parameters(url.query)
+        except ValueError as error:
+            return self.send_json(400, json.dumps({"error": str(error)}))
+        return self.send_json(200, self.server.reports.report(**params))
+
+    def send_json(self, status, body):
+        '''Sends a JSON response'''
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        '''Logs requests through logging rather than to stderr'''
+        logging.debug("%s - " + format, self.address_string(), *args)
+
+
+def make_server(reports, host="127.0.0.1", port=8015):
+    '''Returns an HTTP server answering requests from a ReportServer, call serve_forever to run it'''
+    server = BaseHTTPServer.HTTPServer((host, port), ReportRequestHandler)
+    server.reports = reports
+    return server
@@ -0,0 +1,116 @@
+'''
+Synthetic speed study data
+
+Writes files in the same layout volunteers produce when exporting the speed
+study spreadsheet: a block of file headers followed by blocks of rows, each
+block holding three Vehicle/Time/Speed column groups side by side, blocks
+separated by blank rows. A small share of entries are invalid in the ways
+real sheets are, e.g. mistyped speeds or vehicles with no speed recorded.
+
+Everything is driven by a seeded random number generator, so a study can be
+regenerated exactly for benchmarking.
+'''
+import csv
+import os
+import random
+from .constants import MINIMUM_SPEED, MAXIMUM_SPEED
+
+GROUPS_PER_BLOCK = 3
+ROWS_PER_BLOCK = 50
+ROW_WIDTH = 4 * GROUPS_PER_BLOCK
+LOCATIONS = ["Rogers Ave & Midwood St", "Rogers Ave & Maple St", "Bedford Ave & Lincoln Rd"]
+DIRECTIONS = ["North", "South"]
+WEATHER = ["Sunny", "Cloudy", "Rain"]
+INVALID_SPEEDS = ["3", "bogus", "250", "2 5", ""]
+SESSION_MINUTES = 120
+
+
+def _padded(row):
+    '''Pads a row out to the full width of the sheet'''
+    return row + [""] * (ROW_WIDTH - len(row))
+
+
+def synthetic_speed(rng, speed_limit):
+    '''Returns a plausible whole number speed for a street with the given speed limit'''
+    speed = int(round(rng.gauss(speed_limit + 7, 6)))
+    return min(MAXIMUM_SPEED, max(MINIMUM_SPEED, speed))
+
+
+def synthetic_session(rng, index):
+    '''Returns the file header for the index'th synthetic session'''
+    return {
+        "name": "Synthetic Volunteer {}".format(index % 17),
+        "date": "{}/{}/2015".format(1 + index // 28 % 12, 1 + index % 28),
+        "location": LOCATIONS[index % len(LOCATIONS)],
+        "direction": DIRECTIONS[index // len(LOCATIONS) % len(DIRECTIONS)],
+        "weather": rng.choice(WEATHER),
+        "speed limit": str(rng.choice([25, 25, 25, 30])),
+    }
+
+
+def synthetic_entries(rng, vehicles, speed_limit, start_minute, invalid_rate):
+    '''
+    Returns a list of (time, speed) string pairs for one session in time order
+
+    The vehicles arrive at random over about SESSION_MINUTES minutes. Also returns
+    the number of entries that should be accepted as valid vehicles.
+    '''
+    entries = []
+    valid = 0
+    clock = float(start_minute)
+    for _ in xrange(vehicles):
+        clock += rng.expovariate(float(vehicles) / SESSION_MINUTES)
+        minute = min(int(clock), 24 * 60 - 1)
+        time_of_day = "{}:{:02}".format(minute // 60, minute % 60)
+        if rng.random() < invalid_rate:
+            entries.append((time_of_day, rng.choice(INVALID_SPEEDS)))
+        else:
+            entries.append((time_of_day, str(synthetic_speed(rng, speed_limit))))
+            valid += 1
+    return entries, valid
+
+
+def write_session(csv_writer, header, entries):
+    '''Writes one session's header and entries in the spreadsheet export layout'''
+    csv_writer.writerow(_padded([]))
+    csv_writer.writerow(_padded(["", "Name[s]", header["name"]]))
+    csv_writer.writerow(_padded(["", "Date", header["date"]]))
+    csv_writer.writerow(_padded(["", "Location", header["location"]]))
+    csv_writer.writerow(_padded(["", "Direction", header["direction"]]))
+    csv_writer.writerow(_padded(["", "Weather", header["weather"]]))
+    csv_writer.writerow(_padded(["", "Speed Limit", header["speed limit"]]))
+    block_size = GROUPS_PER_BLOCK * ROWS_PER_BLOCK
+    for block_start in xrange(0, max(len(entries), 1), block_size):
+        block = entries[block_start:block_start + block_size]
+        csv_writer.writerow(_padded([]))
+        csv_writer.writerow(["", "Vehicle", "Time", "Speed"] * GROUPS_PER_BLOCK)
+        for row_idx in xrange(ROWS_PER_BLOCK):
+            row = []
+            for group in xrange(GROUPS_PER_BLOCK):
+                entry_idx = group * ROWS_PER_BLOCK + row_idx
+                time_of_day, speed = block[entry_idx] if entry_idx < len(block) else ("", "")
+                row += ["", str(row_idx + 1), time_of_day, speed]
+            csv_writer.writerow(row)
+
+
+def generate_study(output_dir, files=10, vehicles=1000, seed=0, invalid_rate=0.01):
+    '''
+    Writes a synthetic study with the given number of vehicle entries spread across files
+
+    Returns the number of valid vehicles written.
+    '''
+    rng = random.Random(seed)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    valid = 0
+    for index in xrange(files):
+        header = synthetic_session(rng, index)
+        file_vehicles = vehicles // files + (1 if index < vehicles % files else 0)
+        start_minute = rng.randint(6 * 60, 20 * 60 - SESSION_MINUTES)
+        entries, file_valid = synthetic_entries(
+            rng, file_vehicles, int(header["speed limit"]), start_minute, invalid_rate)
+        filename = os.path.join(output_dir, "Synthetic Speed Study - {:05}.csv".format(index))
+        with open(filename, 'wb') as study_file:
+            write_session(csv.writer(study_file), header, entries)
+        valid += file_valid
+    return valid
@@ -0,0 +1,116 @@
+'''Compact columnar storage for vehicle data'''
+from array import array
+from collections import defaultdict
+
+
+def _intern_header(file_header):
+    '''Returns a copy of a file header with its strings interned'''
+    return {intern(key): intern(value) if isinstance(value, str) else value
+            for key, value in file_header.iteritems()}
+
+
+class VehicleTable(object):
+    '''
+    Stores vehicles as columns of small integers rather than dictionaries
+
+    Each vehicle takes up a speed (whole mph), an epoch time in seconds, a minute of
+    the day and the index of its session. A session is the file header shared by every
+    vehicle read from one file, so it is stored once in the sessions list rather than
+    copied into every vehicle.
+
+    Iterating the table yields vehicle dictionaries like the ones extract_data_row
+    produces, for code that wants to look at one vehicle at a time.
+    '''
+
+    def __init__(self):
+        self.sessions = []
+        self.session_index = array('I')
+        self.speeds = array('B')
+        self.datetimes = array('l')
+        self.timeofdays = array('H')
+
+    @classmethod
+    def from_columns(cls, file_header, speeds, datetimes, timeofdays):
+        '''Returns a table of the vehicles from one file given its header and columns'''
+        table = cls()
+        session = table.add_session(file_header)
+        table.session_index = array('I', [session]) * len(speeds)
+        table.speeds = speeds
+        table.datetimes = datetimes
+        table.timeofdays = timeofdays
+        return table
+
+    def add_session(self, file_header):
+        '''Adds the header for a file and returns its session index'''
+        self.sessions.append(_intern_header(file_header))
+        return len(self.sessions) - 1
+
+    def append(self, session, vehicle):
+        '''Adds a vehicle dictionary read from the given session'''
+        self.add(session, int(vehicle["speed"]), vehicle["datetime"], vehicle["timeofday"])
+
+    def add(self, session, speed, datetime, timeofday):
+        '''Adds a vehicle read from the given session given its whole mph speed and times'''
+        self.session_index.append(session)
+        self.speeds.append(speed)
+        self.datetimes.append(datetime)
+        self.timeofdays.append(timeofday)
+
+    def add_columns(self, session, speeds, datetimes, timeofdays):
+        '''Adds columns of vehicles read from the given session, as arrays of the table's typecodes'''
+        self.session_index.extend(array('I', [session]) * len(speeds))
+        self.speeds.extend(speeds)
+        self.datetimes.extend(datetimes)
+        self.timeofdays.extend(timeofdays)
+
+    def extend(self, other):
+        '''Adds all the sessions and vehicles in another table to this one'''
+        offset = len(self.sessions)
+        self.sessions.extend(other.sessions)
+        self.session_index.extend(array('I', [session + offset for session in other.session_index]))
+        self.speeds.extend(other.speeds)
+        self.datetimes.extend(other.datetimes)
+        self.timeofdays.extend(other.timeofdays)
+
+    def take(self, indices):
+        '''Returns a new table with just the vehicles at the given indices, sharing our sessions'''
+        table = VehicleTable()
+        table.sessions = self.sessions
+        table.session_index = array('I', [self.session_index[idx] for idx in indices])
+        table.speeds = array('B', [self.speeds[idx] for idx in indices])
+        table.datetimes = array('l', [self.datetimes[idx] for idx in indices])
+        table.timeofdays = array('H', [self.timeofdays[idx] for idx in indices])
+        return table
+
+    def partition(self, keys):
+        '''
+        Returns a dictionary of tables, one for each combination of the values of the
+        given file header keys, keyed by the tuple of those values
+        '''
+        session_keys = [tuple(session[key] for key in keys) for session in self.sessions]
+        indices = defaultdict(list)
+        for idx, session in enumerate(self.session_index):
+            indices[session_keys[session]].append(idx)
+        return {key: self.take(partition_indices) for key, partition_indices in indices.iteritems()}
+
+    def header(self, idx):
+        '''Returns the file header of the vehicle at idx'''
+        return self.sessions[self.session_index[idx]]
+
+    def speed_limit(self, idx):
+        '''Returns the speed limit where the vehicle at idx was recorded'''
+        return float(self.header(idx)["speed limit"])
+
+    def __len__(self):
+        return len(self.speeds)
+
+    def __getitem__(self, idx):
+        vehicle = dict(self.header(idx))
+        vehicle["speed"] = self.speeds[idx]
+        vehicle["datetime"] = self.datetimes[idx]
+        vehicle["timeofday"] = self.timeofdays[idx]
+        return vehicle
+
+    def __iter__(self):
+        for idx in xrange(len(self)):
+            yield self[idx]
@@ -0,0 +1,133 @@
+'''
+Watching a directory for new speed study sheets
+
+During a study volunteers keep adding exported sheets to a directory. Rather than
+reading everything again each time, IncrementalStatistics keeps a speed histogram
+per file for each step of time, and sums of them across files. A new or modified
+file is parsed on its own and added, and a modified or deleted file's histograms
+are subtracted, so a refresh costs time proportional to the files that changed.
+'''
+import logging
+import time
+from collections import OrderedDict
+from .analyse_data import statistics_step, step_statistics
+from .dataset import source_info
+from .histogram import SpeedHistogram
+from .parse_input import list_data_directory, read_counted_table_file
+from .rejects import RejectSink
+
+DEFAULT_POLL_INTERVAL = 5.0
+
+
+class DirectoryWatcher(object):
+    '''Tells which files in a directory were added, modified or deleted since it last looked'''
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.sources = {}
+
+    def poll(self):
+        '''Returns the sorted filenames that are new or modified and those that were deleted'''
+        sources = {filename: source_info(filename) for filename in list_data_directory(self.data_dir)}
+        changed = sorted(filename for filename, source in sources.iteritems()
+                         if self.sources.get(filename) != source)
+        deleted = sorted(set(self.sources) - set(sources))
+        self.sources = sources
+        return changed, deleted
+
+    def forget(self, filename):
+        '''Forgets a file so that the next poll reports it as changed'''
+        self.sources.pop(filename, None)
+
+
+class IncrementalStatistics(object):
+    '''
+    Statistics for block_duration long buckets that files can be added to and retracted from
+
+    The statistics always match compute_statistics(bucket_data(...)) for the vehicles
+    of every file currently added, read in sorted filename order.
+    '''
+
+    def __init__(self, block_duration):
+        self.block_duration = block_duration
+        self.step = statistics_step(block_duration)
+        # filename -> (speed limit, {step key: SpeedHistogram})
+        self.files = {}
+        # step key -> SpeedHistogram of every file, and the files with vehicles in the step
+        self.steps = {}
+        self.step_files = {}
+
+    def add_file(self, filename, table):
+        '''Adds the vehicles read from a file into a VehicleTable, replacing any added before'''
+        self.remove_file(filename)
+        histograms = {}
+        for speed, data_time in zip(table.speeds, table.datetimes):
+            key = data_time // self.step
+            if key not in histograms:
+                histograms[key] = SpeedHistogram()
+            histograms[key].add(speed)
+        self.files[filename] = (table.speed_limit(0) if table else None, histograms)
+        for key, histogram in histograms.iteritems():
+            if key in self.steps:
+                self.steps[key] += histogram
+            else:
+                self.steps[key] = histogram.copy()
+            self.step_files.setdefault(key, set()).add(filename)
+
+    def remove_file(self, filename):
+        '''Retracts the vehicles of a file, if it was added'''
+        if filename not in self.files:
+            return
+        _, histograms = self.files.pop(filename)
+        for key, histogram in histograms.iteritems():
+            self.steps[key] -= histogram
+            self.step_files[key].discard(filename)
+            if not self.step_files[key]:
+                del self.steps[key]
+                del self.step_files[key]
+
+    def statistics(self):
+        '''Returns the statistics of every file currently added'''
+        # Each step takes its speed limit from the first file with vehicles in it, and the
+        # steps are ordered as if they had been seen reading the files in filename order
+        first_files = {key: min(filenames) for key, filenames in self.step_files.iteritems()}
+        steps = OrderedDict(
+            (key, (self.files[first_files[key]][0], self.steps[key]))
+            for key in sorted(self.steps, key=lambda key: (first_files[key], key)))
+        return step_statistics(steps, self.step, self.block_duration)
+
+
+def watch_statistics(data_dir, block_duration, rejects=None, poll_interval=DEFAULT_POLL_INTERVAL,
+                     metadata=None):
+    '''
+    Yields the statistics for the vehicles in a directory, and again every time the directory changes
+
+    The directory is checked every poll_interval seconds. A file that can't be read,
+    e.g. because it is still being written, is logged and tried again on the next check.
+    The metadata is passed to read_table_file for files without file headers.
+    '''
+    rejects = rejects if rejects is not None else RejectSink()
+    watcher = DirectoryWatcher(data_dir)
+    incremental = IncrementalStatistics(block_duration)
+    updated = True
+    while True:
+        changed, deleted = watcher.poll()
+        for filename in deleted:
+            incremental.remove_file(filename)
+            updated = True
+        for filename in changed:
+            try:
+                table, _, rejected = read_counted_table_file(filename, metadata)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Exception reading %s, it will be read again on the next check", filename)
+                incremental.remove_file(filename)
+                watcher.forget(filename)
+                continue
+            rejects.report(rejected)
+            incremental.add_file(filename, table)
+            updated = True
+        if updated:
+            logging.info("%s: %d files changed, %d deleted", data_dir, len(changed), len(deleted))
+            yield incremental.statistics()
+        updated = False
+        time.sleep(poll_interval)